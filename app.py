@@ -3,9 +3,12 @@
 ThinkHelper Brain v2
 - 실시간(on-type) 학습 + 즉시 추천
 - 전역/문서별 수락 카운트(강화학습) + 시간감쇠
-- 문서별 TF(빈도) 기반 컨텍스트 가중
+- 문서별 TF(빈도) + 전역 DF(IDF, BM25) 기반 컨텍스트 가중
 - 사용자 사전(user_dict) 동기화 + 기본 사전(seed) 결합
-- JSON 영속화 (스키마 변화에 대비한 안전 로드)
+- 2/3-gram 다음 단어 예측 (앞 단어 문맥, 빈 접두사 추천)
+- JSON 영속화 (스키마 변화에 대비한 안전 로드) + mmap 이진 스냅샷으로 파싱 없는 시작
+- 사용자별 브레인(BrainManager) + HTTP API(/observe, /suggest, /accept)
+- 다중 프로세스(gunicorn) 공유 모드: 쓰기는 허브 한 곳, 추천은 mmap 뷰 이미지 (BRAIN_SHARED=1)
 """
 
 import re
@@ -13,233 +16,4359 @@ import time
 import json
 import math
 import os
-from collections import Counter
-from typing import List, Dict, Optional
+import heapq
+import atexit
+import threading
+import sqlite3
+import hashlib
+import asyncio
+import random
+import tempfile
+import pathlib
+import codecs
+import functools
+import itertools
+import gzip
+import mmap
+import stat
+import struct
+import zlib
+from array import array
+from concurrent.futures import ProcessPoolExecutor
+from bisect import bisect_left
+from collections import Counter, OrderedDict, deque
+from collections.abc import MutableMapping
+from contextlib import asynccontextmanager, contextmanager
+from multiprocessing.connection import Client, Listener
+from operator import itemgetter
+from typing import List, Dict, Iterator, Optional, Tuple
+
+from fastapi import FastAPI, Header, HTTPException, Query, WebSocket, WebSocketDisconnect
+from fastapi.responses import JSONResponse
+from pydantic import BaseModel, Field, ValidationError
+
+try:  # 선택 의존성: 후보 일괄 점수 계산 (없으면 파이썬 루프로)
+    import numpy as np
+except ImportError:
+    np = None
+
+try:  # 선택 의존성: 빠른 JSON 직렬화/파싱 (없으면 표준 json)
+    import orjson
+except ImportError:
+    orjson = None
+
+try:  # 선택 의존성: 스냅샷 zstd 압축
+    import zstandard
+except ImportError:
+    zstandard = None
+
+try:  # POSIX 전용: 공유 모드의 허브 선출 (파일 잠금)
+    import fcntl
+except ImportError:
+    fcntl = None
 
 
 def now_ms() -> int:
     return int(time.time() * 1000)
 
 
-def days_since(ts_ms: Optional[int]) -> float:
-    if not ts_ms:
-        return 9999.0
-    # 현재(ms) - 과거(ms) -> 일수
-    return max(0.0, (now_ms() - ts_ms) / (1000.0 * 60 * 60 * 24))
+# 로그 공간 수락 점수의 기준 시각 (2024-01-01 UTC) — 값 크기를 작게 유지하려는 것뿐, 바꿔도 순서는 같다
+DECAY_EPOCH_MS = 1_704_067_200_000
+
+
+def days_since(ts_ms: Optional[int], now: Optional[int] = None) -> float:
+    if not ts_ms:
+        return 9999.0
+    # 현재(ms) - 과거(ms) -> 일수
+    return max(0.0, ((now or now_ms()) - ts_ms) / (1000.0 * 60 * 60 * 24))
+
+
+# 토큰을 이루는 문자(한글 음절 + 영문 + 하이픈). 이 문자들의 연속 구간 밖으로는 토큰이 걸치지 않는다.
+_TOKEN_CHAR = re.compile(r"[가-힣A-Za-z\-]")
+# 한글/영어 토큰을 한 번에 훑는 정규식 (캡처 그룹 없음 — 언어는 첫 글자로 구분: 한글 >= "가")
+_TOKEN_RE = re.compile(r"[가-힣]{2,}|[A-Za-z][A-Za-z\-]{2,}")
+
+
+def iter_text_chunks(source, chunk_size: int = 1 << 16) -> Iterator[str]:
+    """
+    str / 파일 객체(.read, 텍스트·바이너리 UTF-8) / 문자열 iterable 을
+    토큰 경계에서 끊은 조각으로 차례대로 내보낸다.
+    - 조각 끝에 걸린 토큰 문자 구간은 다음 조각 앞에 붙여서 토큰이 잘리지 않게 한다
+    - 한 번에 chunk_size 글자 남짓만 메모리에 둔다 (책 한 권 분량도 일정한 메모리)
+    """
+    if source is None:
+        return
+    if isinstance(source, str):
+        text = source
+        source = (text[i:i + chunk_size] for i in range(0, len(text), chunk_size))
+    elif hasattr(source, "read"):
+        reader = source.read
+        source = iter(lambda: reader(chunk_size) or "", "")
+    decoder = None
+    carry = ""
+    for chunk in source:
+        if isinstance(chunk, (bytes, bytearray)):
+            # 멀티바이트 글자가 청크 경계에서 잘려도 안전하게 이어서 디코드
+            decoder = decoder or codecs.getincrementaldecoder("utf-8")("replace")
+            chunk = decoder.decode(chunk)
+        if not chunk:
+            continue
+        buf = carry + chunk if carry else chunk
+        cut = len(buf)
+        while cut > 0 and _TOKEN_CHAR.match(buf, cut - 1):
+            cut -= 1
+        carry = buf[cut:]
+        if cut:
+            yield buf[:cut]
+    if decoder is not None:
+        carry += decoder.decode(b"", final=True)
+    if carry:
+        yield carry
+
+
+# ------------------ Hangul ------------------
+# 한글 음절 → 호환 자모 분해 (겹모음/겹받침은 낱자로 쪼갠다: 입력 중간 상태가 완성형의 접두사가 되도록)
+#   예) 장(ㅈㅏㅇ) ⊂ 자율(ㅈㅏㅇㅠㄹ), 고(ㄱㅗ) ⊂ 과(ㄱㅗㅏ), 닭(ㄷㅏㄹㄱ) ⊂ 달기(ㄷㅏㄹㄱㅣ)
+
+_CHO = "ㄱㄲㄴㄷㄸㄹㅁㅂㅃㅅㅆㅇㅈㅉㅊㅋㅌㅍㅎ"
+_JUNG = (
+    "ㅏ", "ㅐ", "ㅑ", "ㅒ", "ㅓ", "ㅔ", "ㅕ", "ㅖ", "ㅗ", "ㅗㅏ", "ㅗㅐ",
+    "ㅗㅣ", "ㅛ", "ㅜ", "ㅜㅓ", "ㅜㅔ", "ㅜㅣ", "ㅠ", "ㅡ", "ㅡㅣ", "ㅣ",
+)
+_JONG = (
+    "", "ㄱ", "ㄲ", "ㄱㅅ", "ㄴ", "ㄴㅈ", "ㄴㅎ", "ㄷ", "ㄹ", "ㄹㄱ", "ㄹㅁ", "ㄹㅂ", "ㄹㅅ", "ㄹㅌ",
+    "ㄹㅍ", "ㄹㅎ", "ㅁ", "ㅂ", "ㅂㅅ", "ㅅ", "ㅆ", "ㅇ", "ㅈ", "ㅊ", "ㅋ", "ㅌ", "ㅍ", "ㅎ",
+)
+# 직접 입력된 겹자모도 같은 낱자열로
+_COMPOUND_JAMO = {
+    "ㄳ": "ㄱㅅ", "ㄵ": "ㄴㅈ", "ㄶ": "ㄴㅎ", "ㄺ": "ㄹㄱ", "ㄻ": "ㄹㅁ", "ㄼ": "ㄹㅂ", "ㄽ": "ㄹㅅ",
+    "ㄾ": "ㄹㅌ", "ㄿ": "ㄹㅍ", "ㅀ": "ㄹㅎ", "ㅄ": "ㅂㅅ", "ㅘ": "ㅗㅏ", "ㅙ": "ㅗㅐ", "ㅚ": "ㅗㅣ",
+    "ㅝ": "ㅜㅓ", "ㅞ": "ㅜㅔ", "ㅟ": "ㅜㅣ", "ㅢ": "ㅡㅣ",
+}
+_HANGUL_RE = re.compile(r"[가-힣ㄱ-ㅣ]")
+_CHOSEONG_QUERY = re.compile(r"[ㄱ-ㅎ]+")
+
+
+@functools.lru_cache(maxsize=65536)
+def hangul_key(text: str) -> str:
+    """자모 분해 키 (한글 외 문자는 소문자화해서 그대로)."""
+    out = []
+    for ch in text:
+        code = ord(ch) - 0xAC00
+        if 0 <= code < 11172:
+            out.append(_CHO[code // 588])
+            out.append(_JUNG[(code % 588) // 28])
+            out.append(_JONG[code % 28])
+        else:
+            out.append(_COMPOUND_JAMO.get(ch) or ch.lower())
+    return "".join(out)
+
+
+@functools.lru_cache(maxsize=65536)
+def choseong_key(text: str) -> str:
+    """초성 키: 자율주행 → ㅈㅇㅈㅎ."""
+    out = []
+    for ch in text:
+        code = ord(ch) - 0xAC00
+        out.append(_CHO[code // 588] if 0 <= code < 11172 else ch.lower())
+    return "".join(out)
+
+
+# ------------------ Prefix Index ------------------
+
+class _TrieNode:
+    __slots__ = ("children", "words", "best", "gen")
+
+    def __init__(self, gen: int = 0):
+        self.children: Dict[str, "_TrieNode"] = {}
+        self.words: Optional[List[str]] = None  # 이 노드에서 끝나는 원형 단어들
+        self.best = -math.inf  # 하위 트리 (로그 공간) 점수 상한 (가지치기용, 단조 증가)
+        self.gen = gen  # 만들어진 세대 — 현재 세대가 아니면 스냅샷과 공유 중이라 고치기 전에 복사
+
+
+class PrefixTrie:
+    """
+    키 함수(기본: 소문자화) 기준 접두사 색인. 한글은 hangul_key/choseong_key 로 만든다.
+    - add/remove: O(len(key))  — 키는 넣을 때 한 번만 계산
+    - iter_prefix: O(len(prefix) + 매칭 수)
+    - 각 노드는 하위 단어 점수의 상한(best)을 들고 있어 top-K 탐색시 가지치기 가능
+    - snapshot(): O(1) 읽기 전용 사본. 이후 변경은 경로 복사(path copying)라 사본에는 보이지 않는다
+    """
+
+    def __init__(self, key=str.lower):
+        self.root = _TrieNode()
+        self._size = 0
+        self.key = key
+        self._gen = 0
+        self._snap: Optional["PrefixTrie"] = None
+
+    def __len__(self) -> int:
+        return self._size
+
+    def __contains__(self, word: str) -> bool:
+        node = self._find(self.key(word))
+        return bool(node and node.words and word in node.words)
+
+    def _find(self, key: str) -> Optional[_TrieNode]:
+        node = self.root
+        for ch in key:
+            node = node.children.get(ch)
+            if node is None:
+                return None
+        return node
+
+    def _own(self, node: _TrieNode) -> _TrieNode:
+        # 스냅샷과 공유 중인 노드는 복사본을 돌려준다 (부모 연결은 호출한 쪽이)
+        if node.gen == self._gen:
+            return node
+        new = _TrieNode(self._gen)
+        new.children = dict(node.children)
+        new.words = list(node.words) if node.words else None
+        new.best = node.best
+        return new
+
+    def _own_path(self, key: str) -> Optional[List[_TrieNode]]:
+        # 루트부터 key 끝까지 노드를 현재 세대로 복사해 이어 붙인다 (경로가 없으면 None, 아무것도 안 바꿈)
+        if self._find(key) is None:
+            return None
+        self._snap = None
+        node = self.root = self._own(self.root)
+        path = [node]
+        for ch in key:
+            nxt = node.children[ch] = self._own(node.children[ch])
+            node = nxt
+            path.append(node)
+        return path
+
+    def snapshot(self) -> "PrefixTrie":
+        """지금 상태의 읽기 전용 사본 (O(1)). 변경이 없었으면 직전 사본을 그대로 돌려준다."""
+        if self._snap is None:
+            snap = PrefixTrie(self.key)
+            snap.root, snap._size = self.root, self._size
+            self._snap = snap
+            self._gen += 1
+        return self._snap
+
+    def add(self, word: str, bound: float = -math.inf) -> bool:
+        self._snap = None
+        node = self.root = self._own(self.root)
+        if bound > node.best:
+            node.best = bound
+        for ch in self.key(word):
+            nxt = node.children.get(ch)
+            node.children[ch] = nxt = _TrieNode(self._gen) if nxt is None else self._own(nxt)
+            node = nxt
+            if bound > node.best:
+                node.best = bound
+        if node.words is None:
+            node.words = []
+        elif word in node.words:
+            return False
+        node.words.append(word)
+        self._size += 1
+        return True
+
+    def remove(self, word: str) -> bool:
+        key = self.key(word)
+        node = self._find(key)
+        if node is None or not node.words or word not in node.words:
+            return False
+        path = self._own_path(key)
+        node = path[-1]
+        node.words.remove(word)
+        if not node.words:
+            node.words = None
+        self._size -= 1
+        # 빈 가지 정리
+        for i in range(len(key), 0, -1):
+            n = path[i]
+            if n.words or n.children:
+                break
+            del path[i - 1].children[key[i - 1]]
+        return True
+
+    def raise_bound(self, word: str, bound: float) -> None:
+        """단어 점수 상한이 올라가면 경로상의 best를 갱신 (삭제시엔 낮추지 않음 — 상한이므로 안전)."""
+        key = self.key(word)
+        leaf = self._find(key)
+        # 상한은 위로 갈수록 크거나 같으니 끝 노드가 이미 넉넉하면 경로 전체가 그렇다
+        if leaf is None or leaf.best >= bound:
+            return
+        for node in self._own_path(key):
+            if bound > node.best:
+                node.best = bound
+
+    def iter_prefix(self, prefix: str):
+        node = self._find(self.key(prefix))
+        if node is None:
+            return
+        stack = [node]
+        while stack:
+            n = stack.pop()
+            if n.words:
+                yield from n.words
+            stack.extend(n.children.values())
+
+
+def _fuzzy_prefix_nodes(
+    trie: PrefixTrie, query: str, max_edits: int, anchor: int = 0, budget: int = 50_000
+) -> Tuple[Dict[_TrieNode, int], Dict[int, List[Tuple[_TrieNode, str]]]]:
+    """
+    트라이를 편집 거리 DP 행(Levenshtein + 인접 전치)과 함께 내려가며
+    경로 문자열과 query 의 거리가 max_edits 이하인 노드를 찾는다.
+    - dist: 노드 → 거리 (그 노드 아래 단어는 모두 '접두사 거리' <= dist)
+    - starts: 거리 d → [(노드, 키)] — 조상 중 d 이하로 맞은 노드가 없는 가장 위 노드들
+    - anchor: 앞 몇 글자는 정확히 맞아야 함 (Elasticsearch fuzzy 의 prefix_length) — 탐색 범위를
+      그 글자로 시작하는 가지로 좁힌다 (첫 글자 오타는 드물다)
+    DP 는 대각선 ±max_edits 띠만 계산하고 max_edits + 1 에서 포화시킨다.
+    행의 최솟값은 내려갈수록 줄지 않으므로, 최솟값이 이미 찾은 거리보다 작지 않으면 가지를 닫는다.
+    """
+    dist: Dict[_TrieNode, int] = {}
+    starts: Dict[int, List[Tuple[_TrieNode, str]]] = {}
+    root = trie._find(query[:anchor])
+    if root is None:
+        return dist, starts
+    base, query = query[:anchor], query[anchor:]
+    m, k = len(query), max_edits
+    cap = k + 1
+    first = [min(j, cap) for j in range(m + 1)]
+    # (노드, 키, 현재 행, 이전 행, 마지막 글자, 조상 최소 거리)
+    stack = [(root, base, first, None, "", cap)]
+    visited = 0
+    while stack and visited < budget:
+        node, key, row, prow, last, covered = stack.pop()
+        i = len(key) - anchor + 1
+        lo, hi = max(1, i - k), min(m, i + k)
+        for ch, child in node.children.items():
+            visited += 1
+            cur = [cap] * (m + 1)
+            cur[0] = min(i, cap)
+            low = cur[0]
+            for j in range(lo, hi + 1):
+                v = row[j - 1] if query[j - 1] == ch else row[j - 1] + 1
+                if row[j] + 1 < v:
+                    v = row[j] + 1
+                if cur[j - 1] + 1 < v:
+                    v = cur[j - 1] + 1
+                if prow is not None and j > 1 and query[j - 1] == last and query[j - 2] == ch \
+                        and prow[j - 2] + 1 < v:
+                    v = prow[j - 2] + 1
+                if v > cap:
+                    v = cap
+                cur[j] = v
+                if v < low:
+                    low = v
+            d = cur[m]
+            best = covered
+            if d <= k and d < covered:
+                dist[child] = d
+                starts.setdefault(d, []).append((child, key + ch))
+                best = d
+            if low < best:
+                stack.append((child, key + ch, cur, row, ch, best))
+    return dist, starts
+
+
+def _path_distance(trie: PrefixTrie, key: str, dist: Dict[_TrieNode, int]) -> Optional[int]:
+    # 단어 경로상에서 맞은 노드들의 최소 거리 (없으면 None)
+    node, best = trie.root, None
+    for ch in key:
+        node = node.children.get(ch)
+        if node is None:
+            break
+        d = dist.get(node)
+        if d is not None and (best is None or d < best):
+            best = d
+    return best
+
+
+# 색인 이름 → 키 함수 (한국어는 자모 분해 키 + 초성 키 두 벌)
+_TRIE_KEYS = {"ko": hangul_key, "ko_cho": choseong_key, "en": str.lower}
+
+
+# ------------------ N-gram Model ------------------
+
+_M64 = (1 << 64) - 1
+
+
+def _mix64(x: int) -> int:
+    # 정수 섞기 (splitmix64 마무리 단계) — hash() 와 달리 프로세스마다 같은 값
+    x = ((x ^ (x >> 30)) * 0xBF58476D1CE4E5B9) & _M64
+    x = ((x ^ (x >> 27)) * 0x94D049BB133111EB) & _M64
+    return x ^ (x >> 31)
+
+
+class NgramTable:
+    """
+    2-gram/3-gram 카운트 표 (배열 기반 open addressing, 중첩 dict 없음).
+    - 단어는 정수 ID 로 인턴. 문맥 키 = (앞앞 ID+1) << 32 | (앞 ID+1)  (2-gram 은 앞앞 = 0)
+    - 항목 배열: 문맥 키 / 다음 단어 ID / 카운트 / 같은 문맥의 다음 항목 (연결 리스트)
+    - 문맥 배열: 문맥 키 / 첫 항목 / 합계 — 다음 단어 후보 나열과 확률 계산용
+    - 문맥 슬롯 위치는 _mix64 로 정해지므로 결정적 (재생/재시작해도, 다른 프로세스의 이미지 리더도 같은 표)
+      항목 슬롯은 메모리 안에서만 쓰므로 내장 hash((문맥 키, 단어 ID)) — 정수 튜플이라 역시 결정적
+    - 항목이 max_entries 를 넘으면 카운트 0 항목부터, 모자라면 낮은 카운트까지 잘라낸다
+    - view(): 잠금 없이 읽을 O(1) 사본. 덧붙이기만 하는 배열은 공유하고, 제자리에서 바뀌는
+      카운트/합계/첫 항목 배열은 다음 add 때 표 쪽이 복사해 간다 (재배치는 배열을 새로 만든다)
+    """
+
+    def __init__(self, max_entries: int = 200_000):
+        self.max_entries = max_entries
+        self.vocab: List[str] = []
+        self._ids: Dict[str, int] = {}
+        self._pruned: List[Tuple[Tuple[str, ...], str]] = []  # 저장소가 지울 (문맥, 단어)
+        self._reset(16)
+
+    def _reset(self, slots: int) -> None:
+        self.e_ctx = array("Q")
+        self.e_next = array("l")
+        self.e_count = array("l")
+        self.e_link = array("l")
+        self.c_key = array("Q")
+        self.c_head = array("l")
+        self.c_total = array("l")
+        self._e_slots = array("l", [-1]) * slots
+        self._c_slots = array("l", [-1]) * slots
+        self.live = 0  # 카운트 > 0 인 항목 수
+        self._shared = False  # view() 가 카운트 배열을 들고 있음
+
+    def __len__(self) -> int:
+        return self.live
+
+    # --- 키/슬롯 ---
+
+    def _ctx_key(self, ctx: Tuple[str, ...], create: bool) -> Optional[int]:
+        ids = []
+        for w in ctx[-2:]:
+            i = self._ids.get(w)
+            if i is None:
+                if not create:
+                    return None
+                i = self._ids[w] = len(self.vocab)
+                self.vocab.append(w)
+            ids.append(i + 1)
+        a, b = (0, ids[0]) if len(ids) == 1 else ids
+        return (a << 32) | b
+
+    def _ctx_slot(self, ck: int) -> int:
+        slots, mask = self._c_slots, len(self._c_slots) - 1
+        i = _mix64(ck) & mask
+        while True:
+            c = slots[i]
+            if c < 0 or self.c_key[c] == ck:
+                return i
+            i = (i + 1) & mask
+
+    def _entry_slot(self, ck: int, nid: int) -> int:
+        slots, mask = self._e_slots, len(self._e_slots) - 1
+        i = hash((ck, nid)) & mask
+        while True:
+            e = slots[i]
+            if e < 0 or (self.e_ctx[e] == ck and self.e_next[e] == nid):
+                return i
+            i = (i + 1) & mask
+
+    # --- 갱신/조회 ---
+
+    def count(self, ctx: Tuple[str, ...], word: str) -> int:
+        ck = self._ctx_key(ctx, False)
+        nid = self._ids.get(word)
+        if ck is None or nid is None:
+            return 0
+        e = self._e_slots[self._entry_slot(ck, nid)]
+        return self.e_count[e] if e >= 0 else 0
+
+    def add(self, ctx: Tuple[str, ...], word: str, delta: int) -> None:
+        """(문맥, 단어) 카운트에 delta 를 더한다 (0 밑으로는 내려가지 않음)."""
+        if ctx and delta:
+            self.add_many([[*ctx, word, delta]])
+
+    def add_many(self, rows) -> None:
+        """
+        [문맥 단어..., 다음 단어, 증감] 행들을 차례로 add (ng 레코드의 "d" 그대로).
+        슬롯 확보/사본 분리/가지치기는 묶음에 한 번씩 — 행마다는 키 조회와 탐사만 한다.
+        """
+        rows = [r for r in rows if len(r) > 2 and r[-1]]
+        if not rows:
+            return
+        grow = sum(1 for r in rows if r[-1] > 0)
+        if 2 * (len(self.e_ctx) + grow) > len(self._e_slots) or 2 * (len(self.c_key) + grow) > len(self._c_slots):
+            self._rebuild(0, grow)
+        if self._shared:
+            self._unshare()
+        ids, vocab = self._ids, self.vocab
+        e_ctx, e_next, e_count, e_link = self.e_ctx, self.e_next, self.e_count, self.e_link
+        c_key, c_head, c_total = self.c_key, self.c_head, self.c_total
+        e_slots, c_slots = self._e_slots, self._c_slots
+        e_mask = len(e_slots) - 1
+        ctx_of: Dict[int, int] = {}  # 문맥 키 → 문맥 번호 (이 묶음 안에서만)
+        live = self.live
+        get = ids.get
+
+        def intern(w: str) -> int:
+            i = ids[w] = len(vocab)
+            vocab.append(w)
+            return i
+
+        for row in rows:
+            *ctx, word, delta = row
+            create = delta > 0
+            # 문맥 키 (_ctx_key 를 풀어 쓴 것 — 앞 단어 둘까지)
+            if len(ctx) == 1:
+                b = get(ctx[0])
+                if b is None:
+                    if not create:
+                        continue
+                    b = intern(ctx[0])
+                ck = b + 1
+            else:
+                a, b = get(ctx[-2]), get(ctx[-1])
+                if a is None or b is None:
+                    if not create:
+                        continue
+                    if a is None:
+                        a = intern(ctx[-2])
+                    b = get(ctx[-1])
+                    if b is None:
+                        b = intern(ctx[-1])
+                ck = ((a + 1) << 32) | (b + 1)
+            nid = get(word)
+            if nid is None:
+                if not create:
+                    continue
+                nid = intern(word)
+            # 항목 슬롯 (_entry_slot 을 풀어 쓴 것)
+            es = hash((ck, nid)) & e_mask
+            e = e_slots[es]
+            while e >= 0 and (e_ctx[e] != ck or e_next[e] != nid):
+                es = (es + 1) & e_mask
+                e = e_slots[es]
+            if e < 0 and not create:
+                continue
+            c = ctx_of.get(ck)
+            if c is None:
+                cs = self._ctx_slot(ck)
+                c = c_slots[cs]
+                if c < 0:
+                    c = len(c_key)
+                    c_key.append(ck)
+                    c_head.append(-1)
+                    c_total.append(0)
+                    c_slots[cs] = c
+                ctx_of[ck] = c
+            if e < 0:
+                # 배열에 먼저 덧붙이고 슬롯은 마지막에 — 사본(view)이 슬롯을 따라가도 항목이 있다
+                e = len(e_ctx)
+                e_ctx.append(ck)
+                e_next.append(nid)
+                e_count.append(0)
+                e_link.append(c_head[c])
+                e_slots[es] = e
+                c_head[c] = e
+            old = e_count[e]
+            new = old + delta
+            if new < 0:
+                new = 0
+            e_count[e] = new
+            c_total[c] += new - old
+            live += (new > 0) - (old > 0)
+        self.live = live
+        if len(self.e_ctx) > self.max_entries:
+            self.prune()
+
+    def successors(self, ctx: Tuple[str, ...]) -> Tuple[List[Tuple[str, int]], int]:
+        """문맥 다음에 나온 (단어, 카운트) 목록과 문맥 합계."""
+        ck = self._ctx_key(ctx, False)
+        if ck is None:
+            return [], 0
+        c = self._c_slots[self._ctx_slot(ck)]
+        # 사본(view)에서는 공유 슬롯이 사본 이후에 생긴 문맥을 가리킬 수 있다
+        if c < 0 or c >= len(self.c_head):
+            return [], 0
+        out = []
+        e = self.c_head[c]
+        vocab, counts, nxt, link = self.vocab, self.e_count, self.e_next, self.e_link
+        while e >= 0:
+            if counts[e] > 0:
+                out.append((vocab[nxt[e]], counts[e]))
+            e = link[e]
+        return out, self.c_total[c]
+
+    def items(self):
+        """(문맥 단어들, 단어, 카운트) — 카운트 > 0 인 항목만."""
+        vocab = self.vocab
+        for e in range(len(self.e_ctx)):
+            cnt = self.e_count[e]
+            if cnt > 0:
+                yield self._ctx_words(self.e_ctx[e]), vocab[self.e_next[e]], cnt
+
+    def _ctx_words(self, ck: int) -> Tuple[str, ...]:
+        a, b = ck >> 32, ck & 0xFFFFFFFF
+        return (self.vocab[a - 1], self.vocab[b - 1]) if a else (self.vocab[b - 1],)
+
+    # --- 가지치기/재배치 ---
+
+    def prune(self) -> None:
+        # 카운트 0 항목을 먼저 버리고, 그래도 3/4 을 넘으면 낮은 카운트부터 올려 가며 잘라낸다
+        hist = Counter(self.e_count)
+        kept = len(self.e_count) - hist[0]
+        floor = 0
+        target = self.max_entries * 3 // 4
+        while kept > target:
+            floor += 1
+            kept -= hist[floor]
+        for e in range(len(self.e_ctx)):
+            if 0 < self.e_count[e] <= floor:
+                self._pruned.append((self._ctx_words(self.e_ctx[e]), self.vocab[self.e_next[e]]))
+        self._rebuild(floor)
+
+    def copy(self) -> "NgramTable":
+        out = NgramTable(self.max_entries)
+        out.vocab = list(self.vocab)
+        out._ids = dict(self._ids)
+        for name in ("e_ctx", "e_next", "e_count", "e_link", "c_key", "c_head", "c_total",
+                     "_e_slots", "_c_slots"):
+            setattr(out, name, getattr(self, name)[:])
+        out.live = self.live
+        return out
+
+    def view(self) -> "NgramTable":
+        """지금 상태의 읽기 전용 사본 (successors 용, O(1))."""
+        out = NgramTable.__new__(NgramTable)
+        out.__dict__.update(self.__dict__)
+        self._shared = True
+        return out
+
+    def _unshare(self) -> None:
+        # 사본이 보는 카운트/합계/첫 항목 배열을 두고 표 쪽이 새 배열로 옮겨 간다
+        self.e_count = self.e_count[:]
+        self.c_total = self.c_total[:]
+        self.c_head = self.c_head[:]
+        self._shared = False
+
+    def drain_pruned(self) -> List[Tuple[Tuple[str, ...], str]]:
+        out, self._pruned = self._pruned, []
+        return out
+
+    def _rebuild(self, floor: int, extra: int = 0) -> None:
+        # extra: 곧 더해질 항목 수만큼 슬롯을 미리 넉넉히
+        rows = [row for row in zip(self.e_ctx, self.e_next, self.e_count) if row[2] > floor]
+        size = 16
+        while size < 4 * max(len(rows) + extra, 1):
+            size *= 2
+        self._reset(size)
+        self.e_ctx.extend([r[0] for r in rows])
+        self.e_next.extend([r[1] for r in rows])
+        self.e_count.extend([r[2] for r in rows])
+        c_key, c_head, c_total, e_link = self.c_key, self.c_head, self.c_total, self.e_link
+        e_slots, c_slots = self._e_slots, self._c_slots
+        e_mask = len(e_slots) - 1
+        ctx_of: Dict[int, int] = {}
+        for e, (ck, nid, cnt) in enumerate(rows):
+            c = ctx_of.get(ck)
+            if c is None:
+                c = ctx_of[ck] = len(c_key)
+                c_slots[self._ctx_slot(ck)] = c
+                c_key.append(ck)
+                c_head.append(-1)
+                c_total.append(0)
+            # 항목은 서로 다르므로 빈 슬롯만 찾으면 된다
+            es = hash((ck, nid)) & e_mask
+            while e_slots[es] >= 0:
+                es = (es + 1) & e_mask
+            e_slots[es] = e
+            e_link.append(c_head[c])
+            c_head[c] = e
+            c_total[c] += cnt
+        self.live = len(rows)
+
+    # --- 직렬화 ---
+
+    def to_state(self) -> Dict:
+        # 살아 있는 항목이 쓰는 단어만 모아 ID 를 다시 매긴다 (항목 배열을 직접 훑는다)
+        src = self.vocab
+        vocab: List[str] = []
+        remap: Dict[int, int] = {}
+        rows = []
+        for ck, nid, cnt in zip(self.e_ctx, self.e_next, self.e_count):
+            if cnt <= 0:
+                continue
+            a, b = ck >> 32, ck & 0xFFFFFFFF
+            row = [a - 1, b - 1, nid, cnt] if a else [b - 1, nid, cnt]
+            for k in range(len(row) - 1):
+                j = remap.get(row[k])
+                if j is None:
+                    j = remap[row[k]] = len(vocab)
+                    vocab.append(src[row[k]])
+                row[k] = j
+            rows.append(row)
+        return {"vocab": vocab, "rows": rows}
+
+    @classmethod
+    def from_state(cls, state: Optional[Dict], max_entries: int = 200_000) -> "NgramTable":
+        # 항목 배열을 한 번에 채우고 슬롯은 _rebuild 로 한 번에 — 행마다 add() 하지 않는다
+        # (to_state 는 (문맥, 단어) 를 한 번씩만 쓰므로 합칠 항목이 없다)
+        table = cls(max_entries)
+        if not isinstance(state, dict):
+            return table
+        remap = []
+        for w in state.get("vocab", []):
+            i = table._ids.get(w)
+            if i is None:
+                i = table._ids[w] = len(table.vocab)
+                table.vocab.append(w)
+            remap.append(i)
+        e_ctx, e_next, e_count = table.e_ctx, table.e_next, table.e_count
+        for row in state.get("rows", []):
+            cnt = row[-1]
+            if cnt <= 0:
+                continue
+            ck = remap[row[-3]] + 1
+            if len(row) > 3:
+                ck |= (remap[row[-4]] + 1) << 32
+            e_ctx.append(ck)
+            e_next.append(remap[row[-2]])
+            e_count.append(cnt)
+        table._rebuild(0)
+        if len(table.e_ctx) > max_entries:
+            table.prune()
+        return table
+
+
+def ngram_counts(tokens: List[str]) -> Counter:
+    """토큰 열의 2-gram/3-gram 개수: 키는 (앞, 다음) / (앞앞, 앞, 다음) 튜플."""
+    grams: Counter = Counter()
+    for i in range(1, len(tokens)):
+        grams[tokens[i - 1], tokens[i]] += 1
+        if i >= 2:
+            grams[tokens[i - 2], tokens[i - 1], tokens[i]] += 1
+    return grams
+
+
+# ------------------ Vocabulary ------------------
+# 단어 문자열은 Vocab 에 한 번만 두고, 카운트/시각은 단어 ID 로 색인한 배열에 담는다.
+# 아래 두 구조는 dict 와 같은 인터페이스(get/[]/in/iter/items)라 기존 코드와 저장 포맷은 그대로다.
+
+class Vocab:
+    """단어 ↔ 정수 ID 인턴 표. 한 메모리의 카운트 구조들이 공유한다 (ID 는 재사용하지 않음)."""
+
+    __slots__ = ("words", "ids")
+
+    def __init__(self):
+        self.words: List[str] = []
+        self.ids: Dict[str, int] = {}
+
+    def __len__(self) -> int:
+        return len(self.words)
+
+    def intern(self, word: str) -> int:
+        i = self.ids.get(word)
+        if i is None:
+            i = self.ids[word] = len(self.words)
+            self.words.append(word)
+        return i
+
+    def get(self, word: str) -> Optional[int]:
+        return self.ids.get(word)
+
+
+class WordColumn(MutableMapping):
+    """
+    전역 {단어: 정수} — 단어 ID 로 색인한 array('q') 한 줄 (0 = 없음).
+    항목당 8바이트 (dict 는 항목당 ~100바이트 + 키 문자열).
+    """
+
+    __slots__ = ("vocab", "data", "_n")
+
+    def __init__(self, vocab: Vocab, items=()):
+        self.vocab = vocab
+        self.data = array("q")
+        self._n = 0
+        for w, v in items:
+            self[w] = v
+
+    def get(self, word, default=None):
+        i = self.vocab.get(word)
+        if i is None or i >= len(self.data):
+            return default
+        return self.data[i] or default
+
+    def __getitem__(self, word):
+        v = self.get(word)
+        if v is None:
+            raise KeyError(word)
+        return v
+
+    def __contains__(self, word) -> bool:
+        return self.get(word) is not None
+
+    def __setitem__(self, word, value) -> None:
+        i = self.vocab.intern(word)
+        data = self.data
+        if i >= len(data):
+            data.frombytes(bytes(8 * (len(self.vocab) - len(data))))
+        self._n += bool(value) - bool(data[i])
+        data[i] = value
+
+    def __delitem__(self, word) -> None:
+        if word not in self:
+            raise KeyError(word)
+        self[word] = 0
+
+    def add_many(self, words, delta: int) -> None:
+        """각 단어 값에 delta 를 더한다 (0 이하가 되면 항목 삭제)."""
+        ids = [self.vocab.intern(w) for w in words]
+        data = self.data
+        if len(data) < len(self.vocab):
+            data.frombytes(bytes(8 * (len(self.vocab) - len(data))))
+        n = self._n
+        for i in ids:
+            old = data[i]
+            new = old + delta
+            if new <= 0:
+                new = 0
+                n -= bool(old)
+            elif not old:
+                n += 1
+            data[i] = new
+        self._n = n
+
+    def add_counts(self, counts: Dict[str, int]) -> None:
+        """단어마다 다른 증감 {단어: delta} 을 한 번에 더한다 (0 이하가 되면 항목 삭제)."""
+        intern = self.vocab.intern
+        pairs = [(intern(w), d) for w, d in counts.items()]
+        data = self.data
+        if len(data) < len(self.vocab):
+            data.frombytes(bytes(8 * (len(self.vocab) - len(data))))
+        n = self._n
+        for i, d in pairs:
+            old = data[i]
+            new = old + d
+            if new <= 0:
+                new = 0
+                n -= bool(old)
+            elif not old:
+                n += 1
+            data[i] = new
+        self._n = n
+
+    def __iter__(self):
+        words = self.vocab.words
+        for i, v in enumerate(self.data):
+            if v:
+                yield words[i]
+
+    def __len__(self) -> int:
+        return self._n
+
+    def items(self):
+        words = self.vocab.words
+        return [(words[i], v) for i, v in enumerate(self.data) if v]
+
+    def copy(self) -> "WordColumn":
+        # 배열만 복사 (Vocab 은 덧붙이기만 하므로 공유해도 된다)
+        out = WordColumn(self.vocab)
+        out.data = self.data[:]
+        out._n = self._n
+        return out
+
+    def __repr__(self) -> str:
+        return f"WordColumn({dict(self.items())})"
+
+
+class SparseCounts(MutableMapping):
+    """
+    문서별 {단어: 값} — ID 오름차순 희소 배열 (ids, vals) 한 쌍. 항목당 8~12바이트.
+    배열은 한 번 만들면 고치지 않는다: 값만 바뀌어도 새 배열을 만들어 (ids, vals) 를 한 번에 바꿔 끼운다.
+    그래서 copy() 는 O(1) 이고, 잠금 없이 읽는 쪽이 집어 간 사본은 이후 쓰기와 무관하게 그대로다.
+    """
+
+    __slots__ = ("vocab", "_cols", "_total")
+
+    def __init__(self, vocab: Vocab, items=(), typecode: str = "I"):
+        self.vocab = vocab
+        self._cols = (array("I"), array(typecode))
+        self._total = None  # (그때의 _cols, 값 합계) — 문서 길이 캐시
+        if items:
+            self.update_many(items)
+
+    def get(self, word, default=None):
+        i = self.vocab.get(word)
+        if i is None:
+            return default
+        ids, vals = self._cols
+        k = bisect_left(ids, i)
+        return vals[k] if k < len(ids) and ids[k] == i else default
+
+    def __getitem__(self, word):
+        v = self.get(word)
+        if v is None:
+            raise KeyError(word)
+        return v
+
+    def __contains__(self, word) -> bool:
+        return self.get(word) is not None
+
+    def __setitem__(self, word, value) -> None:
+        i = self.vocab.intern(word)
+        ids, vals = self._cols
+        k = bisect_left(ids, i)
+        vals = vals[:]
+        if k < len(ids) and ids[k] == i:
+            vals[k] = value
+        else:
+            ids = ids[:]
+            ids.insert(k, i)
+            vals.insert(k, value)
+        self._cols = (ids, vals)
+
+    def __delitem__(self, word) -> None:
+        i = self.vocab.get(word)
+        ids, vals = self._cols
+        k = bisect_left(ids, i) if i is not None else len(ids)
+        if k >= len(ids) or ids[k] != i:
+            raise KeyError(word)
+        ids, vals = ids[:], vals[:]
+        del ids[k], vals[k]
+        self._cols = (ids, vals)
+
+    def update_many(self, items, drop=()) -> Tuple[List, List]:
+        """
+        여러 키를 한 번에 쓰고/지운다 — 새 키나 삭제가 있으면 병합해서 배열을 한 번만 다시 만든다.
+        반환: (items 각 키의 이전 값, drop 각 키의 이전 값) — 없던 키는 None
+        """
+        ids, vals = self._cols
+        n = len(ids)
+        if not n:
+            # 빈 문서(새 문서): 탐색 없이 바로 만든다
+            fresh = {self.vocab.intern(w): v for w, v in items}
+            keys = sorted(fresh)
+            self._cols = (array("I", keys), array(vals.typecode, [fresh[i] for i in keys]))
+            return [None] * len(fresh), [None] * len(drop)
+        fresh = {}
+        old_set = []
+        cur = vals
+        for w, v in items:
+            i = self.vocab.intern(w)
+            k = bisect_left(ids, i)
+            if k < n and ids[k] == i:
+                old_set.append(cur[k])
+                if vals is cur:
+                    vals = cur[:]
+                vals[k] = v
+            else:
+                old_set.append(None)
+                fresh[i] = v
+        gone = set()
+        old_del = []
+        for w in drop:
+            i = self.vocab.get(w)
+            k = bisect_left(ids, i) if i is not None else n
+            if k < n and ids[k] == i and i not in gone:
+                gone.add(i)
+                old_del.append(vals[k])
+            else:
+                old_del.append(None)
+        if fresh or gone:
+            merged = {i: v for i, v in zip(ids, vals) if i not in gone}
+            merged.update(fresh)
+            keys = sorted(merged)
+            self._cols = (array("I", keys), array(vals.typecode, [merged[i] for i in keys]))
+        elif vals is not cur:
+            self._cols = (ids, vals)
+        return old_set, old_del
+
+    def id_arrays(self) -> Tuple[array, array]:
+        """(단어 ID 배열, 값 배열) — 일괄 계산용 (읽기 전용으로 쓸 것)."""
+        return self._cols
+
+    def __iter__(self):
+        words = self.vocab.words
+        for i in self._cols[0]:
+            yield words[i]
+
+    def __len__(self) -> int:
+        return len(self._cols[0])
+
+    def items(self):
+        words = self.vocab.words
+        ids, vals = self._cols
+        return [(words[i], v) for i, v in zip(ids, vals)]
+
+    def values(self):
+        return self._cols[1].tolist()
+
+    def total(self) -> int:
+        """값 합계 (문서 길이) — 배열이 바뀔 때까지 캐시."""
+        cols = self._cols
+        hit = self._total
+        if hit is None or hit[0] is not cols:
+            hit = self._total = (cols, sum(cols[1]))
+        return hit[1]
+
+    def copy(self) -> "SparseCounts":
+        # 배열은 고치지 않고 바꿔 끼우기만 하니 그대로 공유
+        out = SparseCounts(self.vocab)
+        out._cols = self._cols
+        out._total = self._total
+        return out
+
+    def __repr__(self) -> str:
+        return f"SparseCounts({dict(self.items())})"
+
+
+def _neg_log(score: float) -> float:
+    # 추천 힙 키: 점수가 클수록 작다 (로그 공간, 0점은 +inf)
+    return -math.log(score) if score > 0 else math.inf
+
+
+def _gather(col: WordColumn, ids) -> "np.ndarray":
+    # 전역 열에서 ids 위치의 값 (없는 단어 -1 은 0). 열은 제자리에서 자라므로
+    # 버퍼를 빌리지(frombuffer) 않고 itemgetter 로 필요한 칸만 복사한다
+    data = col.data
+    out = np.zeros(len(ids), dtype=np.int64)
+    ok = np.flatnonzero((ids >= 0) & (ids < len(data)))
+    if len(ok):
+        out[ok] = itemgetter(*ids[ok].tolist())(data)
+    return out
+
+
+def _gather_sparse(counts: SparseCounts, ids) -> "np.ndarray":
+    # 희소 배열은 바뀔 때마다 통째로 교체되므로 버퍼를 바로 빌려 써도 된다
+    sids, svals = counts.id_arrays()
+    if not len(sids):
+        return np.zeros(len(ids), dtype=np.int64)
+    # (뷰 이미지의 memoryview 도 같은 버퍼 프로토콜이라 그대로)
+    keys = np.asarray(sids).astype(np.int64)
+    pos = np.minimum(np.searchsorted(keys, ids), len(keys) - 1)
+    vals = np.asarray(svals).astype(np.int64)
+    return np.where(keys[pos] == ids, vals[pos], 0)
+
+
+def empty_doc_accept(vocab: Vocab) -> Dict:
+    return {"accept_counts": SparseCounts(vocab), "last_used_at": SparseCounts(vocab, typecode="q")}
+
+
+def snapshot_memory(mem: Dict) -> Dict:
+    """
+    저장용 스냅샷 — 브레인 잠금 안에서 배열/컨테이너만 복사한다 (memcpy 수준).
+    직렬화(JSON 등)는 이 스냅샷으로 잠금 밖에서 하므로 저장 중에도 추천/관찰이 멈추지 않는다.
+    """
+    snap = {k: v for k, v in mem.items() if k != "vocab"}
+    snap["accept_counts"] = mem["accept_counts"].copy()
+    snap["last_used_at"] = mem["last_used_at"].copy()
+    snap["doc_freq"] = {d: tf.copy() for d, tf in mem["doc_freq"].items()}
+    snap["per_doc_accept"] = {
+        d: {k: v.copy() for k, v in drec.items()} for d, drec in mem.get("per_doc_accept", {}).items()
+    }
+    snap["user_dict"] = {lang: list(ws) for lang, ws in mem["user_dict"].items()}
+    snap["corpus"] = dict(mem["corpus"], df=mem["corpus"]["df"].copy())
+    snap["ngrams"] = mem["ngrams"].copy()
+    return snap
+
+
+def compact_memory(mem: Dict) -> Dict:
+    """저장소에서 읽은 평범한 dict 들을 Vocab 기반 열/희소 배열로 바꾼다 (이미 바뀐 것은 그대로)."""
+    vocab = mem.get("vocab")
+    if not isinstance(vocab, Vocab):
+        vocab = mem["vocab"] = Vocab()
+
+    def column(d):
+        return d if isinstance(d, WordColumn) else WordColumn(vocab, (d or {}).items())
+
+    def sparse(d, typecode="I"):
+        return d if isinstance(d, SparseCounts) else SparseCounts(vocab, (d or {}).items(), typecode)
+
+    mem["accept_counts"] = column(mem.get("accept_counts"))
+    mem["last_used_at"] = column(mem.get("last_used_at"))
+    if isinstance(mem.get("corpus"), dict):
+        mem["corpus"]["df"] = column(mem["corpus"].get("df"))
+    mem["doc_freq"] = {d: sparse(tf) for d, tf in mem.get("doc_freq", {}).items()}
+    mem["per_doc_accept"] = {
+        d: {"accept_counts": sparse(drec.get("accept_counts")),
+            "last_used_at": sparse(drec.get("last_used_at"), "q")}
+        for d, drec in mem.get("per_doc_accept", {}).items()
+    }
+    return mem
+
+
+# ------------------ Storage Backends ------------------
+
+def empty_memory() -> Dict:
+    vocab = Vocab()
+    return {
+        "vocab": vocab,             # 단어 ↔ ID (아래 카운트 구조들이 공유, 저장하지 않음)
+        "accept_counts": WordColumn(vocab),   # 전역 선택 횟수 {word: count}
+        "last_used_at": WordColumn(vocab),    # 전역 마지막 사용 시각(ms) {word: ts}
+        "doc_freq": {},             # 문서별 TF {doc_id: SparseCounts{word: count}}
+        "user_dict": {"ko": [], "en": []},  # 사용자 사전
+        "per_doc_accept": {},       # 문서별 수락 {doc_id: {"accept_counts": SparseCounts, "last_used_at": SparseCounts}}
+        "corpus": empty_corpus(vocab),  # 전역 코퍼스 통계 (DF/문서 수/토큰 수) — tf 레코드로 증분 유지
+        "ngrams": NgramTable(),     # 2/3-gram 카운트 (다음 단어 예측) — ng 레코드로 증분 유지
+    }
+
+
+def empty_corpus(vocab: Optional[Vocab] = None) -> Dict:
+    return {"df": WordColumn(vocab) if vocab is not None else {}, "n_docs": 0, "n_tokens": 0}
+
+
+def rebuild_corpus_stats(mem: Dict) -> Dict:
+    # 통계가 없는 예전 스냅샷용: doc_freq 전체를 한 번 훑어서 만든다
+    corpus = empty_corpus(mem.get("vocab"))
+    df = corpus["df"]
+    for tf in mem.get("doc_freq", {}).values():
+        if tf:
+            corpus["n_docs"] += 1
+            corpus["n_tokens"] += sum(tf.values())
+            for w in tf:
+                df[w] = df.get(w, 0) + 1
+    mem["corpus"] = corpus
+    return corpus
+
+
+def apply_record(mem: Dict, rec: Dict) -> None:
+    """변경 레코드 1건을 메모리 dict에 반영 (실시간 경로와 로그 재생이 같은 코드를 쓴다)."""
+    op = rec.get("op")
+    if op == "accept":
+        word, ts = rec["w"], rec["ts"]
+        mem["accept_counts"][word] = mem["accept_counts"].get(word, 0) + 1
+        mem["last_used_at"][word] = ts
+        pda = mem.setdefault("per_doc_accept", {})
+        drec = pda.get(rec["doc"])
+        if drec is None:
+            drec = pda[rec["doc"]] = empty_doc_accept(mem["vocab"])
+        drec["accept_counts"][word] = drec["accept_counts"].get(word, 0) + 1
+        drec["last_used_at"][word] = ts
+    elif op == "tf":
+        tf = mem["doc_freq"].get(rec["doc"])
+        if tf is None:
+            tf = mem["doc_freq"][rec["doc"]] = SparseCounts(mem["vocab"])
+        corpus = mem.get("corpus")
+        if corpus is None:
+            corpus = rebuild_corpus_stats(mem)
+        # 문서 Counter 교체분만큼 DF/토큰 수를 빼고 더한다 (코퍼스 재스캔 없음)
+        df = corpus["df"]
+        was_empty = not tf
+        # 문서 배열은 레코드당 한 번만 다시 만든다
+        sets, dels = rec.get("set", {}), rec.get("del", [])
+        old_set, old_del = tf.update_many(sets.items(), dels)
+        delta = sum(sets.values()) - sum(o for o in old_set if o is not None)
+        delta -= sum(o for o in old_del if o is not None)
+        df.add_many([w for w, o in zip(sets, old_set) if o is None], 1)
+        df.add_many([w for w, o in zip(dels, old_del) if o is not None], -1)
+        corpus["n_tokens"] += delta
+        corpus["n_docs"] += int(was_empty and bool(tf)) - int(not was_empty and not tf)
+    elif op == "tfs":
+        # TF 가 없던 새 문서 여러 개를 한 번에 (bulk_observe 의 샤드 하나) — DF 증감은 워커가 합쳐 둔 것
+        vocab, doc_freq = mem["vocab"], mem["doc_freq"]
+        corpus = mem.get("corpus")
+        if corpus is None:
+            corpus = rebuild_corpus_stats(mem)
+        for doc_id, counts in rec["docs"].items():
+            if counts:
+                doc_freq[doc_id] = SparseCounts(vocab, counts.items())
+                corpus["n_docs"] += 1
+                corpus["n_tokens"] += sum(counts.values())
+        corpus["df"].add_counts(rec.get("df", {}))
+    elif op == "ng":
+        # 행: [문맥 단어..., 다음 단어, 증감]
+        mem.setdefault("ngrams", NgramTable()).add_many(rec.get("d", []))
+    elif op == "dict":
+        cur = mem["user_dict"].setdefault(rec["lang"], [])
+        drop = set(rec.get("del", []))
+        if drop:
+            cur = mem["user_dict"][rec["lang"]] = [w for w in cur if w not in drop]
+        # 보통은 추가만 — 목록을 다시 만들지 않고 덧붙인다 (저장용 스냅샷은 목록을 복사해 간다)
+        cur.extend(rec.get("add", []))
+
+
+def _json_default(obj):
+    # 메모리 dict 안의 배열 기반 구조는 JSON 상태로 바꿔서 쓴다 (단어 ID 는 저장하지 않음)
+    if isinstance(obj, NgramTable):
+        return obj.to_state()
+    if isinstance(obj, SparseCounts):
+        # 튜플 리스트를 거치지 않고 바로 dict 로 (저장 시간의 큰 몫)
+        ids, vals = obj._cols
+        return dict(zip(map(obj.vocab.words.__getitem__, ids), vals))
+    if isinstance(obj, WordColumn):
+        return dict(obj.items())
+    raise TypeError(f"not JSON serializable: {type(obj).__name__}")
+
+
+# 스냅샷 압축은 파일 앞 매직 바이트로 알아본다 (확장자/설정과 무관하게 읽힘)
+_GZIP_MAGIC = b"\x1f\x8b"
+_ZSTD_MAGIC = b"\x28\xb5\x2f\xfd"
+SNAPSHOT_STYLES = ("compact", "pretty")
+SNAPSHOT_COMPRESSIONS = (None, "gzip", "zstd")
+
+
+def encode_snapshot(snapshot: Dict, style: str = "compact", compression: Optional[str] = None,
+                    fast: bool = True) -> bytes:
+    """
+    저장용 스냅샷 → 파일 바이트.
+    - style: "compact"(구분자 공백 없음) / "pretty"(indent=2, 사람이 읽기용)
+    - compression: None / "gzip" / "zstd" (zstandard 패키지 필요)
+    - fast: orjson 이 있으면 그것으로 (출력은 표준 json 과 같은 JSON, 한글은 그대로 UTF-8)
+    """
+    if fast and orjson is not None:
+        opts = orjson.OPT_INDENT_2 if style == "pretty" else 0
+        payload = orjson.dumps(snapshot, default=_json_default, option=opts)
+    else:
+        kw = {"indent": 2} if style == "pretty" else {"separators": (",", ":")}
+        payload = json.dumps(snapshot, ensure_ascii=False, default=_json_default, **kw).encode("utf-8")
+    if compression == "gzip":
+        # 저장은 자주 일어나므로 속도 쪽 레벨 (6 대비 크기 차이는 몇 % 뿐)
+        return gzip.compress(payload, compresslevel=3, mtime=0)
+    if compression == "zstd":
+        return zstandard.ZstdCompressor(level=3).compress(payload)
+    return payload
+
+
+def decode_snapshot(raw: bytes, fast: bool = True) -> Dict:
+    """encode_snapshot 의 역 — 압축 여부는 매직 바이트로 판단 (예전 pretty JSON 도 그대로)."""
+    if raw[:2] == _GZIP_MAGIC:
+        raw = gzip.decompress(raw)
+    elif raw[:4] == _ZSTD_MAGIC:
+        if zstandard is None:
+            raise RuntimeError("snapshot is zstd-compressed but the zstandard package is not installed")
+        raw = zstandard.ZstdDecompressor().decompress(raw, max_output_size=1 << 34)
+    return orjson.loads(raw) if fast and orjson is not None else json.loads(raw)
+
+
+class BrainStorage:
+    """
+    ThinkHelperBrain 저장소 백엔드 인터페이스.
+    - load(): 시작 시 메모리 dict 반환 (lazy_docs 면 문서별 데이터는 비워서)
+    - load_doc(): lazy_docs 백엔드에서 문서 하나의 TF/수락 기록을 필요할 때 읽기
+    - append(): 변경 레코드마다 호출 (브레인 잠금 안)
+    - begin_save() → finish_save(): 앞은 브레인 잠금 안(스냅샷 확보), 뒤는 잠금 밖(디스크 I/O)
+    - load_image() / save_image(): mmap 스냅샷(뷰 이미지)을 지원하는 백엔드만 (image_path 가 있을 때)
+    """
+
+    lazy_docs = False  # True 면 문서별 데이터는 load_doc 으로 필요할 때만 올린다
+    logs_ops = False   # True 면 append() 만으로 변경이 영속화됨 (save 는 압축 용도)
+    log_bytes = 0      # 스냅샷에 아직 접히지 않은 로그 크기
+    image_path: Optional[str] = None  # 브레인을 닫을 때 함께 쓰는 mmap 스냅샷 경로
+
+    def load(self) -> Dict:
+        raise NotImplementedError
+
+    def load_doc(self, doc_id: str) -> Optional[Dict]:
+        return None
+
+    def load_image(self) -> Optional["ImageView"]:
+        """저장된 스냅샷과 정확히 같은 뷰 이미지가 있으면 mmap 해서 반환 (없거나 낡았으면 None)."""
+        return None
+
+    def save_image(self, job, image: tuple) -> None:
+        pass
+
+    def append(self, rec: Dict) -> None:
+        pass
+
+    def begin_save(self, memory: Dict):
+        raise NotImplementedError
+
+    def finish_save(self, job) -> None:
+        raise NotImplementedError
+
+    def sync(self) -> None:
+        pass
+
+    def needs_compaction(self) -> bool:
+        return False
+
+    def is_doc_dirty(self, doc_id: str) -> bool:
+        return False
+
+    def close(self) -> None:
+        pass
+
+
+class JsonStorage(BrainStorage):
+    """
+    기본 백엔드: JSON 스냅샷 1개 (+ wal=True 면 추가 전용 로그).
+    로그 레코드는 seq 번호를 갖고, 스냅샷은 마지막으로 접힌 wal_seq 를 기록한다.
+    image=True 면 브레인이 청하는 스냅샷(닫을 때)에 path + ".img" 뷰 이미지(이진, mmap 용)도 쓴다. 이미지는 짝이 되는
+    JSON 의 (크기, mtime) 과 wal_seq 를 적어 두고, 그대로이고 재생할 로그가 없을 때만 쓰인다.
+    스냅샷 형식은 style/compression/fast_json (encode_snapshot 참고) — 읽을 때는 형식을 알아서 판단한다.
+    """
+
+    def __init__(self, path: str = "brain_data.json", wal: bool = False,
+                 wal_compact_bytes: int = 4 * 1024 * 1024, image: bool = False,
+                 style: str = "compact", compression: Optional[str] = None, fast_json: bool = True):
+        if style not in SNAPSHOT_STYLES:
+            raise ValueError(f"unknown snapshot style: {style}")
+        if compression not in SNAPSHOT_COMPRESSIONS:
+            raise ValueError(f"unknown snapshot compression: {compression}")
+        if compression == "zstd" and zstandard is None:
+            raise RuntimeError("zstd compression needs the zstandard package")
+        self.path = path
+        self.style = style
+        self.compression = compression
+        self.fast_json = fast_json
+        self.image_path = path + ".img" if image else None
+        self.wal = wal
+        self.wal_compact_bytes = wal_compact_bytes
+        self._wal_path = path + ".wal"
+        self._wal_fh = None
+        self.log_bytes = 0
+        self._seq = 0  # 마지막으로 반영된 로그 레코드 번호
+
+    @property
+    def logs_ops(self) -> bool:
+        return self._wal_fh is not None
+
+    def load(self) -> Dict:
+        mem: Dict = empty_memory()
+        if os.path.exists(self.path):
+            try:
+                with open(self.path, "rb") as f:
+                    mem = decode_snapshot(f.read(), self.fast_json)
+            except RuntimeError:
+                # 읽을 코덱이 없을 뿐 깨진 파일이 아니다 — 치워 두지 않는다
+                raise
+            except Exception as e:
+                # 스냅샷이 깨졌으면 원본은 .corrupt 로 보존하고 로그(WAL)만으로 복구
+                bad = self.path + ".corrupt"
+                os.replace(self.path, bad)
+                print(f"⚠️ snapshot unreadable ({e}); moved to {bad}, replaying WAL only")
+                mem = {}
+
+        # 스키마 보정
+        self._seq = int(mem.pop("wal_seq", 0) or 0)
+        mem.setdefault("accept_counts", {})
+        mem.setdefault("last_used_at", {})
+        mem.setdefault("doc_freq", {})
+        mem.setdefault("user_dict", {"ko": [], "en": []})
+        # 타입 보정
+        for lang in ("ko", "en"):
+            if not isinstance(mem["user_dict"].get(lang, []), list):
+                mem["user_dict"][lang] = []
+        if not isinstance(mem.get("corpus"), dict):
+            rebuild_corpus_stats(mem)
+        mem["ngrams"] = NgramTable.from_state(mem.get("ngrams"))
+        compact_memory(mem)
+
+        # 스냅샷 이후의 로그 꼬리 재생 (wal=False 로 켜도 남은 로그는 반영)
+        self._replay_wal(mem)
+        if self.wal and self._wal_fh is None:
+            self._open_wal()
+        return mem
+
+    def load_image(self) -> Optional["ImageView"]:
+        if self.image_path is None:
+            return None
+        try:
+            st = os.stat(self.path)
+            with open(self.image_path, "rb") as f:
+                view = ImageView(mmap.mmap(f.fileno(), 0, access=mmap.ACCESS_READ))
+        except (OSError, ValueError):
+            return None
+        meta = view.meta
+        if meta.get("snapshot") != [st.st_size, st.st_mtime_ns] or self._has_wal_tail():
+            return None
+        self._seq = meta["wal_seq"]
+        if self.wal:
+            self._open_wal()
+        return view
+
+    def save_image(self, job, image: tuple) -> None:
+        # finish_save 직후 (_io_lock 안): 방금 쓴 JSON 과 짝을 맞춰 적는다
+        if self.image_path is None:
+            return
+        st = os.stat(self.path)
+        image[0].update(snapshot=[st.st_size, st.st_mtime_ns], wal_seq=job[0]["wal_seq"])
+        ViewImageWriter.dump(image, self.image_path)
+
+    def begin_save(self, memory: Dict):
+        # 스냅샷은 n-gram 표 전체를 쓰므로 가지치기 기록은 버린다
+        memory["ngrams"].drain_pruned()
+        # 잠금 안에서는 복사만, 직렬화는 finish_save 에서
+        snapshot = snapshot_memory(memory)
+        snapshot["wal_seq"] = self._seq
+        return snapshot, self._rotate_wal()
+
+    def finish_save(self, job) -> None:
+        snapshot, _segment = job
+        payload = encode_snapshot(snapshot, self.style, self.compression, self.fast_json)
+        tmp_path = self.path + ".tmp"
+        with open(tmp_path, "wb") as f:
+            f.write(payload)
+        os.replace(tmp_path, self.path)
+        # 스냅샷에 접힌 로그 조각은 이제 필요 없음 — 방금 떼어낸 것뿐 아니라 크래시로 남은 예전 조각도
+        # (조각 이름의 seq 가 스냅샷의 wal_seq 이하이면 전부 접혔다)
+        for path in self._wal_segments():
+            if int(path.rsplit(".", 1)[1]) <= snapshot["wal_seq"]:
+                os.remove(path)
+
+    def needs_compaction(self) -> bool:
+        return self._wal_fh is not None and self.log_bytes >= self.wal_compact_bytes
+
+    def close(self) -> None:
+        if self._wal_fh is not None:
+            self._wal_fh.close()
+            self._wal_fh = None
+
+    # ------------------ Write-ahead log ------------------
+
+    def _wal_segments(self) -> List[str]:
+        # 회전된 로그 조각: <wal>.<마지막 seq> — 번호 순 재생
+        d = os.path.dirname(self._wal_path) or "."
+        base = os.path.basename(self._wal_path) + "."
+        segs = []
+        for name in os.listdir(d):
+            if name.startswith(base) and name[len(base):].isdigit():
+                segs.append((int(name[len(base):]), os.path.join(d, name)))
+        return [p for _, p in sorted(segs)]
+
+    def _has_wal_tail(self) -> bool:
+        # 스냅샷에 접히지 않은 로그 레코드가 남아 있을 수 있는지 (파일만 보고)
+        return bool(self._wal_segments()) or (
+            os.path.exists(self._wal_path) and os.path.getsize(self._wal_path) > 0)
+
+    def _replay_wal(self, mem: Dict) -> int:
+        snap_seq = self._seq
+        replayed = 0
+        for path in self._wal_segments() + [self._wal_path]:
+            if not os.path.exists(path):
+                continue
+            with open(path, "r", encoding="utf-8") as f:
+                for line in f:
+                    try:
+                        rec = json.loads(line)
+                    except ValueError:
+                        # 쓰다 만 마지막 줄(크래시) — 버린다
+                        continue
+                    seq = rec.get("seq", 0)
+                    if seq <= snap_seq:
+                        continue
+                    apply_record(mem, rec)
+                    self._seq = max(self._seq, seq)
+                    replayed += 1
+        if replayed:
+            print(f"🔁 WAL replay: {replayed} records (seq {snap_seq} → {self._seq})")
+        return replayed
+
+    def _open_wal(self) -> None:
+        # 크래시로 잘린 꼬리가 있으면 마지막 줄바꿈까지 잘라낸 뒤 이어 쓴다
+        if os.path.exists(self._wal_path):
+            with open(self._wal_path, "rb+") as f:
+                data = f.read()
+                if data and not data.endswith(b"\n"):
+                    f.truncate(data.rfind(b"\n") + 1)
+        self._wal_fh = open(self._wal_path, "a", encoding="utf-8")
+        self.log_bytes = self._wal_fh.tell()
+
+    def _rotate_wal(self) -> Optional[str]:
+        # 브레인 잠금 안에서 호출: 현재 로그를 조각으로 떼어내고 새 로그를 연다
+        if self._wal_fh is None or self.log_bytes == 0:
+            return None
+        self._wal_fh.close()
+        segment = f"{self._wal_path}.{self._seq}"
+        os.replace(self._wal_path, segment)
+        self._open_wal()
+        return segment
+
+    def append(self, rec: Dict) -> None:
+        if self._wal_fh is None:
+            return
+        self._seq += 1
+        line = json.dumps(
+            {"seq": self._seq, **rec}, ensure_ascii=False, separators=(",", ":")
+        ) + "\n"
+        self._wal_fh.write(line)
+        self._wal_fh.flush()
+        self.log_bytes += len(line.encode("utf-8"))
+
+    def sync(self) -> None:
+        if self._wal_fh is not None:
+            self._wal_fh.flush()
+            os.fsync(self._wal_fh.fileno())
+
+
+class SqliteStorage(BrainStorage):
+    """
+    SQLite 백엔드 (WAL 저널, 구조별 테이블 + 기본키 색인, 배치 upsert).
+    전역 수락 통계, user_dict, 코퍼스 DF 만 시작 시 올리고, 문서별 TF/수락은 load_doc 으로 필요할 때 읽는다.
+    """
+
+    lazy_docs = True
+
+    _SCHEMA = """
+    CREATE TABLE IF NOT EXISTS accept (
+        word TEXT PRIMARY KEY, count INTEGER NOT NULL, last_used_at INTEGER
+    );
+    CREATE TABLE IF NOT EXISTS doc_freq (
+        doc_id TEXT NOT NULL, word TEXT NOT NULL, count INTEGER NOT NULL,
+        PRIMARY KEY (doc_id, word)
+    ) WITHOUT ROWID;
+    CREATE TABLE IF NOT EXISTS doc_accept (
+        doc_id TEXT NOT NULL, word TEXT NOT NULL, count INTEGER NOT NULL, last_used_at INTEGER,
+        PRIMARY KEY (doc_id, word)
+    ) WITHOUT ROWID;
+    CREATE TABLE IF NOT EXISTS user_dict (
+        lang TEXT NOT NULL, word TEXT NOT NULL,
+        PRIMARY KEY (lang, word)
+    ) WITHOUT ROWID;
+    CREATE TABLE IF NOT EXISTS corpus_df (
+        word TEXT PRIMARY KEY, df INTEGER NOT NULL
+    ) WITHOUT ROWID;
+    CREATE TABLE IF NOT EXISTS corpus_meta (
+        key TEXT PRIMARY KEY, value INTEGER NOT NULL
+    );
+    CREATE TABLE IF NOT EXISTS ngram (
+        ctx TEXT NOT NULL, word TEXT NOT NULL, count INTEGER NOT NULL,
+        PRIMARY KEY (ctx, word)
+    ) WITHOUT ROWID;
+    """
+
+    def __init__(self, path: str = "brain_data.sqlite3"):
+        self.path = path
+        self._db_lock = threading.Lock()
+        self._conn = sqlite3.connect(path, check_same_thread=False)
+        self._conn.execute("PRAGMA journal_mode=WAL")
+        self._conn.execute("PRAGMA synchronous=NORMAL")
+        self._conn.executescript(self._SCHEMA)
+        self._reset_dirty()
+        self._inflight_docs: set = set()
+
+    def _reset_dirty(self) -> None:
+        self._dirty_words: set = set()             # accept
+        self._dirty_doc_accept: set = set()        # (doc_id, word)
+        self._dirty_tf: Dict[str, set] = {}        # doc_id -> words
+        self._dirty_dict: Dict[Tuple[str, str], bool] = {}  # (lang, word) -> 추가(True)/삭제(False)
+        self._dirty_df: set = set()                # corpus_df (+ corpus_meta)
+        self._dirty_ng: set = set()                # (ctx 튜플, word)
+
+    def load(self) -> Dict:
+        mem = empty_memory()
+        with self._db_lock:
+            for word, cnt, ts in self._conn.execute("SELECT word, count, last_used_at FROM accept"):
+                mem["accept_counts"][word] = cnt
+                if ts:
+                    mem["last_used_at"][word] = ts
+            for lang, word in self._conn.execute("SELECT lang, word FROM user_dict"):
+                mem["user_dict"].setdefault(lang, []).append(word)
+            meta = dict(self._conn.execute("SELECT key, value FROM corpus_meta"))
+            if "n_docs" not in meta:
+                # 통계 테이블 이전에 만든 DB: doc_freq 에서 한 번 채워 넣는다
+                with self._conn:
+                    self._conn.execute(
+                        "INSERT OR REPLACE INTO corpus_df (word, df) "
+                        "SELECT word, COUNT(*) FROM doc_freq GROUP BY word")
+                    n_docs, n_tokens = self._conn.execute(
+                        "SELECT COUNT(DISTINCT doc_id), COALESCE(SUM(count), 0) FROM doc_freq"
+                    ).fetchone()
+                    meta = {"n_docs": n_docs, "n_tokens": n_tokens}
+                    self._conn.executemany(
+                        "INSERT OR REPLACE INTO corpus_meta (key, value) VALUES (?, ?)",
+                        meta.items())
+            corpus = mem["corpus"]
+            corpus["df"] = WordColumn(mem["vocab"], self._conn.execute("SELECT word, df FROM corpus_df"))
+            corpus["n_docs"], corpus["n_tokens"] = meta["n_docs"], meta["n_tokens"]
+            mem["ngrams"].add_many(
+                [*ctx.split(" "), word, cnt]
+                for ctx, word, cnt in self._conn.execute("SELECT ctx, word, count FROM ngram"))
+        return mem
+
+    def load_doc(self, doc_id: str) -> Optional[Dict]:
+        with self._db_lock:
+            tf = dict(self._conn.execute(
+                "SELECT word, count FROM doc_freq WHERE doc_id = ?", (doc_id,)))
+            rows = self._conn.execute(
+                "SELECT word, count, last_used_at FROM doc_accept WHERE doc_id = ?", (doc_id,)
+            ).fetchall()
+        accept = {
+            "accept_counts": {w: c for w, c, _ in rows},
+            "last_used_at": {w: ts for w, _, ts in rows if ts},
+        }
+        return {"tf": tf, "accept": accept if rows else None}
+
+    def append(self, rec: Dict) -> None:
+        op = rec.get("op")
+        if op == "accept":
+            self._dirty_words.add(rec["w"])
+            self._dirty_doc_accept.add((rec["doc"], rec["w"]))
+        elif op == "tf":
+            words = self._dirty_tf.setdefault(rec["doc"], set())
+            words.update(rec.get("set", {}))
+            words.update(rec.get("del", []))
+            self._dirty_df.update(rec.get("set", {}))
+            self._dirty_df.update(rec.get("del", []))
+        elif op == "tfs":
+            for doc_id, counts in rec["docs"].items():
+                self._dirty_tf.setdefault(doc_id, set()).update(counts)
+            self._dirty_df.update(rec.get("df", {}))
+        elif op == "ng":
+            self._dirty_ng.update((tuple(row[:-2]), row[-2]) for row in rec.get("d", []))
+        elif op == "dict":
+            for w in rec.get("del", []):
+                self._dirty_dict[(rec["lang"], w)] = False
+            for w in rec.get("add", []):
+                self._dirty_dict[(rec["lang"], w)] = True
+
+    def begin_save(self, memory: Dict):
+        # 브레인 잠금 안: 바뀐 키의 현재 값만 행으로 뽑는다
+        ac, lu = memory["accept_counts"], memory["last_used_at"]
+        accept_rows = [(w, ac.get(w, 0), lu.get(w)) for w in self._dirty_words]
+        pda = memory.get("per_doc_accept", {})
+        doc_accept_rows = []
+        for doc_id, w in self._dirty_doc_accept:
+            drec = pda.get(doc_id, {})
+            doc_accept_rows.append((
+                doc_id, w,
+                drec.get("accept_counts", {}).get(w, 0),
+                drec.get("last_used_at", {}).get(w),
+            ))
+        tf_rows, tf_dels = [], []
+        for doc_id, words in self._dirty_tf.items():
+            tf = memory["doc_freq"].get(doc_id, {})
+            for w in words:
+                if w in tf:
+                    tf_rows.append((doc_id, w, tf[w]))
+                else:
+                    tf_dels.append((doc_id, w))
+        dict_adds = [k for k, add in self._dirty_dict.items() if add]
+        dict_dels = [k for k, add in self._dirty_dict.items() if not add]
+        corpus = memory["corpus"]
+        df = corpus["df"]
+        df_rows = [(w, df[w]) for w in self._dirty_df if w in df]
+        df_dels = [(w,) for w in self._dirty_df if w not in df]
+        meta_rows = []
+        if self._dirty_df:
+            meta_rows = [("n_docs", corpus["n_docs"]), ("n_tokens", corpus["n_tokens"])]
+        table = memory["ngrams"]
+        # 가지치기로 빠진 항목도 현재 카운트(0이면 삭제)로 맞춘다 — 그 뒤 다시 생긴 항목은 upsert
+        self._dirty_ng.update(table.drain_pruned())
+        ng_rows, ng_dels = [], []
+        for ctx, w in self._dirty_ng:
+            cnt = table.count(ctx, w)
+            if cnt > 0:
+                ng_rows.append((" ".join(ctx), w, cnt))
+            else:
+                ng_dels.append((" ".join(ctx), w))
+        job = (accept_rows, doc_accept_rows, tf_rows, tf_dels, dict_adds, dict_dels,
+               df_rows, df_dels, meta_rows, ng_rows, ng_dels,
+               set(self._dirty_tf) | {d for d, _ in self._dirty_doc_accept})
+        self._inflight_docs |= job[-1]
+        self._reset_dirty()
+        return job
+
+    def finish_save(self, job) -> None:
+        (accept_rows, doc_accept_rows, tf_rows, tf_dels, dict_adds, dict_dels,
+         df_rows, df_dels, meta_rows, ng_rows, ng_dels, docs) = job
+        try:
+            with self._db_lock, self._conn:
+                self._conn.executemany(
+                    "INSERT INTO accept (word, count, last_used_at) VALUES (?, ?, ?) "
+                    "ON CONFLICT(word) DO UPDATE SET count = excluded.count, "
+                    "last_used_at = excluded.last_used_at", accept_rows)
+                self._conn.executemany(
+                    "INSERT INTO doc_accept (doc_id, word, count, last_used_at) VALUES (?, ?, ?, ?) "
+                    "ON CONFLICT(doc_id, word) DO UPDATE SET count = excluded.count, "
+                    "last_used_at = excluded.last_used_at", doc_accept_rows)
+                self._conn.executemany(
+                    "INSERT INTO doc_freq (doc_id, word, count) VALUES (?, ?, ?) "
+                    "ON CONFLICT(doc_id, word) DO UPDATE SET count = excluded.count", tf_rows)
+                self._conn.executemany(
+                    "DELETE FROM doc_freq WHERE doc_id = ? AND word = ?", tf_dels)
+                self._conn.executemany(
+                    "INSERT OR IGNORE INTO user_dict (lang, word) VALUES (?, ?)", dict_adds)
+                self._conn.executemany(
+                    "DELETE FROM user_dict WHERE lang = ? AND word = ?", dict_dels)
+                self._conn.executemany(
+                    "INSERT INTO corpus_df (word, df) VALUES (?, ?) "
+                    "ON CONFLICT(word) DO UPDATE SET df = excluded.df", df_rows)
+                self._conn.executemany("DELETE FROM corpus_df WHERE word = ?", df_dels)
+                self._conn.executemany(
+                    "INSERT OR REPLACE INTO corpus_meta (key, value) VALUES (?, ?)", meta_rows)
+                self._conn.executemany(
+                    "INSERT INTO ngram (ctx, word, count) VALUES (?, ?, ?) "
+                    "ON CONFLICT(ctx, word) DO UPDATE SET count = excluded.count", ng_rows)
+                self._conn.executemany("DELETE FROM ngram WHERE ctx = ? AND word = ?", ng_dels)
+        except sqlite3.Error:
+            # 실패한 키는 다시 dirty 로 — 다음 저장 때 현재 값으로 재시도
+            self._dirty_words.update(w for w, _, _ in accept_rows)
+            self._dirty_doc_accept.update((d, w) for d, w, _, _ in doc_accept_rows)
+            for d, w, *_ in tf_rows + tf_dels:
+                self._dirty_tf.setdefault(d, set()).add(w)
+            for k in dict_adds:
+                self._dirty_dict.setdefault(k, True)
+            for k in dict_dels:
+                self._dirty_dict.setdefault(k, False)
+            self._dirty_df.update(w for w, _ in df_rows)
+            self._dirty_df.update(w for w, in df_dels)
+            self._dirty_ng.update((tuple(c.split(" ")), w) for c, w, *_ in ng_rows + ng_dels)
+            raise
+        finally:
+            self._inflight_docs -= docs
+
+    def is_doc_dirty(self, doc_id: str) -> bool:
+        return (
+            doc_id in self._dirty_tf
+            or doc_id in self._inflight_docs
+            or any(d == doc_id for d, _ in self._dirty_doc_accept)
+        )
+
+    def close(self) -> None:
+        with self._db_lock:
+            self._conn.close()
+
+
+# ------------------ Concurrency ------------------
+
+class SuggestView:
+    """
+    추천이 읽는 상태의 불변 스냅샷 — 쓰는 쪽이 변경을 마칠 때(브레인 잠금 안에서) 새로 만들어
+    brain._view 에 한 번의 대입으로 바꿔 끼운다. 추천은 잠금 없이 _view 를 한 번 집어서 그것만 본다.
+    - 접두사 색인: PrefixTrie.snapshot (경로 복사)
+    - 로그 점수표/DF 열: 공개된 배열은 고치지 않고, 다음 쓰기가 복사본으로 옮겨 간다
+    - n-gram 표: NgramTable.view
+    만드는 비용은 O(1) (복사는 실제로 바뀌는 구조만, 다음 쓰기 때 한 번).
+    문서별 TF/수락 기록은 문서가 LRU 로 오르내리므로 스냅샷에 넣지 않고, 요청마다 pin 으로 붙인다.
+    """
+
+    __slots__ = ("index", "vocab", "accept_log", "decay_rate", "df", "n_docs", "n_tokens", "ngrams",
+                 "tf", "doc_accept")
+
+    def __init__(self, index: Dict[str, PrefixTrie], vocab: Vocab, accept_log: array,
+                 decay_rate: float, corpus: Dict, ngrams: NgramTable):
+        self.index = index
+        self.vocab = vocab
+        self.accept_log = accept_log
+        self.decay_rate = decay_rate
+        self.df = corpus["df"]
+        self.n_docs = corpus["n_docs"]
+        self.n_tokens = corpus["n_tokens"]
+        self.ngrams = ngrams
+        self.tf: Optional[SparseCounts] = None
+        self.doc_accept: Optional[Tuple[SparseCounts, SparseCounts]] = None
+
+    def pin(self, memory: Dict, doc_id: str) -> "SuggestView":
+        """doc_id 의 TF/수락 기록을 지금 그대로 붙인 요청용 사본 (희소 배열은 O(1) 복사)."""
+        out = SuggestView.__new__(SuggestView)
+        for name in SuggestView.__slots__:
+            setattr(out, name, getattr(self, name))
+        tf = memory["doc_freq"].get(doc_id)
+        out.tf = tf.copy() if tf else None
+        drec = memory["per_doc_accept"].get(doc_id)
+        if drec:
+            out.doc_accept = (drec["accept_counts"].copy(), drec["last_used_at"].copy())
+        return out
+
+
+class ThinkHelperBrain:
+    """
+    사용 패턴:
+      brain = ThinkHelperBrain()
+      brain.observe_text_incremental(doc_id, current_text)   # 타이핑 중 수시 호출
+      cands = brain.get_suggestions(prefix, doc_id, top_n=8) # 접두사 추천
+      brain.accept_suggestion(doc_id, chosen_word)           # 탭/엔터 수락시 호출
+
+    write_behind=True 이면 변경마다 파일을 다시 쓰지 않고, 백그라운드 스레드가
+    flush_interval 초마다 또는 변경 flush_ops 회가 쌓이면 한 번에 저장한다.
+    종료 시 close()(atexit 자동 등록)로 남은 변경을 flush.
+
+    wal=True 이면 변경을 한 줄짜리 레코드(accept / tf / dict)로 storage_file + ".wal" 에
+    덧붙이고(O(1) 바이트), 로그가 wal_compact_bytes 를 넘으면 백그라운드에서 스냅샷으로 접는다.
+    로드 시 스냅샷의 wal_seq 이후 레코드만 재생한다.
+
+    저장소는 storage= 로 바꿀 수 있다 (기본 JsonStorage, 대용량은 SqliteStorage:
+    문서별 데이터는 필요할 때만 올리고 max_loaded_docs 개를 넘으면 오래된 것부터 내린다).
+
+    JSON 스냅샷은 기본이 공백 없는 compact (snapshot_style="pretty" 면 indent=2), compression="gzip"/"zstd"
+    로 압축할 수 있다. 읽을 때는 형식/압축을 알아서 판단하므로 설정을 바꿔도 예전 파일이 그대로 읽힌다.
+
+    mmap_snapshot=True 이면 닫을 때(close) 뷰 이미지(storage_file + ".img")도 함께 쓰고, 다음 시작 때
+    그 이미지가 최신이면 JSON 을 파싱하지 않고 mmap 한 이미지로 바로 추천한다.
+    주기 저장(write-behind flush, WAL 압축)은 JSON 만 쓴다 — 그 뒤에 비정상 종료하면 이미지가
+    JSON 과 짝이 맞지 않으므로 다음 시작은 JSON 을 읽는다.
+    메모리 dict(self.memory)는 첫 쓰기 등 처음 필요할 때 한 번 올린다.
+    """
+
+    def __init__(
+        self,
+        storage_file: str = "brain_data.json",
+        user_dict_cap: int = 400,
+        token_cap: Optional[int] = 1000,
+        context_mode: str = "bm25",
+        ngram_max_entries: int = 200_000,
+        write_behind: bool = False,
+        flush_interval: float = 2.0,
+        flush_ops: int = 50,
+        wal: bool = False,
+        wal_compact_bytes: int = 4 * 1024 * 1024,
+        storage: Optional[BrainStorage] = None,
+        mmap_snapshot: bool = False,
+        snapshot_style: str = "compact",
+        compression: Optional[str] = None,
+    ):
+        if storage is None:
+            storage = JsonStorage(
+                storage_file, wal=wal, wal_compact_bytes=wal_compact_bytes, image=mmap_snapshot,
+                style=snapshot_style, compression=compression)
+        self.storage = storage
+        self.storage_file = getattr(storage, "path", storage_file)
+
+        # 불용어 (너무 흔한 단어 제외)
+        self.stop_ko: set = {
+            "그리고", "그러나", "하지만", "또", "또는", "및", "있다",
+            "하는", "에서", "으로", "에게", "입니다", "수", "것", "등", "때"
+        }
+        self.stop_en: set = {
+            "the", "and", "for", "with", "that", "this", "from",
+            "have", "are", "not", "to", "of", "in", "on", "by", "as", "be", "is"
+        }
+
+        # 기본(시드) 사전 — 필요시 추가
+        self.dict_ko_base: List[str] = [
+            "분석","연구","결과","방법","과정","결론","참고","출처","데이터","요약",
+            "종합","한계","전망","쟁점","법리","판례","형법","형사소송법","대법원","요지",
+            "사실관계","알고리즘","프로토타입","컨텍스트","토큰","임베딩","오프라인",
+            "캐시","스레드","비동기","이벤트루프","렌더링","성능최적화"
+        ]
+        self.dict_en_base: List[str] = [
+            "analysis","baseline","benchmark","context","dataset","design","embedding",
+            "evaluation","fallback","feature","guide","heuristic","insight","journey",
+            "knowledge","latency","model","note","optimize","pipeline","quality",
+            "research","summary","template","validation","workflow","yield","zero-copy"
+        ]
+
+        # 최대 사용자 사전 용량(언어별) — 접두사 색인 덕분에 수십만 단위까지 올려도 추천 지연 무관
+        self.user_dict_caps = {"ko": user_dict_cap, "en": user_dict_cap}
+        # 전체 관찰 시 언어별 토큰 상한 (None = 무제한). 상한에 차면 나머지 본문은 스캔하지 않는다
+        self.token_caps: Dict[str, Optional[int]] = {"ko": token_cap, "en": token_cap}
+
+        # 메모리 dict — 저장소에서 올리는 건 아래 색인 준비 때 (mmap 스냅샷이면 처음 필요할 때)
+        self._memory: Optional[Dict] = None
+        # lazy_docs 저장소에서 메모리에 올라와 있는 문서 (LRU)
+        self.max_loaded_docs = 256
+        self._loaded_docs: "OrderedDict[str, bool]" = OrderedDict()
+
+        # 감쇠 파라미터(일 단위)
+        self.decay_daily = 0.99
+        # 후보가 이만큼 넘으면 (NumPy 가 있을 때) 점수를 단어 ID 배열로 한 번에 계산
+        self.batch_score_min = 32
+
+        # 컨텍스트 점수: "tf"(문서 내 빈도만) / "tfidf" / "bm25" — 0~1 범위로 정규화
+        if context_mode not in ("tf", "tfidf", "bm25"):
+            raise ValueError(f"unknown context_mode: {context_mode}")
+        self.context_mode = context_mode
+        self.bm25_k1 = 1.2
+        self.bm25_b = 0.75
+
+        # 다음 단어 예측(2/3-gram): 점수 = ngram_weight × P(단어 | 앞 2단어),
+        # 3-gram 이 없으면 ngram_backoff × P(단어 | 앞 단어). 수락하면 ngram_accept_boost 만큼 강화
+        self.ngram_max_entries = ngram_max_entries
+        self.ngram_weight = 2.0
+        self.ngram_backoff = 0.4
+        self.ngram_accept_boost = 2
+
+        # 오타 허용 추천: 앞 fuzzy_prefix_length 글자는 정확히 맞아야 한다 (탐색 범위를 크게 줄임)
+        self.fuzzy_prefix_length = 1
+
+        # 델타 관찰용 문서 상태 (프로세스 메모리에만 유지, 최근 문서 위주)
+        # {doc_id: {"text": str, "counts": Counter | None}}
+        self.max_live_docs = 64
+        self._live_docs: "OrderedDict[str, Dict]" = OrderedDict()
+        # 언어별 user_dict 단어 집합 (멤버십 확인용 — 처음 동기화할 때 만들고 dict 레코드마다 같이 고친다)
+        self._user_dict_members: Dict[str, set] = {}
+
+        # 언어별 접두사 색인 (user_dict + 기본 사전)
+        self._index: Dict[str, PrefixTrie] = {}
+        self._image_writer: Optional[ViewImageWriter] = None
+        # mmap 스냅샷이 최신이면 추천은 그 이미지로 바로 시작한다 (파싱 없음 — 페이지는 읽는 만큼만 올라옴)
+        image = storage.load_image()
+        # 디스크의 이미지가 지금 저장된 스냅샷과 짝이 맞는지 — 아니면 close 때 다시 쓴다
+        self._image_current = image is not None
+        if image is not None:
+            self._view: SuggestView = image
+        else:
+            self._materialize()
+
+        # 동시성: 변경(mutation)은 _lock (RLock) 안에서 하고 끝나면 _publish 로 추천용 스냅샷(_view)을
+        # 바꿔 끼운다. 추천은 잠금 없이 _view 만 읽는다.
+        # 문서 단위 작업(토큰화 등 무거운 부분)은 문서 해시로 고른 줄무늬 잠금 — 다른 문서끼리는 병행.
+        # 파일 쓰기는 _io_lock 으로 직렬화. 잠금 순서: 문서 잠금 → _lock → _io_lock
+        self._lock = threading.RLock()
+        self._footprint = 0  # memory_footprint 의 지난 값 (락을 못 잡을 때 쓴다)
+        self._doc_locks = [threading.Lock() for _ in range(16)]
+        self._io_lock = threading.Lock()
+        self.write_behind = write_behind
+        self.flush_interval = flush_interval
+        self.flush_ops = max(1, flush_ops)
+        self._dirty_ops = 0
+        self._closed = False
+        self._flush_event = threading.Event()
+        self._flusher: Optional[threading.Thread] = None
+        if write_behind or storage.logs_ops:
+            self._flusher = threading.Thread(
+                target=self._flush_loop, name="brain-flusher", daemon=True
+            )
+            self._flusher.start()
+        atexit.register(self.close)
+
+    # ------------------ Persistence ------------------
+
+    @property
+    def memory(self) -> Dict:
+        mem = self._memory
+        if mem is None:
+            # mmap 스냅샷으로 시작한 브레인: 처음 필요할 때 한 번 올린다
+            with self._lock:
+                if self._memory is None:
+                    self._materialize()
+            mem = self._memory
+        return mem
+
+    def _materialize(self) -> None:
+        # 저장소에서 메모리 dict 를 올리고 색인/추천 스냅샷을 새로 만든다
+        mem = self._load_or_init()
+        mem["ngrams"].max_entries = self.ngram_max_entries
+        self._memory = mem
+        self.rebuild_index()
+
+    def _load_or_init(self) -> Dict:
+        mem = self.storage.load()
+        mem.setdefault("per_doc_accept", {})
+        if "corpus" not in mem:
+            rebuild_corpus_stats(mem)
+        if not isinstance(mem.get("ngrams"), NgramTable):
+            mem["ngrams"] = NgramTable.from_state(mem.get("ngrams"))
+        return compact_memory(mem)
+
+    def _ensure_doc(self, doc_id: Optional[str]) -> None:
+        # lazy_docs 백엔드: 문서별 TF/수락 기록을 처음 쓸 때 올리고, 오래된 깨끗한 문서는 내린다
+        if not doc_id or not self.storage.lazy_docs:
+            return
+        try:
+            # 잠금 없는 빠른 경로 (다른 스레드가 막 내렸으면 KeyError → 잠금 경로)
+            self._loaded_docs.move_to_end(doc_id)
+            return
+        except KeyError:
+            pass
+        with self._lock:
+            if doc_id in self._loaded_docs:
+                return
+            data = self.storage.load_doc(doc_id)
+            if data:
+                vocab = self.memory["vocab"]
+                if data.get("tf"):
+                    self.memory["doc_freq"][doc_id] = SparseCounts(vocab, data["tf"].items())
+                if data.get("accept"):
+                    acc = data["accept"]
+                    self.memory["per_doc_accept"][doc_id] = {
+                        "accept_counts": SparseCounts(vocab, acc["accept_counts"].items()),
+                        "last_used_at": SparseCounts(vocab, acc["last_used_at"].items(), "q"),
+                    }
+            self._loaded_docs[doc_id] = True
+            for old in list(self._loaded_docs):
+                if len(self._loaded_docs) <= self.max_loaded_docs:
+                    break
+                if old == doc_id or self.storage.is_doc_dirty(old):
+                    continue
+                del self._loaded_docs[old]
+                self.memory["doc_freq"].pop(old, None)
+                self.memory["per_doc_accept"].pop(old, None)
+
+    def save_memory(self, with_image: bool = False) -> None:
+        # 스냅샷 확보는 잠금 안에서(일관성), 디스크 쓰기는 잠금 밖에서.
+        # 잠금 순서는 항상 _lock → _io_lock : 스냅샷이 만들어진 순서대로 기록된다.
+        # with_image: mmap 스냅샷도 함께 (트라이를 전부 다시 싸므로 close 때만)
+        with self._lock:
+            job = self.storage.begin_save(self.memory)
+            image = None
+            if with_image and self.storage.image_path:
+                if self._image_writer is None:
+                    self._image_writer = ViewImageWriter()
+                image = self._image_writer.prepare(self)
+            self._dirty_ops = 0
+            self._io_lock.acquire()
+        try:
+            self._image_current = False
+            self.storage.finish_save(job)
+            if image is not None:
+                self.storage.save_image(job, image)
+                self._image_current = True
+        finally:
+            self._io_lock.release()
+
+    def _commit(self, rec: Dict) -> None:
+        # _lock 안에서 호출: 메모리에 반영 + 저장소에 변경 레코드 전달
+        if rec.get("op") in ("tf", "tfs"):
+            # 공개된 스냅샷이 들고 있는 DF 열은 고치지 않고 복사본으로 옮겨 간다 (공개 1회당 한 번)
+            corpus = self.memory["corpus"]
+            if corpus["df"] is self._view.df:
+                corpus["df"] = corpus["df"].copy()
+        apply_record(self.memory, rec)
+        self.storage.append(rec)
+        if rec.get("op") == "accept":
+            self._update_log_global(rec["w"])
+
+    def _publish(self) -> None:
+        # _lock 안에서 호출: 변경을 마친 뒤 추천용 스냅샷을 새로 만들어 바꿔 끼운다
+        mem = self.memory
+        self._view = SuggestView(
+            {name: trie.snapshot() for name, trie in self._index.items()},
+            mem["vocab"], self._accept_log, self._decay_rate, mem["corpus"], mem["ngrams"].view(),
+        )
+
+    def _mark_dirty(self) -> None:
+        # 변경 1회 기록 — 동기 모드면 즉시 저장, write-behind면 flusher에 맡김,
+        # 로그 백엔드(wal)면 이미 로그에 있으니 크기만 보고 압축(compaction)을 깨운다
+        if self._closed or not (self.write_behind or self.storage.logs_ops):
+            self.save_memory()
+            return
+        with self._lock:
+            self._dirty_ops += 1
+            due = self._dirty_ops >= self.flush_ops
+        if self.storage.logs_ops:
+            due = self.storage.needs_compaction()
+        if due:
+            self._flush_event.set()
+
+    def flush(self) -> bool:
+        """밀린 변경이 있으면 저장(wal 모드: 로그 fsync)하고 True 반환."""
+        with self._lock:
+            if not self._dirty_ops:
+                return False
+            if self.storage.logs_ops:
+                self.storage.sync()
+                self._dirty_ops = 0
+                return True
+        try:
+            self.save_memory()
+        except (OSError, sqlite3.Error) as e:
+            # 다음 주기에 재시도
+            with self._lock:
+                self._dirty_ops = max(self._dirty_ops, 1)
+            print(f"⚠️ flush failed: {e}")
+            return False
+        return True
+
+    def _flush_loop(self) -> None:
+        while not self._closed:
+            self._flush_event.wait(self.flush_interval)
+            self._flush_event.clear()
+            if self._closed:
+                break
+            try:
+                self.flush()
+            except (OSError, sqlite3.Error) as e:
+                # wal 모드의 로그 fsync 실패 — _dirty_ops 가 남아 있으니 다음 주기에 재시도
+                print(f"⚠️ flush failed: {e}")
+                continue
+            if self.storage.needs_compaction():
+                try:
+                    self.save_memory()
+                except (OSError, sqlite3.Error) as e:
+                    # 로그는 그대로 남아 있다 — 다음 주기에 다시 접는다
+                    print(f"⚠️ WAL compaction failed: {e}")
+
+    def close(self) -> None:
+        """flusher 스레드를 멈추고 남은 변경을 저장. 여러 번 호출해도 안전."""
+        if self._closed:
+            return
+        self._closed = True
+        self._flush_event.set()
+        if self._flusher is not None and self._flusher is not threading.current_thread():
+            self._flusher.join(timeout=self.flush_interval + 5)
+        # 이미지가 지금 스냅샷과 짝이 안 맞으면 (그 사이 주기 저장이 있었으면) 여기서 함께 쓴다
+        stale_image = self.storage.image_path is not None and not self._image_current
+        if self.storage.logs_ops:
+            # 다음 시작이 재생 없이 뜨도록 스냅샷으로 접는다
+            if self.storage.log_bytes or stale_image:
+                self.save_memory(with_image=True)
+        elif stale_image or (self._dirty_ops and self.storage.image_path is not None):
+            self.save_memory(with_image=True)
+        else:
+            self.flush()
+        with self._lock:
+            self.storage.close()
+        atexit.unregister(self.close)
+
+    def memory_footprint(self) -> int:
+        """
+        대략적인 상주 메모리(바이트) — 캐시/LRU 예산 계산용 추정치.
+        다른 스레드가 쓰는 중에도 불리므로 (LRU 정리, /health) 사전 순회는 락 안에서 하고,
+        쓰는 중이라 락을 바로 못 잡으면 지난번 값을 돌려준다 (매니저 락을 든 채 기다리지 않게)
+        """
+        if not self._lock.acquire(blocking=False):
+            return self._footprint
+        try:
+            if self._memory is None:
+                # 아직 mmap 스냅샷만 — 매핑 크기 (실제 상주는 읽은 페이지만큼)
+                self._footprint = self._view.nbytes
+                return self._footprint
+            words = sum(len(v) for v in self.memory["user_dict"].values())
+            words += len(self.memory["ngrams"].e_ctx) // 5
+            vocab = len(self.memory["vocab"])
+            doc_entries = sum(len(tf) for tf in self.memory["doc_freq"].values())
+            doc_entries += 2 * sum(
+                len(d.get("accept_counts", {})) for d in self.memory["per_doc_accept"].values()
+            )
+            live_text = sum(len(d["text"]) for d in self._live_docs.values())
+        finally:
+            self._lock.release()
+        # 희소 배열 항목 ~10B, 어휘 단어(문자열 + ID 표 + 전역 열) ~120B,
+        # 색인 단어(트라이 노드 포함) ~300B, 문자열 ~2B/글자
+        self._footprint = 10 * doc_entries + 120 * vocab + 300 * words + 2 * live_text
+        return self._footprint
+
+    # ------------------ Tokenization ------------------
+
+    def iter_tokens(
+        self,
+        source,
+        caps: Optional[Dict[str, Optional[int]]] = None,
+        chunk_size: int = 1 << 16,
+    ) -> Iterator[Tuple[str, str]]:
+        """
+        (언어, 토큰) 을 본문 순서대로 한 번의 순회로 내보낸다 (스트리밍).
+        - source: str / 파일 객체 / 문자열 청크 iterable (iter_text_chunks 참고)
+        - 영어 토큰은 소문자화(1회)된 형태, 불용어/길이 초과는 제외
+        - caps: 언어별 상한 (기본 self.token_caps, None 값은 무제한).
+          상한에 찬 언어는 건너뛰고, 모든 언어가 차면 나머지 본문은 읽지도 않는다
+        """
+        caps = self.token_caps if caps is None else caps
+        left = {
+            lang: math.inf if caps.get(lang) is None else caps[lang]
+            for lang in ("ko", "en")
+        }
+        open_langs = sum(1 for n in left.values() if n > 0)
+        if not open_langs:
+            return
+        seen: Dict[str, object] = {}
+        for piece in iter_text_chunks(source, chunk_size):
+            for w in _TOKEN_RE.findall(piece):
+                hit = seen.get(w)
+                if hit is None:
+                    norm = self._normalize_token(w)
+                    hit = seen[w] = (("ko" if w[0] >= "가" else "en"), norm) if norm else False
+                if not hit or left[hit[0]] <= 0:
+                    continue
+                yield hit
+                left[hit[0]] -= 1
+                if left[hit[0]] <= 0:
+                    open_langs -= 1
+                    if not open_langs:
+                        return
+
+    def count_tokens(
+        self,
+        source,
+        caps: Optional[Dict[str, Optional[int]]] = None,
+        chunk_size: int = 1 << 16,
+        grams: Optional[Counter] = None,
+    ) -> Dict[str, Counter]:
+        # 스트림을 언어별 Counter로 바로 집계 (토큰 목록을 만들지 않음)
+        # grams 를 넘기면 같은 순회에서 2/3-gram 도 센다 (ngram_counts 와 같은 키)
+        counts: Dict[str, Counter] = {"ko": Counter(), "en": Counter()}
+        if grams is None:
+            for lang, w in self.iter_tokens(source, caps, chunk_size):
+                counts[lang][w] += 1
+            return counts
+        p2 = p1 = None
+        for lang, w in self.iter_tokens(source, caps, chunk_size):
+            counts[lang][w] += 1
+            if p1 is not None:
+                grams[p1, w] += 1
+                if p2 is not None:
+                    grams[p2, p1, w] += 1
+            p2, p1 = p1, w
+        return counts
+
+    def _context_tokens(self, text: str, pos: int, before: bool, n: int = 2) -> List[str]:
+        # 토큰 경계 pos 의 앞(또는 뒤) 토큰 n 개 — 창을 넓혀 가며 찾는다 (불용어는 건너뜀)
+        span = 64
+        while True:
+            if before:
+                lo = max(0, pos - span)
+                while lo > 0 and _TOKEN_CHAR.match(text, lo - 1):
+                    lo -= 1
+                toks = [w for _, w in self.iter_tokens(text[lo:pos], caps={})]
+                if len(toks) >= n or lo == 0:
+                    return toks[-n:]
+            else:
+                hi = min(len(text), pos + span)
+                while hi < len(text) and _TOKEN_CHAR.match(text, hi):
+                    hi += 1
+                toks = [w for _, w in self.iter_tokens(text[pos:hi], caps={})]
+                if len(toks) >= n or hi == len(text):
+                    return toks[:n]
+            span *= 4
+
+    def _normalize_token(self, w: str) -> Optional[str]:
+        # 토큰 1개 필터/정규화: 불용어·길이 초과면 None
+        if w[0] >= "가":
+            return w if len(w) <= 20 and w not in self.stop_ko else None
+        lw = w.lower()
+        return lw if len(w) <= 24 and lw not in self.stop_en else None
+
+    def _tokenize(self, text: str) -> Dict[str, List[str]]:
+        # 상한 없는 언어별 토큰 목록 (단일 패스)
+        ko: List[str] = []
+        en: List[str] = []
+        # 같은 표면형은 필터/소문자화 결과를 재사용 (실제 문서는 토큰 반복이 많다)
+        seen: Dict[str, object] = {}
+        for w in _TOKEN_RE.findall(text or ""):
+            hit = seen.get(w)
+            if hit is None:
+                norm = self._normalize_token(w)
+                hit = seen[w] = ((ko if w[0] >= "가" else en).append, norm) if norm else False
+            if hit:
+                hit[0](hit[1])
+        return {"ko": ko, "en": en}
+
+    def extract_tokens(self, text) -> Dict[str, List[str]]:
+        """
+        텍스트에서 언어별 토큰 목록 추출.
+        - 한글: 2글자 이상
+        - 영어: 3글자 이상, 소문자화
+        - 불용어 제거
+        - 언어별 self.token_caps 개까지 (상한에 차면 스캔을 멈춘다)
+        """
+        tokens: Dict[str, List[str]] = {"ko": [], "en": []}
+        for lang, w in self.iter_tokens(text):
+            tokens[lang].append(w)
+        return tokens
+
+    # ------------------ Learning ------------------
+
+    def _doc_lock(self, doc_id: Optional[str]) -> threading.Lock:
+        # 문서별 줄무늬 잠금 — 같은 문서의 관찰은 순서대로, 다른 문서끼리는 병행
+        return self._doc_locks[hash(doc_id) % len(self._doc_locks)]
+
+    def observe_text_incremental(self, doc_id: str, current_text) -> None:
+        """
+        현재 문서의 전체 텍스트를 넣어주면 TF를 갱신하고,
+        사용자 사전을 최신 빈도로 동기화한다.
+        - 프런트엔드: 키 입력(debounce 500~1200ms 권장) 때마다 호출
+        - current_text 는 파일 객체/청크 iterable 도 가능 (스트리밍 토큰화, 상한 도달 시 중단).
+          이 경우 본문을 보관하지 않으므로 이후 델타 관찰은 재동기화를 요구한다
+        """
+        with self._doc_lock(doc_id):
+            self._ensure_doc(doc_id)
+            # 토큰화는 문서 잠금만 쥐고 (추천/다른 문서 관찰을 막지 않음), 반영만 브레인 잠금 안에서
+            grams: Counter = Counter()
+            counts = self.count_tokens(current_text, grams=grams)
+            new_tf = dict(counts["ko"] + counts["en"])
+            with self._lock:
+                self._apply_observation(doc_id, current_text, counts, new_tf, grams)
+
+    def _apply_observation(self, doc_id: str, current_text, counts, new_tf, grams: Counter) -> None:
+        # _lock 안에서 호출
+        old_tf = self.memory["doc_freq"].get(doc_id, {})
+        # n-gram 은 이 문서가 표에 더해 둔 몫과의 차이만 반영한다.
+        # 그 몫을 모르면(재시작/LRU로 밀려남) 새 문서만 학습하고, 기존 문서는 기준점만 잡는다
+        state = self._live_docs.get(doc_id)
+        prev_grams = state.get("grams") if state else None
+        if prev_grams is None and not old_tf:
+            prev_grams = Counter()
+        if prev_grams is not None:
+            self._commit_ngrams(grams, prev_grams)
+        self._commit({
+            "op": "tf",
+            "doc": doc_id,
+            "set": {w: c for w, c in new_tf.items() if old_tf.get(w) != c},
+            "del": [w for w in old_tf if w not in new_tf],
+        })
+        if current_text is None or isinstance(current_text, str):
+            self._remember_text(doc_id, current_text, grams)
+        else:
+            self._live_docs.pop(doc_id, None)
+
+        for lang in ("ko", "en"):
+            self._sync_user_dict(lang, counts[lang])
+
+        self._publish()
+        self._mark_dirty()
+
+    def observe_text_delta(
+        self,
+        doc_id: str,
+        offset: int,
+        deleted: int,
+        inserted: str,
+        base_length: Optional[int] = None,
+    ) -> bool:
+        """
+        편집 델타(offset 위치에서 deleted 글자 삭제 후 inserted 삽입)만 반영한다.
+        편집 구간을 토큰 경계까지 넓힌 창만 다시 토큰화해서 문서 Counter를 갱신.
+        - 서버에 이 문서의 직전 텍스트가 없거나 base_length가 어긋나면 False 반환
+          → 클라이언트는 observe_text_incremental(전체 텍스트)로 재동기화
+        - 델타 경로의 TF는 문서 전체 토큰 기준(token_caps 상한 없음)
+        """
+        with self._doc_lock(doc_id), self._lock:
+            state = self._live_docs.get(doc_id)
+            self._ensure_doc(doc_id)
+            if state is None:
+                return False
+            text = state["text"]
+            if base_length is not None and base_length != len(text):
+                return False
+            if offset < 0 or deleted < 0 or offset + deleted > len(text):
+                return False
+            inserted = inserted or ""
+            self._live_docs.move_to_end(doc_id)
+
+            counts = state["counts"]
+            if counts is None:
+                # 전체 관찰 직후 첫 델타: 상한 없는 Counter를 한 번만 만든다
+                toks = self._tokenize(text)
+                counts = state["counts"] = Counter(toks["ko"] + toks["en"])
+
+            # 편집 구간을 양쪽 토큰 경계까지 확장
+            left = offset
+            while left > 0 and _TOKEN_CHAR.match(text, left - 1):
+                left -= 1
+            right = offset + deleted
+            while right < len(text) and _TOKEN_CHAR.match(text, right):
+                right += 1
+
+            old_toks = self._tokenize(text[left:right])
+            new_window = text[left:offset] + inserted + text[offset + deleted:right]
+            new_toks = self._tokenize(new_window)
+
+            grams = state.get("grams")
+            if grams is not None:
+                # 창 토큰 열이 바뀌었으면 양옆 2토큰씩 붙여서 창에 걸친 n-gram 차이만 반영
+                old_seq = [w for _, w in self.iter_tokens(text[left:right], caps={})]
+                new_seq = [w for _, w in self.iter_tokens(new_window, caps={})]
+                if old_seq != new_seq:
+                    lctx = self._context_tokens(text, left, True)
+                    rctx = self._context_tokens(text, right, False)
+                    before = ngram_counts(lctx + old_seq + rctx)
+                    after = ngram_counts(lctx + new_seq + rctx)
+                    grams.update(after)
+                    grams.subtract(before)
+                    for key in before:
+                        if grams[key] <= 0:
+                            del grams[key]
+                    self._commit_ngrams(after, before)
+            state["text"] = text[:offset] + inserted + text[offset + deleted:]
+
+            counts.subtract(old_toks["ko"] + old_toks["en"])
+            counts.update(new_toks["ko"] + new_toks["en"])
+            gone = [w for w in set(old_toks["ko"] + old_toks["en"]) if counts[w] <= 0]
+            for w in gone:
+                del counts[w]
+            # 건드린 단어만 문서 TF에 반영 (전체 TF가 델타 경로 기준이 아니면 한 번 통째로 맞춤)
+            tf = self.memory["doc_freq"].get(doc_id)
+            if state.get("synced"):
+                touched = set(old_toks["ko"] + old_toks["en"] + new_toks["ko"] + new_toks["en"])
+                upd = {w: counts[w] for w in touched if counts[w] > 0}
+            else:
+                upd = {w: c for w, c in counts.items() if (tf or {}).get(w) != c}
+                gone = [w for w in (tf or {}) if w not in counts]
+                state["synced"] = True
+            self._commit({"op": "tf", "doc": doc_id, "set": upd, "del": gone})
+
+            # 빈도가 오른 단어만 사용자 사전 후보
+            for lang in ("ko", "en"):
+                touched = Counter({w: counts[w] for w in set(new_toks[lang])})
+                self._sync_user_dict(lang, touched)
+
+            self._publish()
+            self._mark_dirty()
+            return True
+
+    def bulk_observe(
+        self,
+        docs,
+        workers: int = 0,
+        batch_size: int = 256,
+        shard_size: int = 32,
+    ) -> Dict[str, int]:
+        """
+        (doc_id, 본문) 묶음을 한꺼번에 학습 (문서 아카이브로 브레인 예열/재색인).
+        - 본문: str / 파일 경로(os.PathLike) / 파일 객체
+        - map: shard_size 개 문서 묶음(샤드)마다 문서별 TF + 샤드 언어별 Counter/DF/n-gram 합계 계산
+        - reduce: 샤드마다 새 문서 TF 와 DF 를 tfs 레코드 하나로 반영하고, 언어별 Counter를 합쳐
+          batch_size 개 문서마다 사용자 사전 동기화 (문서마다 저장하지 않음)
+        - 저장은 맨 끝에 한 번
+        - workers > 1 이면 map 을 프로세스 풀에서 (경로는 워커가 직접 읽는다), 음수면 CPU 수
+        반환: {"docs": 문서 수, "tokens": 반영된 토큰 수}
+        """
+        if workers < 0:
+            workers = os.cpu_count() or 1
+        stats = {"docs": 0, "tokens": 0}
+        freq = {"ko": Counter(), "en": Counter()}
+        since_sync = 0
+        for tfs, shard_freq, shard_df, shard_rows in self._map_shards(docs, workers, max(1, shard_size)):
+            with self._lock:
+                self._reduce_shard(tfs, shard_df, shard_rows, stats)
+                for lang in ("ko", "en"):
+                    freq[lang].update(shard_freq[lang])
+                since_sync += len(tfs)
+                if since_sync >= batch_size:
+                    # 사용자 사전은 배치 전체 빈도로 (여러 문서에 걸쳐 나온 단어가 후보가 된다)
+                    for lang in ("ko", "en"):
+                        self._sync_user_dict(lang, freq[lang])
+                        freq[lang].clear()
+                    since_sync = 0
+                self._publish()
+        if since_sync:
+            with self._lock:
+                for lang in ("ko", "en"):
+                    self._sync_user_dict(lang, freq[lang])
+                self._publish()
+        self.save_memory()
+        return stats
+
+    def _map_shards(self, docs, workers: int, shard_size: int):
+        # 샤드 결과를 입력 순서대로 내보낸다
+        shards = _iter_shards(docs, shard_size)
+        if workers <= 1:
+            for shard in shards:
+                yield _count_shard(self, shard)
+            return
+        # 진행 중인 샤드 수를 제한해서 입력 전체를 한 번에 메모리에 올리지 않는다
+        with ProcessPoolExecutor(
+            workers, initializer=_init_token_worker,
+            initargs=(self.stop_ko, self.stop_en, dict(self.token_caps)),
+        ) as pool:
+            pending: deque = deque()
+            for shard in shards:
+                # 파일 객체는 넘길 수 없으니 여기서 읽어서 보낸다
+                shard = [(d, src.read() if hasattr(src, "read") else src) for d, src in shard]
+                pending.append(pool.submit(_count_shard_in_worker, shard))
+                if len(pending) >= workers * 2:
+                    yield pending.popleft().result()
+            while pending:
+                yield pending.popleft().result()
+
+    def _reduce_shard(
+        self,
+        tfs: List[Tuple[str, Dict[str, int], Counter]],
+        shard_df: Counter,
+        shard_rows: List[list],
+        stats: Dict[str, int],
+    ) -> None:
+        # _lock 안에서 호출. TF 가 없던 새 문서는 tfs 레코드 하나로 (워커가 합친 DF 를 그대로),
+        # 이미 TF 가 있는 문서만 문서별 tf 레코드로 차이를 반영한다
+        fresh: Dict[str, Dict[str, int]] = {}
+        seen: List[Tuple[str, Dict[str, int]]] = []
+        fresh_grams: List[Counter] = []
+        for doc_id, new_tf, grams in tfs:
+            self._ensure_doc(doc_id)
+            if doc_id not in fresh and not self.memory["doc_freq"].get(doc_id):
+                fresh[doc_id] = new_tf
+                # 새 문서만 n-gram 학습 (기존 문서는 이전 몫을 모름 — observe_text_incremental 참고)
+                fresh_grams.append(grams)
+            else:
+                seen.append((doc_id, new_tf))
+            # 본문은 보관하지 않음 → 이후 델타 관찰은 재동기화부터
+            self._live_docs.pop(doc_id, None)
+            stats["docs"] += 1
+            stats["tokens"] += sum(new_tf.values())
+        if seen:
+            # 샤드 DF 에서 기존 문서 몫을 빼면 새 문서 몫만 남는다
+            shard_df = Counter(shard_df)
+            for _, new_tf in seen:
+                shard_df.subtract(new_tf.keys())
+            shard_df = Counter({w: n for w, n in shard_df.items() if n > 0})
+        if fresh:
+            self._commit({"op": "tfs", "docs": fresh, "df": shard_df})
+        for doc_id, new_tf in seen:
+            # 위에서 올린 문서가 그 사이 내려갔을 수 있다 (lazy_docs)
+            self._ensure_doc(doc_id)
+            old_tf = self.memory["doc_freq"].get(doc_id, {})
+            self._commit({
+                "op": "tf",
+                "doc": doc_id,
+                "set": {w: c for w, c in new_tf.items() if old_tf.get(w) != c},
+                "del": [w for w in old_tf if w not in new_tf],
+            })
+        # 샤드의 n-gram 은 ng 레코드 하나로 (전부 새 문서면 워커가 만들어 둔 행을 그대로)
+        if len(fresh_grams) == len(tfs):
+            if shard_rows:
+                self._commit({"op": "ng", "d": shard_rows})
+            return
+        shard_grams: Counter = Counter()
+        for grams in fresh_grams:
+            shard_grams.update(grams)
+        self._commit_ngrams(shard_grams, Counter())
+
+    def _commit_ngrams(self, new: Counter, old: Counter) -> None:
+        # _lock 안에서 호출: 두 n-gram Counter 의 차이만 ng 레코드 하나로 (표에는 add_many 로 한 번에)
+        if old:
+            diff = Counter(new)
+            diff.subtract(old)
+        else:
+            diff = new
+        rows = [[*key, d] for key, d in diff.items() if d]
+        if rows:
+            self._commit({"op": "ng", "d": rows})
+
+    def _remember_text(self, doc_id: str, text: str, grams: Optional[Counter] = None) -> None:
+        self._live_docs[doc_id] = {"text": text or "", "counts": None, "grams": grams}
+        self._live_docs.move_to_end(doc_id)
+        while len(self._live_docs) > self.max_live_docs:
+            self._live_docs.popitem(last=False)
+
+    def _sync_user_dict(self, lang: str, freq: Counter) -> None:
+        # 사용자 사전 동기화 — 이번에 빈도가 바뀐 단어(freq)만 본다 (사전 전체는 훑지 않음)
+        # 노이즈 제거: 2회 이상 등장한 단어 중 많이 나온 것부터, 남은 자리(용량 캡)만큼
+        words = self.memory["user_dict"].setdefault(lang, [])
+        members = self._user_dict_members.get(lang)
+        if members is None or len(members) != len(words):
+            # 처음이거나 목록이 통째로 바뀌었다 (재생/직접 대입)
+            members = self._user_dict_members[lang] = set(words)
+        cap = self.user_dict_caps[lang]
+        room = cap - len(words)
+        added = heapq.nlargest(
+            room, (w for w, c in freq.items() if c >= 2 and w not in members), key=freq.__getitem__
+        ) if room > 0 else []
+        # 캡을 넘은 만큼(캡을 낮춰 다시 띄운 경우 등)은 오래된 것부터 뺀다
+        removed = words[:len(words) - cap] if room < 0 else []
+        if added or removed:
+            self._commit({"op": "dict", "lang": lang, "add": added, "del": removed})
+            members.difference_update(removed)
+            members.update(added)
+            self._sync_index(lang, added, removed)
+
+    # ------------------ Scoring ------------------
+    # 점수/추천 메서드는 v(SuggestView) 하나만 읽는다 — 생략하면 지금 공개된 스냅샷 (doc_id 를 붙여서)
+
+    def _read_view(self, doc_id: Optional[str]) -> SuggestView:
+        # mmap 스냅샷(ImageView)은 메모리 dict 없이 pin 한다 — 추천만으로는 JSON 을 올리지 않음
+        v = self._view
+        return v.pin(self._memory, doc_id) if doc_id else v
+
+    def _decay_score(self, count: int, last_ts_ms: Optional[int], now: Optional[int] = None) -> float:
+        d = days_since(last_ts_ms, now)  # 일수
+        return (count or 0) * (self.decay_daily ** d)
+
+    def _context_score(self, word: str, doc_id: Optional[str], v: Optional[SuggestView] = None) -> float:
+        if not doc_id:
+            return 0.0
+        v = v or self._read_view(doc_id)
+        tf = v.tf.get(word, 0) if v.tf else 0
+        if not tf:
+            return 0.0
+        if self.context_mode == "tf":
+            # 문서 내 자주 등장할수록 가산점(상한 완만)
+            return 0.2 * min(5, tf)
+        # 흔한 단어(많은 문서에 나오는 단어)는 IDF 로 눌러 준다
+        idf = self._idf_norm(word, v)
+        if self.context_mode == "tfidf":
+            return 0.2 * min(5, tf) * idf
+        k1 = self.bm25_k1
+        avgdl = v.n_tokens / v.n_docs if v.n_docs else 0.0
+        norm = 1.0 - self.bm25_b + self.bm25_b * (v.tf.total() / avgdl) if avgdl else 1.0
+        # tf 포화항 tf / (tf + k1·norm) 은 0~1 (BM25 의 (k1 + 1) 배율은 뺐다)
+        return idf * tf / (tf + k1 * norm)
+
+    def idf(self, word: str, v: Optional[SuggestView] = None) -> float:
+        """BM25 IDF: ln(1 + (N - df + 0.5) / (df + 0.5)) — 전역 DF 기준 O(1)."""
+        v = v or self._view
+        df = v.df.get(word, 0)
+        return math.log(1.0 + (v.n_docs - df + 0.5) / (df + 0.5))
+
+    def _idf_norm(self, word: str, v: Optional[SuggestView] = None) -> float:
+        # 문서 1개에만 나오는 단어(df=1)를 1.0 으로 맞춘 IDF
+        v = v or self._view
+        n = v.n_docs
+        top = math.log(1.0 + (n - 0.5) / 1.5) if n > 1 else 0.0
+        return min(1.0, self.idf(word, v) / top) if top > 0 else 1.0
+
+    def _per_doc_accept_score(
+        self, word: str, doc_id: Optional[str], now: Optional[int] = None, v: Optional[SuggestView] = None
+    ) -> float:
+        if not doc_id:
+            return 0.0
+        v = v or self._read_view(doc_id)
+        if v.doc_accept is None:
+            return 0.0
+        counts, last_used = v.doc_accept
+        return 1.2 * self._decay_score(counts.get(word, 0), last_used.get(word, 0), now)
+
+    def _global_score(self, word: str, now: Optional[int] = None, v: Optional[SuggestView] = None) -> float:
+        # 전역 강화 점수(감쇠) = exp(로그 점수 - 기준 시각 이후 감쇠량)
+        v = v or self._view
+        return math.exp(self._log_global(word, v) - self._decay_shift(now or now_ms(), v))
+
+    def _log_global(self, word: str, v: Optional[SuggestView] = None) -> float:
+        v = v or self._view
+        i = v.vocab.get(word)
+        table = v.accept_log
+        return table[i] if i is not None and i < len(table) else -math.inf
+
+    def _decay_shift(self, now: int, v: Optional[SuggestView] = None) -> float:
+        # 기준 시각부터 now 까지의 감쇠량 (로그 공간) — 요청마다 한 번만 계산
+        return (v or self._view).decay_rate * (now - DECAY_EPOCH_MS)
+
+    def _update_log_global(self, word: str) -> float:
+        """
+        전역 수락 점수를 시간 정규화된 로그 값으로 저장:
+            log(count) + rate × (last_used_at - 기준 시각)   (rate = -ln(decay_daily) / 1일)
+        현재 점수는 exp(로그 값 - rate × (now - 기준 시각)) 이라 순위는 로그 값만으로 정해지고,
+        수락할 때만 바뀌며(항상 커짐) 시간이 흘러도 그대로다 → 트라이 노드 상한을 다시 훑을 필요가 없다.
+        """
+        i = self.memory["vocab"].intern(word)
+        table = self._accept_log
+        if table is self._view.accept_log:
+            # 공개된 표는 고치지 않는다
+            table = self._accept_log = table[:]
+        if i >= len(table):
+            table.extend([-math.inf] * (len(self.memory["vocab"]) - len(table)))
+        table[i] = self._log_value(
+            self.memory["accept_counts"].get(word, 0), self.memory["last_used_at"].get(word))
+        return table[i]
+
+    def _log_value(self, count: int, ts: Optional[int]) -> float:
+        return math.log(count) + self._decay_rate * (ts - DECAY_EPOCH_MS) if count and ts else -math.inf
+
+    def _score_word(
+        self, word: str, doc_id: Optional[str], now: Optional[int] = None, v: Optional[SuggestView] = None
+    ) -> float:
+        # 전역 강화 + 문서별 강화 + 컨텍스트 TF 점수
+        v = v or self._read_view(doc_id)
+        return (
+            self._global_score(word, now, v)
+            + self._per_doc_accept_score(word, doc_id, now, v)
+            + self._context_score(word, doc_id, v)
+        )
+
+    def _score_batch(
+        self, words: List[str], doc_id: Optional[str], now: int, v: Optional[SuggestView] = None
+    ) -> List[float]:
+        """
+        _score_word 의 일괄 버전 — 요청 하나의 후보 전체를 같은 now 로 계산.
+        NumPy 가 있고 후보가 batch_score_min 개 이상이면 전역 감쇠/문서별 수락 감쇠/컨텍스트 점수를
+        단어 ID 배열 연산으로 한 번에 구한다.
+        """
+        v = v or self._read_view(doc_id)
+        if np is None or len(words) < self.batch_score_min:
+            return [self._score_word(w, doc_id, now, v) for w in words]
+        get = v.vocab.ids.get
+        ids = np.fromiter((get(w, -1) for w in words), dtype=np.int64, count=len(words))
+        log_g = np.full(len(ids), -np.inf)
+        table = v.accept_log
+        ok = np.flatnonzero((ids >= 0) & (ids < len(table)))
+        if len(ok):
+            log_g[ok] = itemgetter(*ids[ok].tolist())(table)
+        score = np.exp(log_g - self._decay_shift(now, v))
+        if doc_id:
+            if v.doc_accept:
+                counts, last_used = v.doc_accept
+                score += 1.2 * self._decay_batch(
+                    _gather_sparse(counts, ids), _gather_sparse(last_used, ids), now)
+            if v.tf:
+                score += self._context_batch(_gather_sparse(v.tf, ids).astype(np.float64), ids, v)
+        return score.tolist()
+
+    def _decay_batch(self, counts, ts, now: int):
+        # _decay_score 와 같은 식 (시각 없음 = 9999일)
+        days = np.where(ts > 0, np.maximum(0.0, (now - ts) / (1000.0 * 60 * 60 * 24)), 9999.0)
+        return counts * np.power(self.decay_daily, days)
+
+    def _context_batch(self, tf, ids, v: SuggestView):
+        # _context_score 와 같은 식 (tf = 0 인 칸은 0)
+        if self.context_mode == "tf":
+            return 0.2 * np.minimum(5.0, tf)
+        n = v.n_docs
+        df = _gather(v.df, ids)
+        top = math.log(1.0 + (n - 0.5) / 1.5) if n > 1 else 0.0
+        if top > 0:
+            idf = np.minimum(1.0, np.log(1.0 + (n - df + 0.5) / (df + 0.5)) / top)
+        else:
+            idf = np.ones_like(tf)
+        if self.context_mode == "tfidf":
+            return 0.2 * np.minimum(5.0, tf) * idf
+        k1 = self.bm25_k1
+        avgdl = v.n_tokens / n if n else 0.0
+        norm = 1.0 - self.bm25_b + self.bm25_b * (v.tf.total() / avgdl) if avgdl else 1.0
+        return idf * tf / (tf + k1 * norm)
+
+    # ------------------ Suggestion ------------------
+
+    def _lang_of_prefix(self, prefix: str) -> str:
+        # 조합 중인 자모(ㄱ~ㅣ)도 한국어
+        return "ko" if _HANGUL_RE.search(prefix) else "en"
+
+    def _route_prefix(self, prefix: str, v: Optional[SuggestView] = None) -> PrefixTrie:
+        # 자음만으로 된 접두사(ㅈㅇㅈㅎ)는 초성 색인, 그 밖의 한국어는 자모 색인
+        index = (v or self._view).index
+        if self._lang_of_prefix(prefix) == "en":
+            return index["en"]
+        if _CHOSEONG_QUERY.fullmatch(prefix):
+            return index["ko_cho"]
+        return index["ko"]
+
+    def _tries(self, lang: str) -> List[PrefixTrie]:
+        # 쓰는 쪽(_lock 안)이 고치는 현재 색인
+        return [self._index["ko"], self._index["ko_cho"]] if lang == "ko" else [self._index["en"]]
+
+    def _candidate_pool(self, lang: str) -> List[str]:
+        base = self.dict_ko_base if lang == "ko" else self.dict_en_base
+        user = self.memory["user_dict"].get(lang, [])
+        # 순서 보존하며 중복 제거
+        seen = set()
+        out = []
+        for w in user + base:
+            if w not in seen:
+                seen.add(w)
+                out.append(w)
+        return out
+
+    def rebuild_index(self) -> None:
+        """기본 사전(dict_*_base)이나 decay_daily 를 바꾼 뒤에는 이 메서드로 색인을 다시 만든다."""
+        # 로그 공간 전역 수락 점수 (트라이 상한도 이 값)
+        self._decay_rate = -math.log(self.decay_daily) / (1000.0 * 60 * 60 * 24)
+        vocab = self.memory["vocab"]
+        # 색인 단어도 어휘에 올린다 (뷰 이미지는 색인 단어를 어휘 ID 로 적는다)
+        pools = {lang: self._candidate_pool(lang) for lang in ("ko", "en")}
+        for words in pools.values():
+            for w in words:
+                vocab.intern(w)
+        table = array("d", [-math.inf]) * len(vocab)
+        last_used = self.memory["last_used_at"]
+        for w, cnt in self.memory["accept_counts"].items():
+            table[vocab.get(w)] = self._log_value(cnt, last_used.get(w))
+        self._accept_log = table
+        # 한국어는 자모 분해 키 + 초성 키 두 벌 (키는 넣을 때 계산 → 키 입력 경로는 조회만)
+        for name, key in _TRIE_KEYS.items():
+            trie = PrefixTrie(key)
+            for w in pools["en" if name == "en" else "ko"]:
+                trie.add(w, self._live_log(w))
+            self._index[name] = trie
+        self._publish()
+
+    def _live_log(self, word: str) -> float:
+        # 쓰는 쪽이 보는 최신 로그 점수 (공개된 스냅샷보다 앞설 수 있다)
+        i = self.memory["vocab"].get(word)
+        table = self._accept_log
+        return table[i] if i is not None and i < len(table) else -math.inf
+
+    def _sync_index(self, lang: str, added: List[str], removed: List[str]) -> None:
+        # user_dict 변경분만 색인에 반영 (기본 사전 단어는 유지)
+        base = self.dict_ko_base if lang == "ko" else self.dict_en_base
+        base_set = set(base) if removed else set()
+        for w in added:
+            self.memory["vocab"].intern(w)
+        for trie in self._tries(lang):
+            for w in removed:
+                if w not in base_set:
+                    trie.remove(w)
+            for w in added:
+                trie.add(w, self._live_log(w))
+
+    def _doc_words(self, doc_id: Optional[str], v: Optional[SuggestView] = None) -> set:
+        # 문서별 점수(TF/문서 수락)가 붙는 단어들 — 전역 상한만으로는 가지치기 불가
+        if not doc_id:
+            return set()
+        v = v or self._read_view(doc_id)
+        words = set(v.tf or ())
+        if v.doc_accept:
+            words.update(v.doc_accept[0])
+        return words
+
+    def _prev_tokens(self, prev: Optional[str]) -> List[str]:
+        # 커서 앞 텍스트의 마지막 2토큰 (n-gram 문맥)
+        if not prev:
+            return []
+        return self._context_tokens(prev, len(prev), True)
+
+    def _ngram_bonus(
+        self, ctx: List[str], p: str, key=str.lower, v: Optional[SuggestView] = None
+    ) -> Dict[str, float]:
+        # 문맥 다음에 나온 단어 중 (색인 키 기준) 접두사 p 로 시작하는 것들의 n-gram 가산점 (stupid backoff)
+        table = (v or self._view).ngrams
+        probs: Dict[str, float] = {}
+        if len(ctx) >= 2:
+            succ, total = table.successors(tuple(ctx[-2:]))
+            for w, c in succ:
+                if key(w).startswith(p):
+                    probs[w] = c / total
+        if ctx:
+            succ, total = table.successors((ctx[-1],))
+            for w, c in succ:
+                if w not in probs and key(w).startswith(p):
+                    probs[w] = self.ngram_backoff * c / total
+        return {w: self.ngram_weight * pr for w, pr in probs.items()}
+
+    def get_suggestions_scored(
+        self,
+        prefix: str,
+        doc_id: Optional[str] = None,
+        top_n: int = 8,
+        prev: Optional[str] = None,
+        fuzzy: int = 0,
+    ) -> List[Tuple[str, float]]:
+        """
+        (단어, 점수) 상위 top_n 을 (-점수, 단어) 순으로 반환.
+        접두사 하위 트리를 best-first 로 훑으며 노드 상한(best)이
+        이미 뽑힌 결과보다 낮은 가지는 열지 않는다.
+        - prev: 커서 앞 텍스트 — 마지막 2토큰을 문맥으로 n-gram 가산점을 더한다.
+          prefix 가 비어 있으면 문맥 다음에 나왔던 단어만으로 다음 단어를 제안
+        - fuzzy: 정확히 맞는 결과가 top_n 에 못 미치면 편집 거리 1~fuzzy(최대 2) 의
+          접두사로 나머지를 채운다 (정확 일치가 항상 먼저)
+        잠금을 잡지 않는다: 마지막으로 공개된 스냅샷(SuggestView)만 읽으므로 여러 스레드에서
+        동시에 불러도 관찰/수락 반영을 기다리지 않고, 반쯤 고쳐진 상태도 보지 않는다.
+        """
+        if top_n <= 0:
+            return []
+        self._ensure_doc(doc_id)
+        return self._suggest_scored(prefix, doc_id, top_n, prev, fuzzy, self._read_view(doc_id))
+
+    def _suggest_scored(
+        self, prefix: str, doc_id: Optional[str], top_n: int, prev: Optional[str], fuzzy: int, v: SuggestView
+    ) -> List[Tuple[str, float]]:
+        trie = self._route_prefix(prefix, v)
+        p = trie.key(prefix)
+        ctx = self._prev_tokens(prev)
+        bonus = self._ngram_bonus(ctx, p, trie.key, v) if ctx else {}
+        if not prefix:
+            if not bonus:
+                return []
+            now = now_ms()
+            words = list(bonus)
+            scored = [(-(sc + bonus[w]), w) for w, sc in zip(words, self._score_batch(words, doc_id, now, v))]
+            return [(w, -neg) for neg, w in heapq.nsmallest(top_n, scored)]
+        start = trie._find(p)
+        if start is None and not bonus and not fuzzy:
+            return []
+        now = now_ms()
+
+        # 힙 원소: (-로그 값, 문자열, 종류, 점수/노드) — 종류 0=단어(확정 점수), 1=노드(로그 상한)
+        # 문서별 점수/n-gram 가산점이 붙는 단어는 미리 확정 점수로 넣고 트라이 순회에선 건너뛴다
+        heap: List[tuple] = []
+        special = set()
+        for w in self._doc_words(doc_id, v):
+            if trie.key(w).startswith(p) and w in trie:
+                special.add(w)
+        special.update(bonus)
+        # 확정 점수는 후보 전체를 한 번에 (같은 now)
+        words = list(special)
+        for w, sc in zip(words, self._score_batch(words, doc_id, now, v)):
+            sc += bonus.get(w, 0.0)
+            heap.append((_neg_log(sc), w, 0, sc))
+        if start is not None:
+            heap.append((self._decay_shift(now, v) - start.best, p, 1, start))
+        heapq.heapify(heap)
+
+        out = self._best_first(heap, special, top_n, now, v)
+        if fuzzy and len(out) < top_n:
+            out += self._fuzzy_tiers(trie, p, doc_id, top_n - len(out), now, fuzzy, v)
+        return out
+
+    def _best_first(
+        self,
+        heap: List[tuple],
+        special: set,
+        need: int,
+        now: int,
+        v: SuggestView,
+        skip: Optional[Dict[_TrieNode, int]] = None,
+        tier: int = 0,
+    ) -> List[Tuple[str, float]]:
+        # 힙에서 확정 점수 단어를 need 개까지 꺼낸다. skip 에서 tier 보다 가까운 노드는 앞 단계 몫이라 건너뜀.
+        # 트라이 단어는 로그 값(저장된 값 - shift)으로만 줄 세우고, exp 는 결과로 뽑힌 단어에만 한다
+        shift = self._decay_shift(now, v)
+        out: List[Tuple[str, float]] = []
+        while heap and len(out) < need:
+            neg, key, kind, node = heapq.heappop(heap)
+            if kind == 0:
+                out.append((key, node if node is not None else math.exp(-neg)))
+                continue
+            if node.words:
+                for w in node.words:
+                    if w not in special:
+                        heapq.heappush(heap, (shift - self._log_global(w, v), w, 0, None))
+            for ch, child in node.children.items():
+                if skip is not None and skip.get(child, tier) < tier:
+                    continue
+                heapq.heappush(heap, (shift - child.best, key + ch, 1, child))
+        return out
+
+    def _fuzzy_tiers(
+        self, trie: PrefixTrie, p: str, doc_id: Optional[str], need: int, now: int, fuzzy: int, v: SuggestView
+    ) -> List[Tuple[str, float]]:
+        """
+        오타 허용 단계: 편집 거리 1, 2 순으로 채운다 (같은 단계 안에서는 점수순).
+        짧은 접두사는 거의 모든 단어가 거리 2 안에 들어오므로 길이에 따라 허용 거리를 줄인다.
+        """
+        max_edits = min(fuzzy, 2 if len(p) >= 5 else 1 if len(p) >= 3 else 0)
+        if max_edits <= 0:
+            return []
+        doc_words = [w for w in self._doc_words(doc_id, v) if w in trie]
+        out: List[Tuple[str, float]] = []
+        for d in range(1, max_edits + 1):
+            if len(out) >= need:
+                break
+            # 거리 d 까지만 훑는다 — 앞 단계에서 다 채우면 더 비싼 d+1 탐색은 하지 않음
+            dist, starts = _fuzzy_prefix_nodes(trie, p, d, self.fuzzy_prefix_length)
+            special = set()
+            for w in doc_words:
+                if _path_distance(trie, trie.key(w), dist) == d:
+                    special.add(w)
+            words = list(special)
+            heap: List[tuple] = [
+                (_neg_log(sc), w, 0, sc) for w, sc in zip(words, self._score_batch(words, doc_id, now, v))
+            ]
+            shift = self._decay_shift(now, v)
+            heap.extend((shift - node.best, key, 1, node) for node, key in starts.get(d, ()))
+            heapq.heapify(heap)
+            out += self._best_first(heap, special, need - len(out), now, v, dist, d)
+        return out
+
+    def get_suggestions(
+        self,
+        prefix: str,
+        doc_id: Optional[str] = None,
+        top_n: int = 8,
+        prev: Optional[str] = None,
+        fuzzy: int = 0,
+    ) -> List[str]:
+        return [w for w, _ in self.get_suggestions_scored(prefix, doc_id, top_n, prev, fuzzy)]
+
+    # ------------------ Reinforcement ------------------
+
+    def accept_suggestion(self, doc_id: str, word: str, prev: Optional[str] = None) -> None:
+        with self._lock:
+            self._ensure_doc(doc_id)
+            # 전역 + 문서별 강화
+            self._commit({"op": "accept", "doc": doc_id, "w": word, "ts": now_ms()})
+            drec = self.memory["per_doc_accept"][doc_id]
+
+            # 문맥(prev)이 있으면 (앞 단어 → 수락 단어) n-gram 도 강화
+            ctx = self._prev_tokens(prev)
+            norm = self._normalize_token(word) if ctx and _TOKEN_RE.fullmatch(word) else None
+            if norm:
+                boost = self.ngram_accept_boost
+                rows = [[ctx[-1], norm, boost]]
+                if len(ctx) >= 2:
+                    rows.append([ctx[-2], ctx[-1], norm, boost])
+                self._commit({"op": "ng", "d": rows})
+
+            lang = self._lang_of_prefix(word)
+            # 로그 점수는 수락마다 커지기만 하므로 경로 상한을 올리는 것으로 충분
+            bound = self._live_log(word)
+            for trie in self._tries(lang):
+                trie.raise_bound(word, bound)
+
+            self._publish()
+            self._mark_dirty()
+        # 로그 용도: 실제 서비스에선 로깅 시스템으로 전송
+        print(f"👍 Learned: '{word}' (global={self.memory['accept_counts'][word]}, doc={drec['accept_counts'][word]})")
+
+
+# ------------------ Bulk Ingestion ------------------
+# 프로세스 풀 워커: 저장소/색인 없이 토크나이저 설정(불용어, 상한)만 가진 브레인으로 토큰화
+
+_WORKER_BRAIN: Optional[ThinkHelperBrain] = None
+
+
+def _init_token_worker(stop_ko: set, stop_en: set, token_caps: Dict[str, Optional[int]]) -> None:
+    global _WORKER_BRAIN
+    brain = ThinkHelperBrain.__new__(ThinkHelperBrain)
+    brain.stop_ko, brain.stop_en, brain.token_caps = stop_ko, stop_en, token_caps
+    _WORKER_BRAIN = brain
+
+
+def _iter_shards(docs, shard_size: int):
+    shard: List[Tuple[str, object]] = []
+    for item in docs:
+        shard.append(item)
+        if len(shard) >= shard_size:
+            yield shard
+            shard = []
+    if shard:
+        yield shard
+
+
+def _count_shard(brain: ThinkHelperBrain, shard: List[Tuple[str, object]]):
+    # map 단계: ([(doc_id, 문서 TF, 문서 n-gram)], 샤드 언어별 Counter, 샤드 DF, 샤드 n-gram 행)
+    # 샤드 합계(사용자 사전 빈도/DF/n-gram)는 워커에서 미리 합쳐 둔다 — reduce 는 보통 그것만 반영한다
+    # (n-gram 합계는 ng 레코드의 행 [문맥..., 단어, 카운트] 로 만들어 보낸다)
+    tfs: List[Tuple[str, Dict[str, int], Counter]] = []
+    freq = {"ko": Counter(), "en": Counter()}
+    shard_df: Counter = Counter()
+    shard_grams: Counter = Counter()
+    for doc_id, source in shard:
+        grams: Counter = Counter()
+        counts = _count_source(brain, source, grams)
+        tf = dict(counts["ko"] + counts["en"])
+        tfs.append((doc_id, tf, grams))
+        shard_df.update(tf.keys())
+        shard_grams.update(grams)
+        for lang in ("ko", "en"):
+            freq[lang].update(counts[lang])
+    return tfs, freq, shard_df, [[*key, n] for key, n in shard_grams.items() if n]
+
+
+def _count_shard_in_worker(shard: List[Tuple[str, object]]):
+    return _count_shard(_WORKER_BRAIN, shard)
+
+
+def _count_source(brain: ThinkHelperBrain, source, grams: Optional[Counter] = None) -> Dict[str, Counter]:
+    # 경로면 열어서 스트리밍, 그 외(str/파일 객체)는 그대로
+    if isinstance(source, os.PathLike):
+        with open(source, encoding="utf-8", errors="replace") as fh:
+            return brain.count_tokens(fh, grams=grams)
+    return brain.count_tokens(source, grams=grams)
+
+
+def iter_corpus_dir(root: str, exts: Tuple[str, ...] = (".txt", ".md")):
+    """root 아래 문서 파일을 (상대 경로 doc_id, 경로) 로 내보낸다 (정렬된 순서)."""
+    base = pathlib.Path(root)
+    for path in sorted(base.rglob("*")):
+        if path.is_file() and path.suffix.lower() in exts:
+            yield path.relative_to(base).as_posix(), path
+
+
+# ------------------ Multi-tenant ------------------
+
+class BrainManager:
+    """
+    사용자(또는 워크스페이스)별 ThinkHelperBrain 을 나눠 주는 관리자.
+    - 처음 접근할 때 root_dir/<user>.json(.sqlite3) 에서 지연 로드 (json 은 최신 mmap 스냅샷 .img 가 있으면 파싱 없이)
+    - 최근 사용 순(LRU)으로 유지하고, max_brains 개 또는 memory_budget_bytes 를 넘으면
+      가장 오래 안 쓴 브레인부터 flush + close 후 내린다
+    - 브레인은 lease() (또는 acquire/release) 로 빌려 쓴다. 빌려 간 요청이 있는 브레인은 내리지 않고,
+      evict() 로 내린 것은 마지막 반납 때 닫는다. 닫히는 중인 사용자는 닫힌 뒤에 다시 로드한다
+      (한 사용자 파일에 인스턴스가 둘 생기지 않게)
+    """
+
+    _SAFE_ID = re.compile(r"^[A-Za-z0-9_.\-]{1,64}$")
 
+    def __init__(
+        self,
+        root_dir: str = "brains",
+        backend: str = "json",
+        max_brains: int = 64,
+        memory_budget_bytes: int = 256 * 1024 * 1024,
+        **brain_kwargs,
+    ):
+        if backend not in ("json", "sqlite"):
+            raise ValueError(f"unknown backend: {backend}")
+        self.root_dir = root_dir
+        self.backend = backend
+        self.max_brains = max(1, max_brains)
+        self.memory_budget_bytes = memory_budget_bytes
+        brain_kwargs.setdefault("write_behind", True)
+        if backend == "json":
+            # 내렸다가 다시 올릴 때 JSON 전체를 파싱하지 않도록 mmap 스냅샷 (닫을 때만 쓰므로 flush 비용은 그대로)
+            brain_kwargs.setdefault("mmap_snapshot", True)
+        self.brain_kwargs = brain_kwargs
+        os.makedirs(root_dir, exist_ok=True)
 
-class ThinkHelperBrain:
+        self._lock = threading.Lock()
+        self._brains: "OrderedDict[str, ThinkHelperBrain]" = OrderedDict()
+        self._loading: Dict[str, threading.Lock] = {}
+        self._holders: Dict[str, int] = {}  # 사용자별 빌려 간 수
+        self._retired: Dict[str, ThinkHelperBrain] = {}  # 내렸지만 아직 빌려 간 요청이 있는 브레인
+        self._closing: Dict[str, threading.Event] = {}  # 내리는 중 → 닫히면 set
+        self._gets = 0
+        atexit.register(self.close)
+
+    @classmethod
+    def _name_for(cls, user_id: str) -> str:
+        # 파일 이름으로 쓸 사용자 이름 (안전하지 않으면 해시)
+        if cls._SAFE_ID.match(user_id) and user_id not in (".", ".."):
+            return user_id
+        return "u_" + hashlib.sha1(user_id.encode("utf-8")).hexdigest()
+
+    def _path_for(self, user_id: str) -> str:
+        name = self._name_for(user_id)
+        ext = ".sqlite3" if self.backend == "sqlite" else ".json"
+        return os.path.join(self.root_dir, name + ext)
+
+    def _create(self, user_id: str) -> ThinkHelperBrain:
+        path = self._path_for(user_id)
+        if self.backend == "sqlite":
+            return ThinkHelperBrain(storage=SqliteStorage(path), **self.brain_kwargs)
+        return ThinkHelperBrain(path, **self.brain_kwargs)
+
+    def acquire(self, user_id: str) -> ThinkHelperBrain:
+        """브레인을 빌린다 — 다 쓰면 release(user_id). 보통은 lease() 로."""
+        while True:
+            victims = []
+            with self._lock:
+                closing = self._closing.get(user_id)
+                brain = None if closing is not None else self._brains.get(user_id)
+                if brain is not None:
+                    self._brains.move_to_end(user_id)
+                    self._holders[user_id] = self._holders.get(user_id, 0) + 1
+                    self._gets += 1
+                    if self._gets % 64 == 0:
+                        victims = self._pick_victims(user_id)
+                elif closing is None:
+                    loading = self._loading.setdefault(user_id, threading.Lock())
+            if brain is not None:
+                self._close_all(victims)
+                return brain
+            if closing is not None:
+                # 내리는 인스턴스가 파일을 다 쓰고 닫힐 때까지 기다렸다가 다시 로드
+                closing.wait()
+                continue
+
+            # 같은 사용자를 동시에 두 번 로드하지 않도록 사용자별 잠금 (다른 사용자는 막지 않음)
+            with loading:
+                with self._lock:
+                    if user_id in self._brains or user_id in self._closing:
+                        continue  # 그 사이 다른 스레드가 로드했거나 내리는 중 — 처음부터
+                brain = self._create(user_id)
+                with self._lock:
+                    self._brains[user_id] = brain
+                    self._holders[user_id] = self._holders.get(user_id, 0) + 1
+                    self._loading.pop(user_id, None)
+                    victims = self._pick_victims(user_id)
+            self._close_all(victims)
+            return brain
+
+    def release(self, user_id: str) -> None:
+        """acquire 한 브레인을 반납. 그 사이 evict 됐고 마지막 반납이면 여기서 닫는다."""
+        with self._lock:
+            left = self._holders[user_id] - 1
+            if left:
+                self._holders[user_id] = left
+                return
+            del self._holders[user_id]
+            brain = self._retired.pop(user_id, None)
+        if brain is not None:
+            self._close_all([(user_id, brain)])
+
+    @contextmanager
+    def lease(self, user_id: str) -> Iterator[ThinkHelperBrain]:
+        brain = self.acquire(user_id)
+        try:
+            yield brain
+        finally:
+            self.release(user_id)
+
+    def _pick_victims(self, keep: str) -> List[Tuple[str, ThinkHelperBrain]]:
+        # _lock 안에서 호출. 빌려 간 요청이 있는 브레인은 건너뛴다 (예산은 잠깐 넘을 수 있음)
+        victims = []
+        total = sum(b.memory_footprint() for b in self._brains.values())
+        for uid, brain in list(self._brains.items()):
+            if len(self._brains) <= 1 or (
+                len(self._brains) <= self.max_brains and total <= self.memory_budget_bytes
+            ):
+                break
+            if uid == keep or self._holders.get(uid):
+                continue
+            del self._brains[uid]
+            self._closing[uid] = threading.Event()
+            total -= brain.memory_footprint()
+            victims.append((uid, brain))
+        return victims
+
+    def _close_all(self, victims: List[Tuple[str, ThinkHelperBrain]]) -> None:
+        for uid, brain in victims:
+            try:
+                brain.close()
+            except Exception as e:
+                print(f"⚠️ brain close failed ({brain.storage_file}): {e}")
+            finally:
+                with self._lock:
+                    closing = self._closing.pop(uid, None)
+                if closing is not None:
+                    closing.set()
+
+    def evict(self, user_id: str) -> bool:
+        with self._lock:
+            brain = self._brains.pop(user_id, None)
+            if brain is None:
+                return False
+            self._closing[user_id] = threading.Event()
+            if self._holders.get(user_id):
+                # 아직 쓰는 요청이 있다 — 마지막 release 에서 닫는다
+                self._retired[user_id] = brain
+                return True
+        self._close_all([(user_id, brain)])
+        return True
+
+    def flush_all(self) -> None:
+        with self._lock:
+            brains = list(self._brains.values())
+        for brain in brains:
+            brain.flush()
+
+    def stats(self) -> Dict:
+        with self._lock:
+            return {
+                "brains": len(self._brains),
+                "memory_bytes": sum(b.memory_footprint() for b in self._brains.values()),
+                "users": list(self._brains),
+            }
+
+    def close(self) -> None:
+        # 종료 — 빌려 간 요청이 남아 있어도 닫는다
+        with self._lock:
+            brains = list(self._brains.items()) + list(self._retired.items())
+            self._brains.clear()
+            self._retired.clear()
+            for uid, _ in brains:
+                self._closing.setdefault(uid, threading.Event())
+        self._close_all(brains)
+        atexit.unregister(self.close)
+
+
+# ------------------ Shared Memory (multi-process) ------------------
+# gunicorn 워커 여러 개가 같은 사용자 데이터를 함께 쓰는 모드 (BRAIN_SHARED=1).
+# - 파일 잠금을 먼저 잡은 워커가 허브(BrainHub): BrainManager 를 혼자 들고 쓰기를 전부 처리한다
+# - 모든 워커는 쓰기를 유닉스 소켓으로 허브에 넘기고, 추천은 허브가 공개한 뷰 이미지
+#   (/dev/shm 의 파일 — 메모리에만 있음)를 mmap 으로 열어 복사 없이 읽는다
+# 뷰 이미지: 헤더(매직, 버전, 목차 길이) + 목차 JSON + 8바이트 정렬된 고정폭 배열들.
+# 어휘/문서 ID 는 UTF-8 문자열 표 + crc32 개방 주소 해시, 트라이는 BFS 순서 노드 배열.
+
+_IMAGE_MAGIC = b"THBV"
+_IMAGE_VERSION = 1
+_IMAGE_HEADER = struct.Struct("<4sIQ")  # 매직, 버전, 목차 길이
+
+# 허브 브레인 → 워커 브레인으로 옮기는 점수 설정
+_SHARED_CONFIG = (
+    "decay_daily", "context_mode", "bm25_k1", "bm25_b", "ngram_weight", "ngram_backoff",
+    "fuzzy_prefix_length", "batch_score_min",
+)
+
+
+def _align8(n: int) -> int:
+    return (n + 7) & ~7
+
+
+def _private_run_dir(root_dir: str) -> str:
+    # 사용자(uid)별 런타임 디렉터리 아래 root_dir 마다 하나 — XDG_RUNTIME_DIR 가 있으면 그것(본인 전용)
+    digest = hashlib.sha1(os.path.realpath(root_dir).encode("utf-8")).hexdigest()[:12]
+    base = os.environ.get("XDG_RUNTIME_DIR")
+    if not base or not os.path.isdir(base):
+        base = "/dev/shm" if os.path.isdir("/dev/shm") else tempfile.gettempdir()
+    return os.path.join(base, f"thinkhelper-{os.getuid()}-{digest}")
+
+
+def _check_private(path: str, st: os.stat_result, mode: int) -> None:
+    # 남이 미리 만들어 둔 디렉터리/키 파일이면 허브 인증을 뚫을 수 있다 (recv 는 unpickle) — 시작을 거부
+    if stat.S_ISLNK(st.st_mode):
+        raise RuntimeError(f"refusing symlinked shared-mode path: {path}")
+    if st.st_uid != os.getuid():
+        raise RuntimeError(f"shared-mode path not owned by this user: {path}")
+    if stat.S_IMODE(st.st_mode) != mode:
+        raise RuntimeError(f"shared-mode path must have mode {mode:o}: {path} ({stat.S_IMODE(st.st_mode):o})")
+
+
+def _view_image_path(run_dir: str, user_id: str) -> str:
+    return os.path.join(run_dir, BrainManager._name_for(user_id) + ".view")
+
+
+class _StringTable:
     """
-    사용 패턴:
-      brain = ThinkHelperBrain()
-      brain.observe_text_incremental(doc_id, current_text)   # 타이핑 중 수시 호출
-      cands = brain.get_suggestions(prefix, doc_id, top_n=8) # 접두사 추천
-      brain.accept_suggestion(doc_id, chosen_word)           # 탭/엔터 수락시 호출
+    이미지용 문자열 표 (쓰는 쪽): UTF-8 을 이어 붙인 blob + 시작 위치 + crc32 해시 슬롯.
+    sync() 는 덧붙이기만 하는 목록(Vocab.words, NgramTable.vocab)의 새 항목만 더한다.
+    gen 은 처음부터 다시 만들 때마다 바뀐다 (같은 gen 이면 ID → 문자열이 변하지 않음).
     """
 
-    def __init__(self, storage_file: str = "brain_data.json"):
-        self.storage_file = storage_file
+    def __init__(self):
+        self.src = None
+        self.gen = os.urandom(8).hex()
+        self.blob = bytearray()
+        self.off = array("Q", [0])
+        self.slots = array("q", [-1]) * 16
 
-        # 불용어 (너무 흔한 단어 제외)
-        self.stop_ko: set = {
-            "그리고", "그러나", "하지만", "또", "또는", "및", "있다",
-            "하는", "에서", "으로", "에게", "입니다", "수", "것", "등", "때"
+    def __len__(self) -> int:
+        return len(self.off) - 1
+
+    def sync(self, words: List[str]) -> "_StringTable":
+        if words is not self.src or len(words) < len(self):
+            self.__init__()
+            self.src = words
+        new = words[len(self):]
+        if 2 * (len(self) + len(new)) > len(self.slots):
+            size = len(self.slots)
+            while 2 * (len(self) + len(new)) > size:
+                size *= 2
+            self.slots = array("q", [-1]) * size
+            blob, off = self.blob, self.off
+            for j in range(len(self)):
+                self._place(j, blob[off[j]:off[j + 1]])
+        for w in new:
+            b = w.encode("utf-8")
+            self.blob += b
+            self.off.append(len(self.blob))
+            self._place(len(self) - 1, b)
+        return self
+
+    def _place(self, j: int, b) -> None:
+        slots, mask = self.slots, len(self.slots) - 1
+        i = zlib.crc32(b) & mask
+        while slots[i] >= 0:
+            i = (i + 1) & mask
+        slots[i] = j
+
+
+class _FlatStrings:
+    """
+    이미지 안의 문자열 표 (읽는 쪽) — Vocab 처럼 get/ids.get/words[i] 로 쓴다.
+    words[i] 는 한 번 디코드하면 cache 에 남긴다 (gen 이 같은 다음 이미지도 이어 쓴다).
+    """
+
+    __slots__ = ("buf", "base", "off", "slots", "cache", "gen")
+
+    def __init__(self, buf, base: int, off: memoryview, slots: memoryview,
+                 cache: Optional[Dict[int, str]] = None, gen: Optional[str] = None):
+        self.buf, self.base, self.off, self.slots, self.gen = buf, base, off, slots, gen
+        # 여는 비용이 어휘 크기와 무관하도록 미리 채우지 않는다
+        self.cache = cache if cache is not None else {}
+
+    def __len__(self) -> int:
+        return len(self.off) - 1
+
+    def __getitem__(self, i: int) -> str:
+        s = self.cache.get(i)
+        if s is None:
+            b = self.base
+            s = self.cache[i] = self.buf[b + self.off[i]:b + self.off[i + 1]].decode("utf-8")
+        return s
+
+    def get(self, word: str, default=None):
+        raw = word.encode("utf-8")
+        buf, base, off, slots = self.buf, self.base, self.off, self.slots
+        mask = len(slots) - 1
+        i = zlib.crc32(raw) & mask
+        while True:
+            j = slots[i]
+            if j < 0:
+                return default
+            if buf[base + off[j]:base + off[j + 1]] == raw:
+                return j
+            i = (i + 1) & mask
+
+    @property
+    def ids(self) -> "_FlatStrings":
+        return self
+
+    @property
+    def words(self) -> "_FlatStrings":
+        return self
+
+
+class _FlatTrie:
+    """
+    이미지 안의 PrefixTrie (읽기 전용). 노드는 BFS 순서라 한 노드의 자식이 연달아 있고
+    글자 코드 순으로 정렬돼 있어 _find 는 이분 탐색. 노드 객체(_FlatNode)는 필요할 때만 만든다.
+    """
+
+    __slots__ = ("key", "vocab", "best", "child0", "nchild", "chars", "word0", "words", "root")
+
+    def __init__(self, key, vocab: _FlatStrings, sec):
+        self.key = key
+        self.vocab = vocab
+        self.best, self.child0, self.nchild, self.chars, self.word0, self.words = sec
+        self.root = _FlatNode(self, 0)
+
+    def __len__(self) -> int:
+        return len(self.words)
+
+    def __contains__(self, word: str) -> bool:
+        node = self._find(self.key(word))
+        return bool(node and node.words and word in node.words)
+
+    def _find(self, key: str) -> Optional["_FlatNode"]:
+        i, chars, child0, nchild = 0, self.chars, self.child0, self.nchild
+        for ch in key:
+            lo = child0[i]
+            hi = lo + nchild[i]
+            c = ord(ch)
+            i = bisect_left(chars, c, lo, hi)
+            if i >= hi or chars[i] != c:
+                return None
+        return _FlatNode(self, i)
+
+
+class _FlatNode:
+    # _TrieNode 와 같은 읽기 인터페이스 (best/words/children) — 노드 번호로 같음을 판단
+    __slots__ = ("t", "i")
+
+    def __init__(self, t: _FlatTrie, i: int):
+        self.t, self.i = t, i
+
+    def __eq__(self, other) -> bool:
+        return isinstance(other, _FlatNode) and other.i == self.i and other.t is self.t
+
+    def __hash__(self) -> int:
+        return self.i
+
+    @property
+    def best(self) -> float:
+        return self.t.best[self.i]
+
+    @property
+    def words(self) -> Optional[List[str]]:
+        t = self.t
+        a, b = t.word0[self.i], t.word0[self.i + 1]
+        return [t.vocab[t.words[k]] for k in range(a, b)] if b > a else None
+
+    @property
+    def children(self) -> Dict[str, "_FlatNode"]:
+        t = self.t
+        lo = t.child0[self.i]
+        return {chr(t.chars[c]): _FlatNode(t, c) for c in range(lo, lo + t.nchild[self.i])}
+
+
+def _pack_trie(trie: PrefixTrie, vocab: Vocab) -> List[array]:
+    # BFS 로 (best, 첫 자식, 자식 수, 들어오는 글자, 단어 시작, 단어 ID) 배열을 만든다
+    nodes = [trie.root]
+    best, child0, nchild = array("d"), array("I"), array("I")
+    chars, word0, words = array("I", [0]), array("I", [0]), array("I")
+    get = vocab.get
+    i = 0
+    while i < len(nodes):
+        node = nodes[i]
+        i += 1
+        best.append(node.best)
+        child0.append(len(nodes))
+        kids = sorted(node.children.items())
+        nchild.append(len(kids))
+        for ch, child in kids:
+            chars.append(ord(ch))
+            nodes.append(child)
+        if node.words:
+            words.extend(get(w) for w in node.words)
+        word0.append(len(words))
+    return [best, child0, nchild, chars, word0, words]
+
+
+_TRIE_SECTIONS = ("best", "child0", "nchild", "chars", "word0", "words")
+_NGRAM_SECTIONS = ("c_key", "c_head", "c_total", "e_next", "e_count", "e_link", "_c_slots")
+
+
+class ViewImageWriter:
+    """
+    브레인 하나의 추천 뷰(SuggestView + 메모리에 올라온 문서별 기록)를 이미지 파일로 쓴다.
+    어휘 문자열 표는 브레인별로 들고 있다가 새 단어만 덧붙인다.
+    - prepare(): 브레인 잠금 안에서 — 참조와 memcpy 수준 사본만
+    - dump(): 잠금 밖에서 — 트라이를 펴고 파일을 쓴다 (공개된 뷰는 고쳐지지 않으므로)
+    """
+
+    def __init__(self):
+        self.vocab = _StringTable()
+        self.ngram_vocab = _StringTable()
+        self._lock = threading.Lock()
+
+    def write(self, brain: "ThinkHelperBrain", path: str) -> int:
+        """이미지를 임시 파일에 쓰고 path 로 바꿔 끼운다 (읽던 쪽은 예전 매핑을 계속 쓴다). 반환: 바이트 수"""
+        with self._lock:
+            with brain._lock:
+                job = self.prepare(brain)
+            return self.dump(job, path)
+
+    def prepare(self, brain: "ThinkHelperBrain") -> tuple:
+        # brain._lock 안에서 호출
+        mem = brain.memory
+        v = brain._view
+        vocab = self.vocab.sync(mem["vocab"].words)
+        ngram_vocab = self.ngram_vocab.sync(v.ngrams.vocab)
+        ids = list(OrderedDict.fromkeys([*mem["doc_freq"], *mem["per_doc_accept"], *brain._loaded_docs]))
+        # 문서별 희소 배열은 바꿔 끼우기만 하므로 지금 그 배열 쌍만 집어 둔다
+        tfs = [mem["doc_freq"].get(d) for d in ids]
+        accs = [mem["per_doc_accept"].get(d) for d in ids]
+        pools = {
+            "tf": [tf.id_arrays() if tf else None for tf in tfs],
+            "acc": [a["accept_counts"].id_arrays() if a else None for a in accs],
+            "last": [a["last_used_at"].id_arrays() if a else None for a in accs],
         }
-        self.stop_en: set = {
-            "the", "and", "for", "with", "that", "this", "from",
-            "have", "are", "not", "to", "of", "in", "on", "by", "as", "be", "is"
+        meta = {
+            "vocab_gen": vocab.gen,
+            "ngram_gen": ngram_vocab.gen,
+            "n_docs": v.n_docs,
+            "n_tokens": v.n_tokens,
+            "decay_rate": v.decay_rate,
+            "lazy_docs": brain.storage.lazy_docs,
+            "config": {k: getattr(brain, k) for k in _SHARED_CONFIG},
+            "stop_ko": sorted(brain.stop_ko),
+            "stop_en": sorted(brain.stop_en),
         }
-
-        # 기본(시드) 사전 — 필요시 추가
-        self.dict_ko_base: List[str] = [
-            "분석","연구","결과","방법","과정","결론","참고","출처","데이터","요약",
-            "종합","한계","전망","쟁점","법리","판례","형법","형사소송법","대법원","요지",
-            "사실관계","알고리즘","프로토타입","컨텍스트","토큰","임베딩","오프라인",
-            "캐시","스레드","비동기","이벤트루프","렌더링","성능최적화"
-        ]
-        self.dict_en_base: List[str] = [
-            "analysis","baseline","benchmark","context","dataset","design","embedding",
-            "evaluation","fallback","feature","guide","heuristic","insight","journey",
-            "knowledge","latency","model","note","optimize","pipeline","quality",
-            "research","summary","template","validation","workflow","yield","zero-copy"
+        # 문자열 표와 n-gram 표의 덧붙이는 배열(뷰와 공유)은 다음 쓰기가 자라게 하므로 지금 복사해 둔다
+        sections = [
+            ("vocab.blob", "B", bytes(vocab.blob)), ("vocab.off", "Q", vocab.off[:]),
+            ("vocab.slots", "q", vocab.slots[:]), ("accept_log", "d", v.accept_log), ("df", "q", v.df.data),
+            ("ngv.blob", "B", bytes(ngram_vocab.blob)), ("ngv.off", "Q", ngram_vocab.off[:]),
+            ("ngv.slots", "q", ngram_vocab.slots[:]),
         ]
+        for name in _NGRAM_SECTIONS:
+            arr = getattr(v.ngrams, name)
+            sections.append(("ng." + name, arr.typecode, arr[:]))
+        return meta, sections, v.index, mem["vocab"], ids, pools
 
-        # 최대 사용자 사전 용량(언어별)
-        self.user_dict_caps = {"ko": 400, "en": 400}
+    @staticmethod
+    def dump(job: tuple, path: str) -> int:
+        meta, sections, index, vocab, ids, pools = job
+        docs = _StringTable().sync(ids)
+        sections += [("docs.blob", "B", bytes(docs.blob)), ("docs.off", "Q", docs.off),
+                     ("docs.slots", "q", docs.slots)]
+        for name, rows in pools.items():
+            # 문서 j 의 항목 = ids/vals[off[j]:off[j+1]] (ID 오름차순 그대로)
+            off, pid, pval = array("Q", [0]), array("I"), array("q" if name == "last" else "I")
+            for cols in rows:
+                if cols:
+                    pid.extend(cols[0])
+                    pval.extend(cols[1])
+                off.append(len(pid))
+            sections += [(name + ".off", "Q", off), (name + ".ids", "I", pid), (name + ".vals", pval.typecode, pval)]
+        for name, trie in index.items():
+            for part, arr in zip(_TRIE_SECTIONS, _pack_trie(trie, vocab)):
+                sections.append((f"trie.{name}.{part}", arr.typecode, arr))
+        toc, pos = {}, 0
+        for name, code, data in sections:
+            toc[name] = [pos, code, len(data)]
+            pos = _align8(pos + len(data) * array(code).itemsize)
+        head = json.dumps({"meta": meta, "sections": toc}).encode("utf-8")
+        start = _align8(_IMAGE_HEADER.size + len(head))
+        tmp = f"{path}.{os.getpid()}.{threading.get_ident()}.tmp"
+        with open(tmp, "wb") as f:
+            f.write(_IMAGE_HEADER.pack(_IMAGE_MAGIC, _IMAGE_VERSION, len(head)))
+            f.write(head)
+            f.write(bytes(start - f.tell()))
+            for name, code, data in sections:
+                f.write(bytes(start + toc[name][0] - f.tell()))
+                f.write(data)
+            size = f.tell()
+        os.replace(tmp, path)
+        return size
 
-        # 메모리 로드 + 스키마 보정
-        self.memory = self._load_or_init()
 
-        # 감쇠 파라미터(일 단위)
-        self.decay_daily = 0.99
+class ImageView(SuggestView):
+    """
+    mmap 한 뷰 이미지 위의 SuggestView — 배열은 memoryview 로 바로 읽고 파싱하지 않는다 (목차 JSON 만).
+    문서별 기록은 pin 때 그 문서 구간만 잘라서 붙인다 (메모리 인자는 쓰지 않음).
+    prev: 직전 이미지 — 어휘 gen 이 같으면 디코드해 둔 단어를 물려받는다.
+    """
 
-        # 문서별 수락 로그(선택사항) — 필요시 분석용
-        # {"doc_id": {"accept_counts": {...}, "last_used_at": {...}}}
-        if "per_doc_accept" not in self.memory:
-            self.memory["per_doc_accept"] = {}
+    __slots__ = ("meta", "docs", "_pools", "nbytes")
 
-    # ------------------ Persistence ------------------
+    def __init__(self, buf, prev: Optional["ImageView"] = None):
+        magic, version, toc_len = _IMAGE_HEADER.unpack_from(buf, 0)
+        if magic != _IMAGE_MAGIC or version != _IMAGE_VERSION:
+            raise ValueError(f"unsupported view image ({magic!r} v{version})")
+        head = json.loads(buf[_IMAGE_HEADER.size:_IMAGE_HEADER.size + toc_len].decode("utf-8"))
+        toc, meta = head["sections"], head["meta"]
+        start = _align8(_IMAGE_HEADER.size + toc_len)
+        mv = memoryview(buf)
 
-    def _load_or_init(self) -> Dict:
-        if not os.path.exists(self.storage_file):
-            return {
-                "accept_counts": {},        # 전역 선택 횟수 {word: count}
-                "last_used_at": {},         # 전역 마지막 사용 시각(ms) {word: ts}
-                "doc_freq": {},             # 문서별 TF {doc_id: {word: count}}
-                "user_dict": {"ko": [], "en": []},  # 사용자 사전
-            }
+        def sec(name):
+            off, code, n = toc[name]
+            off += start
+            return mv[off:off + n * array(code).itemsize].cast(code)
+
+        def strings(prefix, gen=None, old=None):
+            # gen 이 같은 직전 이미지의 표(old)가 있으면 그 디코드 캐시를 이어 쓴다
+            cache = old.cache if old is not None and old.gen == gen else None
+            return _FlatStrings(
+                buf, start + toc[prefix + ".blob"][0], sec(prefix + ".off"), sec(prefix + ".slots"), cache, gen)
+
+        self.meta = meta
+        self.nbytes = len(buf)
+        self.vocab = strings("vocab", meta["vocab_gen"], prev and prev.vocab)
+        self.index = {
+            name: _FlatTrie(key, self.vocab, [sec(f"trie.{name}.{part}") for part in _TRIE_SECTIONS])
+            for name, key in _TRIE_KEYS.items()
+        }
+        self.accept_log = sec("accept_log")
+        self.decay_rate = meta["decay_rate"]
+        self.df = WordColumn(self.vocab)
+        self.df.data = sec("df")
+        self.n_docs = meta["n_docs"]
+        self.n_tokens = meta["n_tokens"]
+        ngrams = NgramTable.__new__(NgramTable)
+        ngrams.vocab = ngrams._ids = strings("ngv", meta["ngram_gen"], prev and prev.ngrams.vocab)
+        for name in _NGRAM_SECTIONS:
+            setattr(ngrams, name, sec("ng." + name))
+        self.ngrams = ngrams
+        self.docs = strings("docs")
+        self._pools = {name: (sec(name + ".off"), sec(name + ".ids"), sec(name + ".vals"))
+                       for name in ("tf", "acc", "last")}
+        self.tf = None
+        self.doc_accept = None
+
+    def pin(self, memory: Dict, doc_id: str) -> "ImageView":
+        out = ImageView.__new__(ImageView)
+        for name in SuggestView.__slots__ + ImageView.__slots__:
+            setattr(out, name, getattr(self, name))
+        j = self.docs.get(doc_id)
+        if j is None:
+            return out
+        cols = {}
+        for name, (off, ids, vals) in self._pools.items():
+            a, b = off[j], off[j + 1]
+            if b > a:
+                counts = cols[name] = SparseCounts(self.vocab)
+                counts._cols = (ids[a:b], vals[a:b])
+        out.tf = cols.get("tf")
+        if "acc" in cols:
+            out.doc_accept = (cols["acc"], cols.get("last") or SparseCounts(self.vocab, typecode="q"))
+        return out
+
+
+class _NoStorage(BrainStorage):
+    # 아무것도 저장하지 않는 저장소 — SharedBrainClient 용 (상태는 허브가 가진다)
+
+    def load(self) -> Dict:
+        return empty_memory()
+
+    def begin_save(self, memory: Dict):
+        return None
+
+    def finish_save(self, job) -> None:
+        pass
+
+
+class SharedBrainClient(ThinkHelperBrain):
+    """
+    공유 모드 워커의 사용자별 브레인: 추천은 허브가 공개한 뷰 이미지(mmap)로,
+    관찰/수락은 허브로 넘긴다. 점수 설정/불용어는 이미지에 적힌 허브 쪽 값을 따른다.
+    쓴 내용은 허브가 다음 공개(publish_interval)를 마치면 추천에 보인다.
+    """
+
+    def __init__(self, manager: "SharedBrainManager", user_id: str, image_path: str):
+        super().__init__(storage=_NoStorage())
+        self.manager = manager
+        self.user_id = user_id
+        self.image_path = image_path
+        # 이미지가 바뀌었는지 stat 으로 보는 주기 (초)
+        self.refresh_interval = 0.01
+        self._image_id: Optional[Tuple[int, int]] = None
+        self._checked = 0.0
+
+    def _refresh(self, force: bool = False) -> None:
+        now = time.monotonic()
+        if not force and now - self._checked < self.refresh_interval:
+            return
+        self._checked = now
         try:
-            with open(self.storage_file, "r", encoding="utf-8") as f:
-                mem = json.load(f)
-        except Exception:
-            # 파일 깨졌을 때 복구
-            mem = {}
+            st = os.stat(self.image_path)
+        except FileNotFoundError:
+            # 허브가 이 사용자를 아직 공개하지 않았다 — 올려서 바로 공개해 달라고 한다
+            self.manager.call("publish", self.user_id)
+            st = os.stat(self.image_path)
+        if (st.st_ino, st.st_mtime_ns) == self._image_id:
+            return
+        with open(self.image_path, "rb") as f:
+            st = os.fstat(f.fileno())
+            buf = mmap.mmap(f.fileno(), 0, access=mmap.ACCESS_READ)
+        prev = self._view
+        view = ImageView(buf, prev if isinstance(prev, ImageView) else None)
+        meta = view.meta
+        for k, val in meta["config"].items():
+            setattr(self, k, val)
+        self.stop_ko, self.stop_en = set(meta["stop_ko"]), set(meta["stop_en"])
+        # 예전 매핑은 그것을 집어 간 요청이 끝나면 GC 가 닫는다
+        self._view, self._image_id = view, (st.st_ino, st.st_mtime_ns)
 
-        # 스키마 보정
-        mem.setdefault("accept_counts", {})
-        mem.setdefault("last_used_at", {})
-        mem.setdefault("doc_freq", {})
-        mem.setdefault("user_dict", {"ko": [], "en": []})
-        # 타입 보정
-        for lang in ("ko", "en"):
-            if not isinstance(mem["user_dict"].get(lang, []), list):
-                mem["user_dict"][lang] = []
-        return mem
+    def _read_view(self, doc_id: Optional[str]) -> SuggestView:
+        self._refresh()
+        return super()._read_view(doc_id)
 
-    def save_memory(self) -> None:
-        tmp_path = self.storage_file + ".tmp"
-        with open(tmp_path, "w", encoding="utf-8") as f:
-            json.dump(self.memory, f, ensure_ascii=False, indent=2)
-        os.replace(tmp_path, self.storage_file)
+    def _ensure_doc(self, doc_id: Optional[str]) -> None:
+        self._refresh()
+        v = self._view
+        # lazy_docs 허브: 이미지에 없는 문서는 허브가 올려서 다시 공개하게 한다
+        if doc_id and isinstance(v, ImageView) and v.meta["lazy_docs"] and v.docs.get(doc_id) is None:
+            self.manager.call("ensure_doc", self.user_id, doc_id)
+            self._refresh(force=True)
 
-    # ------------------ Tokenization ------------------
+    def observe_text_incremental(self, doc_id: str, current_text) -> None:
+        if not isinstance(current_text, str):
+            current_text = "".join(iter_text_chunks(current_text))
+        self.manager.call("observe", self.user_id, doc_id, current_text)
 
-    def extract_tokens(self, text: str) -> Dict[str, List[str]]:
-        """
-        텍스트에서 언어별 토큰 목록 추출.
-        - 한글: 2글자 이상
-        - 영어: 3글자 이상, 소문자화
-        - 불용어 제거
-        """
-        text = text or ""
-        ko_tokens = re.findall(r"[가-힣]{2,}", text)
-        ko_tokens = [w for w in ko_tokens if w not in self.stop_ko and len(w) <= 20]
+    def observe_text_delta(
+        self,
+        doc_id: str,
+        offset: int,
+        deleted: int,
+        inserted: str,
+        base_length: Optional[int] = None,
+    ) -> bool:
+        return self.manager.call("delta", self.user_id, doc_id, offset, deleted, inserted, base_length)
 
-        en_tokens = re.findall(r"[A-Za-z][A-Za-z\-]{2,}", text)
-        en_tokens = [w.lower() for w in en_tokens if w.lower() not in self.stop_en and len(w) <= 24]
+    def accept_suggestion(self, doc_id: str, word: str, prev: Optional[str] = None) -> None:
+        self.manager.call("accept", self.user_id, doc_id, word, prev)
 
-        return {"ko": ko_tokens[:1000], "en": en_tokens[:1000]}
+    def memory_footprint(self) -> int:
+        v = self._view
+        return v.nbytes if isinstance(v, ImageView) else 0
 
-    # ------------------ Learning ------------------
 
-    def observe_text_incremental(self, doc_id: str, current_text: str) -> None:
-        """
-        현재 문서의 전체 텍스트를 넣어주면 TF를 갱신하고,
-        사용자 사전을 최신 빈도로 동기화한다.
-        - 프런트엔드: 키 입력(debounce 500~1200ms 권장) 때마다 호출
-        """
-        tokens = self.extract_tokens(current_text)
-        all_tokens = tokens["ko"] + tokens["en"]
-        self.memory["doc_freq"][doc_id] = dict(Counter(all_tokens))
+class BrainHub:
+    """
+    공유 모드의 쓰는 쪽: BrainManager 를 혼자 들고 워커들의 요청을 유닉스 소켓으로 받아 처리한다.
+    - 요청: (op, args) → 응답 ("ok", 결과) / ("err", 메시지). 연결마다 처리 스레드 하나
+    - 쓰기가 있었던 사용자는 publish_interval 마다 뷰 이미지로 다시 공개한다
+      (이미지 쓰는 데 걸린 시간의 3배는 쉬어서 허브 워커의 CPU 를 다 쓰지 않는다)
+    """
 
-        # 사용자 사전 동기화 (각 언어별 빈도 상위 + 중복 제거 + 용량 캡)
-        for lang in ("ko", "en"):
-            freq = Counter(tokens[lang])
-            # 노이즈 제거: 2회 이상 등장
-            cand = [w for w, c in freq.items() if c >= 2]
-            current: set = set(self.memory["user_dict"].get(lang, []))
-            # 많이 나온 것부터 추가
-            for w, _ in freq.most_common():
-                if w in current:
-                    continue
-                if w in cand:
-                    current.add(w)
-                if len(current) >= self.user_dict_caps[lang]:
+    _WRITE_OPS = ("observe", "delta", "accept")
+
+    def __init__(
+        self,
+        manager: BrainManager,
+        address: str,
+        authkey: bytes,
+        run_dir: str,
+        lock_fd: Optional[int] = None,
+        publish_interval: float = 0.05,
+    ):
+        self.manager = manager
+        self.address = address
+        self.authkey = authkey
+        self.run_dir = run_dir
+        self.publish_interval = publish_interval
+        self._lock_fd = lock_fd
+        self._lock = threading.Lock()
+        self._writers: Dict[str, ViewImageWriter] = {}
+        self._dirty: set = set()
+        self._event = threading.Event()
+        self._closed = False
+        self._listener: Optional[Listener] = None
+        self._threads: List[threading.Thread] = []
+
+    def image_path(self, user_id: str) -> str:
+        return _view_image_path(self.run_dir, user_id)
+
+    def start(self) -> "BrainHub":
+        # 잠금을 쥔 쪽만 여기 오므로 남아 있는 소켓 파일은 죽은 허브의 것
+        if os.path.exists(self.address):
+            os.unlink(self.address)
+        # 예전 허브가 공개한 이미지는 그 뒤 저장소가 바뀌었을 수 있다 (다른 프로세스의 쓰기 등) — 지우면
+        # 클라이언트가 없는 이미지를 보고 새로 공개를 청한다 (이미 mmap 한 쪽은 그대로 읽힌다)
+        for name in os.listdir(self.run_dir):
+            if name.endswith(".view") or (".view." in name and name.endswith(".tmp")):
+                try:
+                    os.unlink(os.path.join(self.run_dir, name))
+                except FileNotFoundError:
+                    pass
+        self._listener = Listener(self.address, family="AF_UNIX", authkey=self.authkey)
+        for target, name in ((self._serve, "brain-hub"), (self._publish_loop, "brain-hub-publish")):
+            t = threading.Thread(target=target, name=name, daemon=True)
+            t.start()
+            self._threads.append(t)
+        return self
+
+    def _serve(self) -> None:
+        while not self._closed:
+            try:
+                conn = self._listener.accept()
+            except (OSError, EOFError) as e:
+                if self._closed:
                     break
-            # 기본 사전과 충돌 없이 유지(중복 허용 X)
-            self.memory["user_dict"][lang] = list(current)[: self.user_dict_caps[lang]]
+                print(f"⚠️ hub accept failed: {e}")
+                continue
+            threading.Thread(target=self._handle, args=(conn,), name="brain-hub-conn", daemon=True).start()
 
-        self.save_memory()
+    def _handle(self, conn) -> None:
+        with conn:
+            while not self._closed:
+                try:
+                    op, args = conn.recv()
+                except (OSError, EOFError):
+                    return
+                try:
+                    reply = ("ok", self._dispatch(op, args))
+                except Exception as e:
+                    reply = ("err", f"{type(e).__name__}: {e}")
+                try:
+                    conn.send(reply)
+                except OSError:
+                    return
 
-    # ------------------ Scoring ------------------
+    def _dispatch(self, op: str, args: tuple):
+        if op == "observe":
+            user_id, doc_id, text = args
+            with self.manager.lease(user_id) as brain:
+                brain.observe_text_incremental(doc_id, text)
+            result = None
+        elif op == "delta":
+            user_id, *rest = args
+            with self.manager.lease(user_id) as brain:
+                result = brain.observe_text_delta(*rest)
+        elif op == "accept":
+            user_id, doc_id, word, prev = args
+            with self.manager.lease(user_id) as brain:
+                brain.accept_suggestion(doc_id, word, prev)
+            result = None
+        elif op == "ensure_doc":
+            user_id, doc_id = args
+            with self.manager.lease(user_id) as brain:
+                brain._ensure_doc(doc_id)
+            self.publish(user_id)
+            return None
+        elif op == "publish":
+            self.publish(args[0])
+            return None
+        elif op == "flush":
+            self.manager.flush_all()
+            return None
+        elif op == "stats":
+            return self.manager.stats()
+        else:
+            raise ValueError(f"unknown op: {op}")
+        with self._lock:
+            self._dirty.add(user_id)
+        self._event.set()
+        return result
 
-    def _decay_score(self, count: int, last_ts_ms: Optional[int]) -> float:
-        d = days_since(last_ts_ms)  # 일수
-        return (count or 0) * (self.decay_daily ** d)
+    def publish(self, user_id: str) -> int:
+        """사용자 뷰 이미지를 지금 다시 쓴다. 반환: 이미지 바이트 수"""
+        with self._lock:
+            writer = self._writers.setdefault(user_id, ViewImageWriter())
+        with self.manager.lease(user_id) as brain:
+            return writer.write(brain, self.image_path(user_id))
 
-    def _context_score(self, word: str, doc_id: Optional[str]) -> float:
-        if not doc_id:
-            return 0.0
-        tf = self.memory["doc_freq"].get(doc_id, {}).get(word, 0)
-        # 문서 내 자주 등장할수록 가산점(상한 완만)
-        return 0.2 * min(5, tf)
+    def _publish_loop(self) -> None:
+        while not self._closed:
+            self._event.wait(1.0)
+            self._event.clear()
+            self._publish_dirty()
 
-    def _per_doc_accept_score(self, word: str, doc_id: Optional[str]) -> float:
-        if not doc_id:
-            return 0.0
-        drec = self.memory.get("per_doc_accept", {}).get(doc_id, {})
-        cnt = drec.get("accept_counts", {}).get(word, 0)
-        last_ts = drec.get("last_used_at", {}).get(word, 0)
-        return 1.2 * self._decay_score(cnt, last_ts)
-
-    def _score_word(self, word: str, doc_id: Optional[str]) -> float:
-        # 전역 강화 점수(감쇠)
-        g = self._decay_score(
-            self.memory["accept_counts"].get(word, 0),
-            self.memory["last_used_at"].get(word)
+    def _publish_dirty(self) -> None:
+        with self._lock:
+            users, self._dirty = self._dirty, set()
+        t0 = time.perf_counter()
+        for user_id in users:
+            try:
+                self.publish(user_id)
+            except (OSError, ValueError) as e:
+                print(f"⚠️ view publish failed ({user_id}): {e}")
+        if users and not self._closed:
+            time.sleep(max(self.publish_interval, 3 * (time.perf_counter() - t0)))
+
+    def close(self) -> None:
+        if self._closed:
+            return
+        self._closed = True
+        self._event.set()
+        try:
+            # accept() 에서 기다리는 스레드를 깨운다
+            Client(self.address, family="AF_UNIX", authkey=self.authkey).close()
+        except OSError:
+            pass
+        for t in self._threads:
+            t.join(timeout=5)
+        self._listener.close()
+        self._publish_dirty()
+        self.manager.close()
+        if os.path.exists(self.address):
+            os.unlink(self.address)
+        if self._lock_fd is not None:
+            os.close(self._lock_fd)  # 잠금이 풀리면 다른 워커가 허브를 이어받을 수 있다
+            self._lock_fd = None
+
+
+class SharedBrainManager:
+    """
+    공유 모드의 워커별 관리자 — BrainManager 와 같은 lease/evict/flush_all/stats/close.
+    - 파일 잠금(hub.lock)을 먼저 잡은 워커가 BrainHub 를 띄워 실제 BrainManager 를 든다.
+      허브 워커가 죽으면 잠금이 풀리므로 다음 요청에서 다른 워커가 이어받는다
+    - 모든 워커(허브 워커 포함)는 쓰기를 허브 소켓으로 보내고, 추천은 뷰 이미지를 mmap 해서 읽는다
+    - 소켓/이미지/인증 키는 run_dir ($XDG_RUNTIME_DIR 또는 /dev/shm 의 thinkhelper-<uid>-<root_dir 해시>) 에 둔다.
+      디렉터리(0700)와 키(0600)가 이 사용자 소유가 아니거나 심볼릭 링크/권한이 다르면 시작하지 않는다
+    """
+
+    def __init__(
+        self,
+        root_dir: str = "brains",
+        backend: str = "json",
+        max_brains: int = 64,
+        memory_budget_bytes: int = 256 * 1024 * 1024,
+        publish_interval: float = 0.05,
+        **brain_kwargs,
+    ):
+        if fcntl is None:
+            raise RuntimeError("shared brain mode needs fcntl (POSIX)")
+        if backend not in ("json", "sqlite"):
+            raise ValueError(f"unknown backend: {backend}")
+        self.root_dir = root_dir
+        self.backend = backend
+        self.max_brains = max(1, max_brains)
+        self.memory_budget_bytes = memory_budget_bytes
+        self.publish_interval = publish_interval
+        self.brain_kwargs = brain_kwargs
+        os.makedirs(root_dir, exist_ok=True)
+        self.run_dir = _private_run_dir(root_dir)
+        try:
+            os.mkdir(self.run_dir, 0o700)
+        except FileExistsError:
+            pass
+        _check_private(self.run_dir, os.lstat(self.run_dir), 0o700)
+        self.address = os.path.join(self.run_dir, "hub.sock")
+        self.authkey = self._load_key()
+
+        self.hub: Optional[BrainHub] = None
+        self._lock = threading.Lock()
+        self._clients: "OrderedDict[str, SharedBrainClient]" = OrderedDict()
+        self._local = threading.local()
+        self._ensure_hub()
+        atexit.register(self.close)
+
+    def _load_key(self) -> bytes:
+        # 워커들이 같은 인증 키를 쓰도록 처음 만든 쪽이 파일로 남긴다 (link 로 원자적으로)
+        path = os.path.join(self.run_dir, "hub.key")
+        if not os.path.lexists(path):
+            tmp = f"{path}.{os.getpid()}.tmp"
+            fd = os.open(tmp, os.O_WRONLY | os.O_CREAT | os.O_EXCL | os.O_NOFOLLOW, 0o600)
+            with os.fdopen(fd, "wb") as f:
+                f.write(os.urandom(32))
+            try:
+                os.link(tmp, path)
+            except FileExistsError:
+                pass
+            finally:
+                os.unlink(tmp)
+        fd = os.open(path, os.O_RDONLY | os.O_NOFOLLOW)
+        with os.fdopen(fd, "rb") as f:
+            _check_private(path, os.fstat(f.fileno()), 0o600)
+            return f.read()
+
+    def _ensure_hub(self) -> bool:
+        """허브가 없으면 이 워커가 맡아 본다 (잠금을 못 잡으면 다른 워커가 허브). 반환: 이 워커가 허브인지"""
+        with self._lock:
+            if self.hub is not None:
+                return True
+            fd = os.open(os.path.join(self.run_dir, "hub.lock"), os.O_RDWR | os.O_CREAT, 0o600)
+            try:
+                fcntl.flock(fd, fcntl.LOCK_EX | fcntl.LOCK_NB)
+            except OSError:
+                os.close(fd)
+                return False
+            manager = BrainManager(
+                self.root_dir, self.backend, self.max_brains, self.memory_budget_bytes, **self.brain_kwargs)
+            self.hub = BrainHub(
+                manager, self.address, self.authkey, self.run_dir, fd, self.publish_interval
+            ).start()
+            return True
+
+    def _connection(self):
+        conn = getattr(self._local, "conn", None)
+        if conn is not None:
+            return conn
+        for _ in range(100):
+            try:
+                conn = Client(self.address, family="AF_UNIX", authkey=self.authkey)
+                break
+            except (FileNotFoundError, ConnectionRefusedError):
+                # 허브가 아직 안 떴거나 죽었다 — 잠금이 풀려 있으면 이 워커가 이어받는다
+                self._ensure_hub()
+                time.sleep(0.05)
+        else:
+            raise ConnectionError("brain hub unavailable")
+        self._local.conn = conn
+        return conn
+
+    def call(self, op: str, *args):
+        """허브에 요청 하나 (스레드마다 연결 하나). 보내기 전에 끊긴 연결만 다시 잇고 재시도한다."""
+        for attempt in range(2):
+            conn = self._connection()
+            try:
+                conn.send((op, args))
+            except OSError:
+                self._local.conn = None
+                continue
+            try:
+                status, value = conn.recv()
+            except (OSError, EOFError) as e:
+                # 허브가 처리 중에 죽었으면 반영 여부를 모른다 — 재시도하지 않음
+                self._local.conn = None
+                raise ConnectionError(f"brain hub connection lost: {e}") from e
+            if status != "ok":
+                raise RuntimeError(value)
+            return value
+        raise ConnectionError("brain hub unavailable")
+
+    def get(self, user_id: str) -> SharedBrainClient:
+        with self._lock:
+            client = self._clients.get(user_id)
+            if client is not None:
+                self._clients.move_to_end(user_id)
+                return client
+            client = self._clients[user_id] = SharedBrainClient(
+                self, user_id, _view_image_path(self.run_dir, user_id))
+            victims = []
+            while len(self._clients) > self.max_brains:
+                victims.append(self._clients.popitem(last=False)[1])
+        for victim in victims:
+            victim.close()
+        return client
+
+    @contextmanager
+    def lease(self, user_id: str) -> Iterator[SharedBrainClient]:
+        # 클라이언트는 파일을 들고 있지 않아(쓰기는 허브로) 쓰는 중에 내려가도 안전 — 세기만 맞춘다
+        yield self.get(user_id)
+
+    def evict(self, user_id: str) -> bool:
+        with self._lock:
+            client = self._clients.pop(user_id, None)
+        if client is None:
+            return False
+        client.close()
+        return True
+
+    def flush_all(self) -> None:
+        self.call("flush")
+
+    def stats(self) -> Dict:
+        with self._lock:
+            clients = list(self._clients.items())
+        return {
+            "brains": len(clients),
+            "memory_bytes": sum(c.memory_footprint() for _, c in clients),
+            "users": [u for u, _ in clients],
+            "hub": self.hub is not None,
+        }
+
+    def close(self) -> None:
+        with self._lock:
+            clients = list(self._clients.values())
+            self._clients.clear()
+            hub, self.hub = self.hub, None
+        for client in clients:
+            client.close()
+        if hub is not None:
+            hub.close()
+        atexit.unregister(self.close)
+
+
+# ------------------ HTTP API ------------------
+# gunicorn app:app -k uvicorn.workers.UvicornWorker
+# 브레인 호출(파일/DB I/O 가능)은 전부 asyncio.to_thread 로 넘겨 이벤트 루프를 막지 않는다.
+
+BRAIN_DIR = os.environ.get("BRAIN_DIR", "brains")
+BRAIN_BACKEND = os.environ.get("BRAIN_BACKEND", "json")
+# 워커 여러 개가 같은 BRAIN_DIR 을 쓸 때: 쓰기는 허브 워커 한 곳, 추천은 공유 뷰 이미지
+BRAIN_SHARED = os.environ.get("BRAIN_SHARED", "0") not in ("", "0")
+# JSON 스냅샷 압축 (gzip / zstd) — 비우면 압축 안 함
+BRAIN_COMPRESSION = os.environ.get("BRAIN_COMPRESSION") or None
+
+
+class ObserveIn(BaseModel):
+    """전체 텍스트(text) 또는 편집 델타(offset/deleted/inserted) 중 하나."""
+    doc_id: str = Field(..., min_length=1, max_length=128)
+    text: Optional[str] = Field(None, max_length=2_000_000)
+    offset: Optional[int] = Field(None, ge=0)
+    deleted: int = Field(0, ge=0)
+    inserted: str = Field("", max_length=200_000)
+    base_length: Optional[int] = Field(None, ge=0)
+
+
+class AcceptIn(BaseModel):
+    doc_id: str = Field(..., min_length=1, max_length=128)
+    word: str = Field(..., min_length=1, max_length=64)
+    prev: Optional[str] = Field(None, max_length=256)  # 커서 앞 텍스트 (n-gram 강화)
+
+
+class SuggestIn(BaseModel):
+    id: int = 0  # 클라이언트 요청 번호 — 응답에 그대로 돌려줌
+    prefix: str = Field("", max_length=32)  # 비어 있으면 prev 기준 다음 단어 예측
+    doc_id: Optional[str] = Field(None, max_length=128)
+    top_n: int = Field(8, ge=1, le=50)
+    prev: Optional[str] = Field(None, max_length=256)  # 커서 앞 텍스트
+    fuzzy: int = Field(0, ge=0, le=2)  # 오타 허용 편집 거리
+
+
+brains = None  # BrainManager | SharedBrainManager
+
+
+@asynccontextmanager
+async def lifespan(_app: FastAPI):
+    global brains
+    # 워커 프로세스마다 자기 관리자를 만든다 (fork 이전에 파일 핸들/스레드를 만들지 않음)
+    manager_cls = SharedBrainManager if BRAIN_SHARED else BrainManager
+    extra = {"compression": BRAIN_COMPRESSION} if BRAIN_COMPRESSION else {}
+    brains = manager_cls(BRAIN_DIR, backend=BRAIN_BACKEND, **extra)
+    try:
+        yield
+    finally:
+        await asyncio.to_thread(brains.close)
+
+
+app = FastAPI(title="ThinkHelper Brain", lifespan=lifespan)
+
+
+def _suggest(
+    user_id: str,
+    prefix: str,
+    doc_id: Optional[str],
+    top_n: int,
+    prev: Optional[str] = None,
+    fuzzy: int = 0,
+) -> List[Tuple[str, float]]:
+    with brains.lease(user_id) as brain:
+        return brain.get_suggestions_scored(prefix, doc_id, top_n, prev, fuzzy)
+
+
+def _observe(user_id: str, body: ObserveIn) -> Optional[bool]:
+    with brains.lease(user_id) as brain:
+        if body.text is not None:
+            brain.observe_text_incremental(body.doc_id, body.text)
+            return None
+        return brain.observe_text_delta(
+            body.doc_id, body.offset, body.deleted, body.inserted, body.base_length
         )
-        # 문서별 강화 + 컨텍스트 TF 점수
-        return g + self._per_doc_accept_score(word, doc_id) + self._context_score(word, doc_id)
 
-    # ------------------ Suggestion ------------------
 
-    def _lang_of_prefix(self, prefix: str) -> str:
-        return "ko" if re.search(r"[가-힣]", prefix) else "en"
+def _accept(user_id: str, doc_id: str, word: str, prev: Optional[str] = None) -> None:
+    with brains.lease(user_id) as brain:
+        brain.accept_suggestion(doc_id, word, prev)
 
-    def _candidate_pool(self, lang: str) -> List[str]:
-        base = self.dict_ko_base if lang == "ko" else self.dict_en_base
-        user = self.memory["user_dict"].get(lang, [])
-        # 순서 보존하며 중복 제거
-        seen = set()
-        out = []
-        for w in user + base:
-            if w not in seen:
-                seen.add(w)
-                out.append(w)
-        return out
 
-    def get_suggestions(self, prefix: str, doc_id: Optional[str] = None, top_n: int = 8) -> List[str]:
-        if not prefix:
-            return []
-        lang = self._lang_of_prefix(prefix)
-        p = prefix.lower()
+@app.get("/health")
+async def health():
+    return {"status": "ok", **await asyncio.to_thread(brains.stats)}
 
-        pool = self._candidate_pool(lang)
-        cand = [w for w in pool if w.lower().startswith(p)]
 
-        scored = sorted(cand, key=lambda w: (-self._score_word(w, doc_id), w))
-        return scored[:top_n]
+@app.post("/observe")
+async def observe(body: ObserveIn, x_user_id: str = Header("default", max_length=64)):
+    if body.text is None and body.offset is None:
+        raise HTTPException(status_code=422, detail="text or offset required")
+    applied = await asyncio.to_thread(_observe, x_user_id, body)
+    if applied is False:
+        # 서버에 직전 텍스트가 없음/길이 불일치 → 클라이언트가 전체 텍스트로 재전송
+        return JSONResponse({"ok": False, "resync": True}, status_code=409)
+    return {"ok": True, "mode": "full" if applied is None else "delta"}
 
-    # ------------------ Reinforcement ------------------
 
-    def accept_suggestion(self, doc_id: str, word: str) -> None:
-        # 전역 강화
-        self.memory["accept_counts"][word] = self.memory["accept_counts"].get(word, 0) + 1
-        self.memory["last_used_at"][word] = now_ms()
+@app.get("/suggest")
+async def suggest(
+    prefix: str = Query("", max_length=32),
+    doc_id: Optional[str] = Query(None, max_length=128),
+    top_n: int = Query(8, ge=1, le=50),
+    prev: Optional[str] = Query(None, max_length=256),
+    fuzzy: int = Query(0, ge=0, le=2),
+    x_user_id: str = Header("default", max_length=64),
+):
+    scored = await asyncio.to_thread(_suggest, x_user_id, prefix, doc_id, top_n, prev, fuzzy)
+    return {
+        "prefix": prefix,
+        "suggestions": [{"word": w, "score": round(s, 4)} for w, s in scored],
+    }
 
-        # 문서별 강화
-        pda = self.memory.setdefault("per_doc_accept", {})
-        drec = pda.setdefault(doc_id, {"accept_counts": {}, "last_used_at": {}})
-        drec["accept_counts"][word] = drec["accept_counts"].get(word, 0) + 1
-        drec["last_used_at"][word] = now_ms()
 
-        self.save_memory()
-        # 로그 용도: 실제 서비스에선 로깅 시스템으로 전송
-        print(f"👍 Learned: '{word}' (global={self.memory['accept_counts'][word]}, doc={drec['accept_counts'][word]})")
+@app.post("/accept")
+async def accept(body: AcceptIn, x_user_id: str = Header("default", max_length=64)):
+    await asyncio.to_thread(_accept, x_user_id, body.doc_id, body.word, body.prev)
+    return {"ok": True}
+
+
+@app.websocket("/ws")
+async def ws_stream(sock: WebSocket, user: str = Query("default", max_length=64)):
+    """
+    키 입력 단위 스트리밍 채널 (연결 하나로 suggest/observe/accept).
+    → {"type": "suggest", "id", "prefix", "doc_id", "top_n", "prev", "fuzzy"}
+      {"type": "observe", ...ObserveIn}   {"type": "accept", "doc_id", "word", "prev"}
+    ← {"type": "suggestions", "id", "prefix", "suggestions": [{word, score}]}
+      {"type": "observed", "ok", "resync"}  {"type": "accepted"}  {"type": "error", "detail"}
+      (suggest 처리 중 실패한 error 에는 요청의 "id" 도 붙는다)
+    새 suggest 가 오면 아직 끝나지 않은 이전 suggest 는 취소하고 결과도 보내지 않는다.
+    observe/accept 는 도착 순서대로 별도 태스크에서 처리해 suggest 를 막지 않는다.
+    """
+    await sock.accept()
+    send_lock = asyncio.Lock()
+    writes: asyncio.Queue = asyncio.Queue()
+    latest = {"id": None}
+    pending: Optional[asyncio.Task] = None
+
+    async def send(msg: Dict) -> None:
+        async with send_lock:
+            await sock.send_json(msg)
+
+    async def run_suggest(req: SuggestIn) -> None:
+        try:
+            scored = await asyncio.to_thread(
+                _suggest, user, req.prefix, req.doc_id, req.top_n, req.prev, req.fuzzy
+            )
+        except Exception as e:
+            print(f"⚠️ ws suggest failed ({user}): {e}")
+            await send({"type": "error", "id": req.id, "detail": f"{type(e).__name__}: {e}"})
+            return
+        if latest["id"] != req.id:
+            return  # 그 사이 더 새 접두사가 왔음
+        await send({
+            "type": "suggestions",
+            "id": req.id,
+            "prefix": req.prefix,
+            "suggestions": [{"word": w, "score": round(sc, 4)} for w, sc in scored],
+        })
+
+    async def writer() -> None:
+        while True:
+            msg = await writes.get()
+            try:
+                if msg["type"] == "observe":
+                    body = ObserveIn(**msg)
+                    if body.text is None and body.offset is None:
+                        await send({"type": "error", "detail": "text or offset required"})
+                        continue
+                    applied = await asyncio.to_thread(_observe, user, body)
+                    await send({"type": "observed", "ok": applied is not False,
+                                "resync": applied is False})
+                else:
+                    body = AcceptIn(**msg)
+                    await asyncio.to_thread(_accept, user, body.doc_id, body.word, body.prev)
+                    await send({"type": "accepted", "word": body.word})
+            except ValidationError as e:
+                await send({"type": "error", "detail": e.errors(include_url=False)})
+            except Exception as e:
+                # 허브 연결/저장 실패 등 — 이 프레임만 실패로 알리고 다음 쓰기는 계속 처리
+                print(f"⚠️ ws {msg.get('type')} failed ({user}): {e}")
+                await send({"type": "error", "detail": f"{type(e).__name__}: {e}"})
+
+    writer_task = asyncio.create_task(writer())
+    try:
+        while True:
+            try:
+                msg = json.loads(await sock.receive_text())
+                kind = msg.get("type")
+                if kind == "suggest":
+                    req = SuggestIn(**msg)
+                    latest["id"] = req.id
+                    if pending is not None and not pending.done():
+                        pending.cancel()
+                    pending = asyncio.create_task(run_suggest(req))
+                elif kind in ("observe", "accept"):
+                    writes.put_nowait(msg)
+                else:
+                    await send({"type": "error", "detail": f"unknown type: {kind}"})
+            except (ValueError, AttributeError) as e:
+                detail = e.errors(include_url=False) if isinstance(e, ValidationError) else str(e)
+                await send({"type": "error", "detail": detail})
+    except WebSocketDisconnect:
+        pass
+    finally:
+        writer_task.cancel()
+        if pending is not None:
+            pending.cancel()
+
+
+# ------------------ Benchmarks ------------------
+
+def _scratch_brain(**kwargs) -> ThinkHelperBrain:
+    # 벤치마크용: 임시 디렉터리의 빈 브레인
+    path = os.path.join(tempfile.mkdtemp(prefix="thinkhelper-bench-"), "brain_data.json")
+    return ThinkHelperBrain(path, **kwargs)
+
+
+def _sample_corpus(size_bytes: int, seed: int = 0) -> str:
+    # 기본 사전 + 불용어 + 문장부호를 섞은 한/영 혼합 문서
+    brain = _scratch_brain()
+    vocab = (
+        brain.dict_ko_base + brain.dict_en_base + sorted(brain.stop_ko) + sorted(brain.stop_en)
+        + ["자율주행", "인공지능", "센서", "Analysis", "Pipeline", "state-of-the-art", "a", "가"]
+    )
+    brain.close()
+    rnd = random.Random(seed)
+    parts, n = [], 0
+    while n < size_bytes:
+        piece = rnd.choice(vocab) + rnd.choice((" ", " ", " ", ", ", ". ", "\n"))
+        parts.append(piece)
+        n += len(piece.encode("utf-8"))
+    return "".join(parts)
+
+
+def bench_tokenize(size_mb: float = 4.0, repeat: int = 5) -> None:
+    """extract_tokens 처리량(MB/s): 이전 2-패스 방식 vs 단일 패스."""
+    brain = _scratch_brain()
+    text = _sample_corpus(int(size_mb * 1024 * 1024))
+    mb = len(text.encode("utf-8")) / (1024 * 1024)
+
+    def two_pass(t: str):
+        ko = [w for w in re.findall(r"[가-힣]{2,}", t) if w not in brain.stop_ko and len(w) <= 20]
+        en = [w.lower() for w in re.findall(r"[A-Za-z][A-Za-z\-]{2,}", t)
+              if w.lower() not in brain.stop_en and len(w) <= 24]
+        return {"ko": ko, "en": en}
+
+    assert two_pass(text) == brain._tokenize(text)
+    print(f"corpus: {mb:.2f} MB (utf-8), {len(text):,} chars")
+    for name, fn in (("two-pass (legacy)", two_pass), ("single-pass", brain._tokenize)):
+        best = min(_timeit(fn, text) for _ in range(repeat))
+        print(f"  {name:<18} {mb / best:8.2f} MB/s  ({best * 1000:.1f} ms)")
+    brain.close()
+
+
+def bench_ingest(n_docs: int = 2000, doc_kb: float = 4.0, workers: Tuple[int, ...] = (0, 2, 4)) -> None:
+    """bulk_observe 처리량: 워커 수별 문서/s, MB/s (디스크의 임시 코퍼스 기준)."""
+    corpus_dir = tempfile.mkdtemp(prefix="thinkhelper-corpus-")
+    total = 0
+    for i in range(n_docs):
+        text = _sample_corpus(int(doc_kb * 1024), seed=i)
+        total += len(text.encode("utf-8"))
+        with open(os.path.join(corpus_dir, f"doc{i:05d}.txt"), "w", encoding="utf-8") as fh:
+            fh.write(text)
+    mb = total / (1024 * 1024)
+    print(f"corpus: {n_docs:,} docs, {mb:.2f} MB, cpu={os.cpu_count()}")
+    for n in workers:
+        brain = _scratch_brain()
+        t0 = time.perf_counter()
+        brain.bulk_observe(iter_corpus_dir(corpus_dir), workers=n)
+        dt = time.perf_counter() - t0
+        brain.close()
+        print(f"  workers={n:<3} {n_docs / dt:10,.0f} docs/s {mb / dt:8.2f} MB/s  ({dt:.2f}s)")
+
+
+def _zipf_docs(n_docs: int, doc_kb: float, n_words: int, seed: int = 0):
+    # 어휘 n_words 개(한/영 반반, 합성 단어)에서 Zipf 분포로 뽑은 문서 (doc_id, 본문) — 실제 문서처럼 긴 꼬리
+    rnd = random.Random(seed)
+    lexicon = []
+    for i in range(n_words):
+        if i % 2:
+            lexicon.append("".join(chr(0xAC00 + rnd.randrange(11172)) for _ in range(rnd.randint(2, 4))))
+        else:
+            lexicon.append("".join(chr(97 + rnd.randrange(26)) for _ in range(rnd.randint(4, 10))))
+    weights = list(itertools.accumulate(1.0 / (r + 1) for r in range(n_words)))
+    per_doc = max(1, int(doc_kb * 1024 / 8))
+    for d in range(n_docs):
+        yield f"doc{d:05d}", " ".join(rnd.choices(lexicon, cum_weights=weights, k=per_doc))
+
+
+def bench_save(doc_counts: Tuple[int, ...] = (200, 2000, 10000), doc_kb: float = 2.0, repeat: int = 3) -> None:
+    """save_memory 한 번의 스냅샷 크기/저장 시간/읽기 시간: 형식(style, JSON 라이브러리, 압축)별, 브레인 크기별."""
+    formats = [("pretty", None, False), ("compact", None, False)]
+    if orjson is not None:
+        formats += [("pretty", None, True), ("compact", None, True)]
+    formats.append(("compact", "gzip", True))
+    if zstandard is not None:
+        formats.append(("compact", "zstd", True))
+    fast_name = "orjson" if orjson is not None else "json"
+    for n in doc_counts:
+        brain = _scratch_brain(token_cap=None, write_behind=True, flush_interval=3600, flush_ops=10**9)
+        brain.bulk_observe(_zipf_docs(n, doc_kb, n_words=20 * n, seed=n))
+        # 문서 10개 중 하나꼴로 수락 기록 (전역 + 문서별)
+        rnd = random.Random(n)
+        words = brain.memory["user_dict"]["ko"] + brain.memory["user_dict"]["en"]
+        with brain._lock:
+            for i in range(0, n, 10):
+                apply_record(brain.memory, {"op": "accept", "doc": f"doc{i:05d}", "w": rnd.choice(words),
+                                            "ts": now_ms() - rnd.randrange(10**9)})
+        mem = brain.memory
+        print(f"brain: {n:,} docs x {doc_kb:g} KB, vocab {len(mem['vocab']):,}, "
+              f"n-grams {len(mem['ngrams']):,}")
+        print(f"  {'style':<8}{'json':<8}{'compress':<10}{'size':>10}{'save':>10}{'load':>10}")
+        path = os.path.join(os.path.dirname(brain.storage_file), "bench.json")
+        for style, compression, fast in formats:
+            storage = JsonStorage(path, style=style, compression=compression, fast_json=fast)
+            best = math.inf
+            for _ in range(repeat):
+                t0 = time.perf_counter()
+                with brain._lock:
+                    job = storage.begin_save(mem)
+                storage.finish_save(job)
+                best = min(best, time.perf_counter() - t0)
+            size = os.path.getsize(path)
+            load = min(_timeit(JsonStorage(path, fast_json=fast).load) for _ in range(repeat))
+            print(f"  {style:<8}{fast_name if fast else 'json':<8}{compression or '-':<10}"
+                  f"{size / 1024:9,.0f}K{best * 1000:8.1f}ms{load * 1000:8.1f}ms")
+        brain.close()
+
+
+def _timeit(fn, *args) -> float:
+    t0 = time.perf_counter()
+    fn(*args)
+    return time.perf_counter() - t0
 
 
 # ------------------ Demo ------------------
-if __name__ == "__main__":
+
+def run_demo() -> None:
     brain = ThinkHelperBrain()
 
     doc_id = "doc_123"
@@ -260,3 +4389,53 @@ if __name__ == "__main__":
     brain.accept_suggestion(doc_id, "자율주행")
 
     print("[5] 재추천(강화 반영):", brain.get_suggestions("자", doc_id, top_n=6))
+
+
+if __name__ == "__main__":
+    import argparse
+
+    parser = argparse.ArgumentParser(description="ThinkHelper Brain")
+    sub = parser.add_subparsers(dest="cmd")
+    sub.add_parser("demo", help="실시간 학습/추천 데모 (기본)")
+    p_tok = sub.add_parser("bench-tokenize", help="토크나이저 처리량(MB/s) 측정")
+    p_tok.add_argument("--mb", type=float, default=4.0, help="샘플 문서 크기(MB)")
+    p_bi = sub.add_parser("bench-ingest", help="일괄 학습 처리량(워커 수별) 측정")
+    p_bi.add_argument("--docs", type=int, default=2000, help="문서 수")
+    p_bi.add_argument("--kb", type=float, default=4.0, help="문서당 크기(KB)")
+    p_bi.add_argument("--workers", type=int, nargs="+", default=[0, 2, 4])
+    p_bs = sub.add_parser("bench-save", help="스냅샷 형식/압축별 저장 크기와 시간 측정")
+    p_bs.add_argument("--docs", type=int, nargs="+", default=[200, 2000, 10000], help="브레인 문서 수")
+    p_bs.add_argument("--kb", type=float, default=2.0, help="문서당 크기(KB)")
+    p_ing = sub.add_parser("ingest", help="문서 디렉터리로 브레인 예열 (일괄 학습)")
+    p_ing.add_argument("corpus", help="문서 디렉터리 (하위 폴더 포함)")
+    p_ing.add_argument("--user", help="BrainManager 사용자 ID (없으면 --brain 파일에 직접)")
+    p_ing.add_argument("--brain", default="brain_data.json", help="브레인 파일 (--user 없을 때)")
+    p_ing.add_argument("--brain-dir", default=BRAIN_DIR, help="사용자별 브레인 디렉터리")
+    p_ing.add_argument("--backend", choices=("json", "sqlite"), default=BRAIN_BACKEND)
+    p_ing.add_argument("--workers", type=int, default=0,
+                       help="토큰화 프로세스 수 (0 = 현재 프로세스, -1 = CPU 수)")
+    p_ing.add_argument("--ext", nargs="+", default=[".txt", ".md"], help="포함할 확장자")
+    args = parser.parse_args()
+
+    if args.cmd == "bench-tokenize":
+        bench_tokenize(args.mb)
+    elif args.cmd == "bench-ingest":
+        bench_ingest(args.docs, args.kb, tuple(args.workers))
+    elif args.cmd == "bench-save":
+        bench_save(tuple(args.docs), args.kb)
+    elif args.cmd == "ingest":
+        exts = tuple(e.lower() if e.startswith(".") else "." + e.lower() for e in args.ext)
+        if args.user:
+            manager = BrainManager(args.brain_dir, backend=args.backend, write_behind=False)
+            target = manager.acquire(args.user)
+        else:
+            manager = None
+            storage = SqliteStorage(args.brain) if args.backend == "sqlite" else None
+            target = ThinkHelperBrain(args.brain, storage=storage)
+        t0 = time.perf_counter()
+        result = target.bulk_observe(iter_corpus_dir(args.corpus, exts), workers=args.workers)
+        print(f"ingested {result['docs']:,} docs / {result['tokens']:,} tokens "
+              f"in {time.perf_counter() - t0:.2f}s → {target.storage_file}")
+        (manager or target).close()
+    else:
+        run_demo()
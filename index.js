@@ -3,6 +3,7 @@
  * - 실시간 관찰 (/observe)
  * - 접두사 추천 (/suggest)
  * - 수락 강화 (/accept)
+ * - 스트리밍 채널 (/ws) — 연결되어 있으면 위 세 가지를 WebSocket 하나로, 끊기면 HTTP 폴백
  * - VSCode 스타일 suggestionBox 렌더/키보드 제어
  */
 
@@ -12,7 +13,10 @@ const ENDPOINTS = {
   observe: `${API_BASE}/observe`,
   suggest: `${API_BASE}/suggest`,
   accept:  `${API_BASE}/accept`,
+  ws:      `${API_BASE.replace(/^http/, 'ws')}/ws`,
 };
+// 오타 허용 편집 거리 (0~2) — 정확히 맞는 후보가 모자랄 때만 서버가 채운다
+const FUZZY = 2;
 
 const DOC_ID = (() => {
   // URL ?doc=xxx 우선, 없으면 sessionStorage 유지, 마지막으로 시간기반 새로 생성
@@ -58,6 +62,17 @@ function getPrefixFromSelection() {
   return m ? m[0] : '';
 }
 
+/** 접두사 앞쪽 텍스트(최대 80자) — 서버 n-gram 문맥(prev)용 */
+function getPrevTextFromSelection() {
+  const sel = window.getSelection?.();
+  if (!sel || sel.rangeCount === 0) return '';
+  const node = sel.getRangeAt(0).startContainer;
+  if (!node || node.nodeType !== Node.TEXT_NODE) return '';
+  const left = (node.textContent || '').slice(0, sel.getRangeAt(0).startOffset);
+  const prefix = getPrefixFromSelection();
+  return left.slice(0, left.length - prefix.length).slice(-80);
+}
+
 /** 언어 추정 (간단) */
 function guessLangFromPrefix(prefix) {
   if (/[가-힣]/.test(prefix)) return 'ko';
@@ -86,34 +101,130 @@ async function initEditor() {
 }
 
 /* ================== Backend IO ================== */
-async function observeDocument(docId, text) {
-  // POST /observe {doc_id, text}
-  const r = await fetch(ENDPOINTS.observe, {
+let lastObserved = null; // 서버에 마지막으로 반영된 텍스트 (델타 계산용)
+
+/** 이전/현재 텍스트의 공통 앞·뒤를 잘라 단일 편집 델타로 만든다 */
+function textDelta(prev, next) {
+  if (prev === next) return null;
+  let start = 0;
+  const max = Math.min(prev.length, next.length);
+  while (start < max && prev.charCodeAt(start) === next.charCodeAt(start)) start++;
+  let endPrev = prev.length, endNext = next.length;
+  while (endPrev > start && endNext > start &&
+         prev.charCodeAt(endPrev - 1) === next.charCodeAt(endNext - 1)) {
+    endPrev--; endNext--;
+  }
+  return { offset: start, deleted: endPrev - start, inserted: next.slice(start, endNext) };
+}
+
+async function postObserve(body) {
+  return fetch(ENDPOINTS.observe, {
     method: 'POST',
     headers: {'Content-Type': 'application/json'},
-    body: JSON.stringify({ doc_id: docId, text }),
+    body: JSON.stringify(body),
   });
+}
+
+/* ---------- WebSocket 스트리밍 ---------- */
+let ws = null;
+let wsSeq = 0;
+let wsWaiter = null; // 가장 최근 suggest 요청 {id, resolve} — 이전 요청은 stale 처리
+
+function wsReady() {
+  return ws && ws.readyState === WebSocket.OPEN;
+}
+
+function connectStream() {
+  try {
+    ws = new WebSocket(ENDPOINTS.ws);
+  } catch (e) {
+    ws = null;
+    return;
+  }
+  ws.onmessage = (ev) => {
+    let msg;
+    try { msg = JSON.parse(ev.data); } catch { return; }
+    if (msg.type === 'suggestions') {
+      if (wsWaiter && wsWaiter.id === msg.id) {
+        const w = wsWaiter; wsWaiter = null;
+        w.resolve((msg.suggestions || []).map(s => s.word));
+      }
+    } else if (msg.type === 'observed' && msg.resync && lastObserved !== null) {
+      // 서버에 문서 상태가 없음 → 최신 전체 텍스트로 재동기화
+      ws.send(JSON.stringify({ type: 'observe', doc_id: DOC_ID, text: lastObserved }));
+    } else if (msg.type === 'error') {
+      console.warn('[ws]', msg.detail);
+    }
+  };
+  ws.onclose = () => {
+    ws = null;
+    if (wsWaiter) { wsWaiter.resolve(null); wsWaiter = null; }
+    lastObserved = null; // 재연결 후 첫 관찰은 전체 텍스트
+    setTimeout(connectStream, 3000);
+  };
+}
+
+async function observeDocument(docId, text) {
+  if (wsReady()) {
+    const d = lastObserved !== null ? textDelta(lastObserved, text) : null;
+    if (lastObserved !== null && !d) return;
+    const base_length = lastObserved !== null ? lastObserved.length : undefined;
+    ws.send(JSON.stringify(d
+      ? { type: 'observe', doc_id: docId, ...d, base_length }
+      : { type: 'observe', doc_id: docId, text }));
+    lastObserved = text;
+    return;
+  }
+  // POST /observe {doc_id, offset, deleted, inserted, base_length} — 첫 호출/재동기화는 {doc_id, text}
+  let r;
+  if (lastObserved !== null) {
+    const d = textDelta(lastObserved, text);
+    if (!d) return;
+    r = await postObserve({ doc_id: docId, ...d, base_length: lastObserved.length });
+  }
+  if (!r || r.status === 409) {
+    r = await postObserve({ doc_id: docId, text });
+  }
   if (!r.ok) throw new Error('observe failed');
+  lastObserved = text;
 }
 
-async function fetchSuggestions(prefix, docId, topN = 8) {
-  // GET /suggest?prefix=...&doc_id=...&top_n=8
+async function fetchSuggestions(prefix, docId, topN = 8, prev = '') {
+  // 스트리밍 채널: 새 요청이 나가면 이전 요청은 null(무시)로 끝난다
+  if (wsReady()) {
+    if (wsWaiter) wsWaiter.resolve(null);
+    const id = ++wsSeq;
+    const p = new Promise(resolve => { wsWaiter = { id, resolve }; });
+    ws.send(JSON.stringify({
+      type: 'suggest', id, prefix, doc_id: docId, top_n: topN, prev, fuzzy: FUZZY,
+    }));
+    return p;
+  }
+  // GET /suggest?prefix=...&doc_id=...&top_n=8&prev=...
   const url = new URL(ENDPOINTS.suggest);
   url.searchParams.set('prefix', prefix);
   url.searchParams.set('doc_id', docId);
   url.searchParams.set('top_n', String(topN));
+  if (prev) url.searchParams.set('prev', prev);
+  url.searchParams.set('fuzzy', String(FUZZY));
   const r = await fetch(url.toString(), { method: 'GET' });
   if (!r.ok) throw new Error('suggest failed');
   const data = await r.json();
-  return Array.isArray(data) ? data : (data.suggestions || []);
+  const list = Array.isArray(data) ? data : (data.suggestions || []);
+  // 서버는 [{word, score}] 로 응답 — 렌더링은 단어만
+  return list.map(s => (typeof s === 'string' ? s : s.word));
 }
 
-async function acceptSuggestion(docId, word) {
-  // POST /accept {doc_id, word}
+async function acceptSuggestion(docId, word, prev = '') {
+  if (wsReady()) {
+    ws.send(JSON.stringify({ type: 'accept', doc_id: docId, word, prev }));
+    return;
+  }
+  // POST /accept {doc_id, word, prev}
   const r = await fetch(ENDPOINTS.accept, {
     method: 'POST',
     headers: {'Content-Type': 'application/json'},
-    body: JSON.stringify({ doc_id: docId, word }),
+    body: JSON.stringify({ doc_id: docId, word, prev }),
   });
   if (!r.ok) throw new Error('accept failed');
 }
@@ -199,6 +310,7 @@ function applySuggestion(word) {
 
   // 접두사 길이만큼 지우고 전체 단어 삽입
   const prefix = getPrefixFromSelection();
+  const prev = getPrevTextFromSelection();
   editor.model.change(writer => {
     const sel = editor.model.document.selection;
     const pos = sel.getFirstPosition();
@@ -212,7 +324,7 @@ function applySuggestion(word) {
   });
 
   // 강화학습 신호 전송 (비동기)
-  acceptSuggestion(DOC_ID, word).catch(console.warn);
+  acceptSuggestion(DOC_ID, word, prev).catch(console.warn);
   closeSuggestion();
 }
 
@@ -246,14 +358,17 @@ function setupAutocomplete(ed) {
   // 타이핑 후 추천 질의 (디바운스)
   const querySuggest = debounce(async () => {
     const prefix = getPrefixFromSelection();
-    if (!prefix) return closeSuggestion();
+    const prev = getPrevTextFromSelection();
+    // 접두사가 없으면 단어 뒤 공백에서만 다음 단어 예측
+    if (!prefix && !/[\p{L}\p{N}][ ]$/u.test(prev)) return closeSuggestion();
 
     // UI 표시용 언어 갱신 (선택)
     const lang = guessLangFromPrefix(prefix);
     const langDisp = $('langGuess'); if (langDisp) langDisp.textContent = lang;
 
     try {
-      const cands = await fetchSuggestions(prefix, DOC_ID, 8);
+      const cands = await fetchSuggestions(prefix, DOC_ID, 8, prev);
+      if (cands === null) return; // 더 새 요청에 밀린 응답
       if (Array.isArray(cands) && cands.length) {
         showSuggestion(cands);
       } else {
@@ -283,4 +398,7 @@ function setupAutocomplete(ed) {
 }
 
 /* ================== Boot ================== */
-document.addEventListener('DOMContentLoaded', initEditor);
+document.addEventListener('DOMContentLoaded', () => {
+  connectStream();
+  initEditor();
+});
@@ -0,0 +1,83 @@
+import random
+import threading
+import time
+import traceback
+
+import app
+
+WORDS = ["alpha", "beta", "gamma", "delta", "model", "modal", "analysis", "가나다", "가방",
+         "자율주행", "자유", "benchmark", "bench"]
+
+
+def test_concurrent_readers_and_writers(tmp_path):
+    path = str(tmp_path / "cc.json")
+    brain = app.ThinkHelperBrain(path, wal=True, wal_compact_bytes=20_000, flush_interval=0.01, user_dict_cap=300)
+    errors = []
+    stop = time.time() + 2.0
+
+    def guard(fn):
+        def run():
+            rnd = random.Random(threading.get_ident())
+            try:
+                while time.time() < stop:
+                    fn(rnd)
+            except Exception:
+                errors.append(traceback.format_exc())
+        return run
+
+    def observe(rnd):
+        text = " ".join(rnd.choice(WORDS) + "x" * rnd.randrange(3) for _ in range(rnd.randrange(200)))
+        brain.observe_text_incremental(f"d{rnd.randrange(8)}", text)
+
+    def delta(rnd):
+        doc = f"d{rnd.randrange(8)}"
+        if not brain.observe_text_delta(doc, 0, 0, rnd.choice(WORDS) + " "):
+            brain.observe_text_incremental(doc, "alpha beta")
+
+    def accept(rnd):
+        brain.accept_suggestion(f"d{rnd.randrange(8)}", rnd.choice(WORDS), prev=rnd.choice(WORDS))
+
+    def suggest(rnd):
+        brain.get_suggestions(rnd.choice(["a", "mo", "가", "ㄱ", "ben", "anlys", ""]), f"d{rnd.randrange(8)}", 8,
+                              prev=rnd.choice([None, "model ", "alpha"]), fuzzy=2)
+
+    def pinned(rnd):
+        # 한 번 집은 스냅샷은 쓰기가 계속되어도 같은 답을 준다
+        doc = f"d{rnd.randrange(8)}"
+        view = brain._read_view(doc)
+        q, prev = rnd.choice(["a", "mo", "가", "ben", ""]), rnd.choice([None, "model "])
+        first = [w for w, _ in brain._suggest_scored(q, doc, 8, prev, 2, view)]
+        size = sum(1 for _ in view.index["en"].iter_prefix(""))
+        time.sleep(0.01)
+        assert first == [w for w, _ in brain._suggest_scored(q, doc, 8, prev, 2, view)]
+        assert size == sum(1 for _ in view.index["en"].iter_prefix("")) == len(view.index["en"])
+
+    def save(rnd):
+        brain.save_memory()
+        time.sleep(0.05)
+
+    workers = [observe, observe, delta, accept, suggest, suggest, suggest, pinned, pinned, save]
+    threads = [threading.Thread(target=guard(fn)) for fn in workers]
+    for t in threads:
+        t.start()
+    for t in threads:
+        t.join()
+    assert not errors, errors[0]
+
+    with brain._lock:
+        corpus = brain.memory["corpus"]
+        ref = app.rebuild_corpus_stats({"vocab": brain.memory["vocab"], "doc_freq": brain.memory["doc_freq"]})
+        assert dict(corpus["df"].items()) == dict(ref["df"].items())
+        assert (corpus["n_docs"], corpus["n_tokens"]) == (ref["n_docs"], ref["n_tokens"])
+    queries = [("a", "d1"), ("mo", "d2"), ("가", "d3"), ("ben", None), ("ㄱ", "d0")]
+    before = [[w for w, _ in brain.get_suggestions_scored(q, d, 20)] for q, d in queries]
+    brain.rebuild_index()
+    assert before == [[w for w, _ in brain.get_suggestions_scored(q, d, 20)] for q, d in queries]
+    accepts = dict(brain.memory["accept_counts"].items())
+    doc_freq = brain.memory["doc_freq"]
+    brain.close()
+
+    reloaded = app.ThinkHelperBrain(path)
+    assert dict(reloaded.memory["accept_counts"].items()) == accepts
+    assert reloaded.memory["doc_freq"] == doc_freq
+    reloaded.close()
@@ -0,0 +1,47 @@
+import random
+
+import pytest
+
+import app
+
+WORDS = ["alpha", "beta", "gamma", "delta", "자율주행", "센서", "데이터를", "분석", "the", "a"]
+
+
+def _state(brain):
+    mem = brain.memory
+    return (
+        {d: dict(tf.items()) for d, tf in mem["doc_freq"].items() if tf},
+        sorted(mem["ngrams"].items()),
+        dict(mem["corpus"]["df"].items()),
+        mem["corpus"]["n_docs"],
+        mem["corpus"]["n_tokens"],
+    )
+
+
+@pytest.mark.parametrize("seed", range(20))
+def test_delta_observe_matches_full_observe(seed):
+    rnd = random.Random(seed)
+    other = " ".join(rnd.choice(WORDS) for _ in range(20))
+    text = " ".join(rnd.choice(WORDS) for _ in range(rnd.randint(0, 40)))
+    delta = app._scratch_brain()
+    full = app._scratch_brain()
+    try:
+        delta.observe_text_incremental("other", other)
+        delta.observe_text_incremental("d", text)
+        for _ in range(60):
+            # 단어 경계/음절/공백을 가로지르는 편집 (붙여넣기, 지우기, 한 글자 입력)
+            offset = rnd.randint(0, len(text))
+            deleted = rnd.randint(0, min(8, len(text) - offset))
+            inserted = rnd.choice(["", " ", rnd.choice(WORDS), f" {rnd.choice(WORDS)} ", rnd.choice("ab가 .")])
+            assert delta.observe_text_delta("d", offset, deleted, inserted)
+            text = text[:offset] + inserted + text[offset + deleted:]
+        full.observe_text_incremental("other", other)
+        full.observe_text_incremental("d", text)
+        assert _state(delta) == _state(full)
+        # 같은 본문을 통째로 다시 보내도 바뀌는 것이 없다
+        before = _state(delta)
+        delta.observe_text_incremental("d", text)
+        assert _state(delta) == before
+    finally:
+        delta.close()
+        full.close()
@@ -0,0 +1,55 @@
+import pytest
+from fastapi.testclient import TestClient
+
+import app
+
+
+@pytest.fixture
+def client(tmp_path, monkeypatch):
+    monkeypatch.setattr(app, "BRAIN_DIR", str(tmp_path))
+    with TestClient(app.app) as c:
+        yield c
+
+
+def test_observe_suggest_accept(client):
+    h = {"x-user-id": "u1"}
+    r = client.post("/observe", json={"doc_id": "d", "text": "analysis analysis model"}, headers=h)
+    assert r.status_code == 200
+    r = client.get("/suggest", params={"prefix": "an", "doc_id": "d"}, headers=h)
+    assert [s["word"] for s in r.json()["suggestions"]][:1] == ["analysis"]
+    assert client.post("/accept", json={"doc_id": "d", "word": "model"}, headers=h).status_code == 200
+
+
+def test_ws_reports_failures_and_keeps_going(client, monkeypatch):
+    accept, suggest = app._accept, app._suggest
+    failures = {"accept": 1, "suggest": 1}
+
+    def flaky_accept(*args):
+        if failures["accept"]:
+            failures["accept"] -= 1
+            raise OSError("disk full")
+        return accept(*args)
+
+    def flaky_suggest(*args):
+        if failures["suggest"]:
+            failures["suggest"] -= 1
+            raise ConnectionError("brain hub unavailable")
+        return suggest(*args)
+
+    monkeypatch.setattr(app, "_accept", flaky_accept)
+    monkeypatch.setattr(app, "_suggest", flaky_suggest)
+    with client.websocket_connect("/ws?user=u1") as ws:
+        ws.send_json({"type": "observe", "doc_id": "d", "text": "alpha alpha beta"})
+        assert ws.receive_json()["type"] == "observed"
+        ws.send_json({"type": "accept", "doc_id": "d", "word": "alpha"})
+        err = ws.receive_json()
+        assert err["type"] == "error" and "OSError" in err["detail"]
+        # 쓰기 태스크가 살아 있어 다음 프레임도 처리된다
+        ws.send_json({"type": "accept", "doc_id": "d", "word": "alpha"})
+        assert ws.receive_json() == {"type": "accepted", "word": "alpha"}
+        ws.send_json({"type": "suggest", "id": 7, "prefix": "al", "doc_id": "d"})
+        err = ws.receive_json()
+        assert err["type"] == "error" and err["id"] == 7
+        ws.send_json({"type": "suggest", "id": 8, "prefix": "al", "doc_id": "d"})
+        reply = ws.receive_json()
+        assert reply["id"] == 8 and reply["suggestions"][0]["word"] == "alpha"
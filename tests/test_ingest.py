@@ -0,0 +1,72 @@
+import time
+from collections import Counter
+
+import app
+
+
+def _state(brain):
+    mem = brain.memory
+    return (
+        mem["doc_freq"],
+        {lang: sorted(words) for lang, words in mem["user_dict"].items()},
+        sorted(mem["ngrams"].items()),
+        dict(mem["corpus"]["df"].items()),
+        mem["corpus"]["n_docs"],
+        mem["corpus"]["n_tokens"],
+    )
+
+
+def test_parallel_ingest_matches_in_process(tmp_path):
+    docs = list(app._zipf_docs(60, 1.0, 400, seed=2))
+    # 경로 입력은 워커가 직접 읽는다
+    for doc_id, text in docs[:20]:
+        (tmp_path / f"{doc_id}.txt").write_text(text, encoding="utf-8")
+    items = [(d, tmp_path / f"{d}.txt") for d, _ in docs[:20]] + docs[20:]
+    serial = app._scratch_brain()
+    parallel = app._scratch_brain()
+    ops = Counter()
+    commit = parallel._commit
+
+    def counting_commit(rec):
+        ops[rec["op"]] += 1
+        commit(rec)
+
+    parallel._commit = counting_commit
+    try:
+        t0 = time.perf_counter()
+        a = serial.bulk_observe(items, workers=0, batch_size=16, shard_size=4)
+        t1 = time.perf_counter()
+        b = parallel.bulk_observe(items, workers=2, batch_size=16, shard_size=4)
+        t2 = time.perf_counter()
+        assert a == b and a["docs"] == len(docs)
+        assert _state(serial) == _state(parallel)
+        # reduce 는 샤드마다 레코드 하나씩 (문서별 tf 레코드 없음)
+        shards = -(-len(docs) // 4)
+        assert ops["tfs"] == shards and ops["tf"] == 0 and ops["ng"] <= shards
+        # 처리량: 풀 기동과 워커 왕복을 더해도 직렬보다 크게 느려지면 안 된다
+        # (CPU 가 하나뿐인 환경에서도 통과하도록 느슨한 한도)
+        assert t2 - t1 <= 4 * (t1 - t0) + 0.5
+    finally:
+        serial.close()
+        parallel.close()
+
+
+def test_bulk_ingest_replays_from_wal(tmp_path):
+    docs = list(app._zipf_docs(30, 0.5, 300, seed=4))
+    path = str(tmp_path / "wal.json")
+    brain = app.ThinkHelperBrain(path, wal=True, wal_compact_bytes=1 << 30)
+    # 끝의 저장 없이 죽은 것처럼 — 샤드 레코드(tfs/ng/dict)만으로 다시 만들어져야 한다
+    brain.save_memory = lambda *args, **kwargs: None
+    brain.bulk_observe(docs, shard_size=4)
+    # 이미 있는 문서를 다시 넣으면 문서별 tf 레코드로 차이만
+    brain.bulk_observe(docs[:6] + [(docs[0][0], "alpha beta alpha")], shard_size=4)
+    expected = _state(brain)
+    brain.flush()
+    brain.storage.close()
+    brain._closed = True
+
+    reloaded = app.ThinkHelperBrain(path, wal=True)
+    try:
+        assert _state(reloaded) == expected
+    finally:
+        reloaded.close()
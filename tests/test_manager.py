@@ -0,0 +1,99 @@
+import sys
+import threading
+import time
+
+import pytest
+
+import app
+
+
+@pytest.fixture(params=["json", "sqlite"])
+def backend(request):
+    return request.param
+
+
+def test_lru_does_not_close_leased_brain(tmp_path, backend):
+    manager = app.BrainManager(str(tmp_path), backend=backend, max_brains=1, flush_interval=0.01)
+    try:
+        with manager.lease("alice") as alice:
+            with manager.lease("bob") as bob:
+                bob.accept_suggestion("d", "beta")
+            # bob 로드로 한도를 넘었지만 alice 는 빌려 쓰는 중 — 닫히면 안 된다
+            alice.observe_text_incremental("d", "alpha alpha gamma")
+            alice.accept_suggestion("d", "alpha")
+        with manager.lease("carol"):
+            pass
+        assert manager.stats()["users"] == ["carol"]
+        with manager.lease("alice") as alice:
+            assert alice.memory["accept_counts"].get("alpha") == 1
+    finally:
+        manager.close()
+
+
+def test_evicted_user_reloads_after_last_release(tmp_path, backend):
+    manager = app.BrainManager(str(tmp_path), backend=backend, flush_interval=0.01)
+    try:
+        first = manager.acquire("alice")
+        assert manager.evict("alice")
+        reloaded = []
+        t = threading.Thread(target=lambda: reloaded.append(manager.acquire("alice")))
+        t.start()
+        time.sleep(0.2)
+        # 예전 인스턴스가 아직 빌려 가 있으므로 다시 로드하지 않고 기다린다
+        assert t.is_alive()
+        first.accept_suggestion("d", "alpha")
+        manager.release("alice")
+        t.join(5)
+        assert reloaded and reloaded[0] is not first
+        assert reloaded[0].memory["accept_counts"].get("alpha") == 1
+        manager.release("alice")
+    finally:
+        manager.close()
+
+
+@pytest.fixture
+def busy_switching():
+    # 스레드 전환을 잦게 해서 사전 순회 도중 끼어들 틈을 만든다
+    old = sys.getswitchinterval()
+    sys.setswitchinterval(1e-6)
+    yield
+    sys.setswitchinterval(old)
+
+
+def test_footprint_while_another_thread_writes(tmp_path, busy_switching):
+    manager = app.BrainManager(str(tmp_path), flush_interval=0.01)
+    errors = []
+    stop = threading.Event()
+
+    def write():
+        with manager.lease("alice") as brain:
+            i = 0
+            while not stop.is_set():
+                brain.observe_text_incremental(f"d{i}", f"alpha{i} beta{i} gamma")
+                brain.accept_suggestion(f"d{i}", "gamma")
+                i += 1
+
+    def watch():
+        try:
+            deadline = time.time() + 1.5
+            while time.time() < deadline:
+                manager.stats()
+        except Exception as e:
+            errors.append(e)
+
+    writer = threading.Thread(target=write)
+    writer.start()
+    try:
+        watchers = [threading.Thread(target=watch) for _ in range(2)]
+        for t in watchers:
+            t.start()
+        for t in watchers:
+            t.join(30)
+    finally:
+        stop.set()
+        writer.join(30)
+    try:
+        assert not errors
+        assert manager.stats()["memory_bytes"] > 0
+    finally:
+        manager.close()
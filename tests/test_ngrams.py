@@ -0,0 +1,55 @@
+import random
+
+import app
+
+
+def _random_rows(rnd, words, n):
+    rows = []
+    for _ in range(n):
+        ctx = [rnd.choice(words) for _ in range(rnd.choice([1, 2]))]
+        rows.append([*ctx, rnd.choice(words), rnd.choice([1, 1, 2, 3, -1, -2])])
+    return rows
+
+
+def test_add_many_matches_sequential_add():
+    rnd = random.Random(1)
+    words = [f"w{i}" for i in range(50)]
+    one, many = app.NgramTable(10**6), app.NgramTable(10**6)
+    for _ in range(30):
+        rows = _random_rows(rnd, words, rnd.randint(1, 80))
+        for row in rows:
+            one.add(tuple(row[:-2]), row[-2], row[-1])
+        many.add_many(rows)
+        assert sorted(one.items()) == sorted(many.items())
+        assert len(one) == len(many)
+    for w in words:
+        succ, total = many.successors((w,))
+        assert total == sum(c for _, c in succ)
+
+
+def test_view_is_stable_while_table_changes():
+    rnd = random.Random(2)
+    words = [f"w{i}" for i in range(30)]
+    ctxs = [(w,) for w in words] + [(a, b) for a in words[:5] for b in words[:5]]
+    table = app.NgramTable(300)  # 가지치기와 재배치도 거치게
+    for _ in range(20):
+        view = table.view()
+        before = [sorted(view.successors(c)[0]) for c in ctxs]
+        table.add_many(_random_rows(rnd, words, 60))
+        assert [sorted(view.successors(c)[0]) for c in ctxs] == before
+
+
+def test_bulk_observe_learns_same_ngrams_as_observe():
+    docs = list(app._zipf_docs(40, 1.0, 300, seed=4))
+    bulk = app._scratch_brain(write_behind=True, flush_interval=3600)
+    one = app._scratch_brain(write_behind=True, flush_interval=3600)
+    # 이미 있는 문서는 bulk 가 n-gram 을 다시 배우지 않는다 (그 샤드는 새 문서 몫만 합친다)
+    bulk.observe_text_incremental(*docs[3])
+    bulk.bulk_observe(docs, shard_size=8)
+    for doc_id, text in docs:
+        one.observe_text_incremental(doc_id, text)
+    try:
+        assert sorted(bulk.memory["ngrams"].items()) == sorted(one.memory["ngrams"].items())
+    finally:
+        bulk.close()
+        one.close()
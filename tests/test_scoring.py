@@ -0,0 +1,53 @@
+import random
+import string
+
+import pytest
+
+import app
+
+
+@pytest.mark.skipif(app.np is None, reason="numpy not installed")
+@pytest.mark.parametrize("mode", ["tf", "tfidf", "bm25"])
+def test_batch_scores_match_score_word(mode):
+    rnd = random.Random(3)
+    vocab = list({"".join(rnd.choice("abcdef") for _ in range(rnd.randint(3, 8))) for _ in range(1500)})
+    brain = app._scratch_brain(user_dict_cap=100_000, context_mode=mode)
+    for i in range(20):
+        brain.observe_text_incremental(f"d{i}", " ".join(rnd.choice(vocab) for _ in range(rnd.randint(0, 400))))
+    for _ in range(300):
+        brain._commit({"op": "accept", "doc": f"d{rnd.randrange(20)}", "w": rnd.choice(vocab),
+                       "ts": app.now_ms() - rnd.randrange(10**10)})
+    now = app.now_ms()
+    words = vocab + ["unknownxyz"]
+    for doc_id in ("d1", "d5", "nope", None):
+        got = brain._score_batch(words, doc_id, now)
+        expected = [brain._score_word(w, doc_id, now) for w in words]
+        assert all(abs(x - y) <= 1e-9 * max(1, abs(y)) for x, y in zip(got, expected))
+    brain.close()
+
+
+def test_top_k_matches_full_sort_as_time_passes(monkeypatch):
+    rnd = random.Random(7)
+    brain = app._scratch_brain(user_dict_cap=100_000)
+    vocab = sorted({"".join(rnd.choice("abcd") for _ in range(rnd.randint(3, 7))) for _ in range(800)})
+    brain.memory["user_dict"]["en"] = vocab
+    brain.rebuild_index()
+    base = app.now_ms()
+    for i in range(1500):
+        ts = base - rnd.randrange(400 * 86_400_000)
+        monkeypatch.setattr(app, "now_ms", lambda ts=ts: ts)
+        brain.accept_suggestion(f"d{i % 3}", rnd.choice(vocab))
+    # 로그 공간 점수는 시각이 흘러도 다시 계산하지 않는다 — 나중 시각에도 전체 정렬과 같아야 한다
+    for days in (0, 30, 400):
+        now = base + days * 86_400_000
+        monkeypatch.setattr(app, "now_ms", lambda now=now: now)
+        for prefix in ("a", "ab", "abc", "b", "dd"):
+            for doc_id in (None, "d1"):
+                got = brain.get_suggestions_scored(prefix, doc_id, 12)
+                full = sorted(
+                    (-brain._score_word(w, doc_id, now), w)
+                    for w in brain._candidate_pool("en") if w.startswith(prefix)
+                )[:12]
+                assert [w for w, _ in got] == [w for _, w in full]
+                assert all(abs(s + f[0]) < 1e-9 * max(1, abs(f[0])) for (_, s), f in zip(got, full))
+    brain.close()
@@ -0,0 +1,129 @@
+import os
+import shutil
+import signal
+import subprocess
+import sys
+import textwrap
+import time
+
+import pytest
+
+import app
+
+pytestmark = pytest.mark.skipif(app.fcntl is None, reason="shared mode needs fcntl")
+
+ROOT = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+
+HUB = textwrap.dedent("""
+    import sys, time
+    sys.path.insert(0, {root!r})
+    import app
+    manager = app.SharedBrainManager({brains!r}, publish_interval=0.01)
+    assert manager.hub is not None
+    print("ready", flush=True)
+    time.sleep(120)
+""")
+
+
+def _call(fn, *args):
+    # 허브가 처리 도중 죽으면 한 번은 ConnectionError (반영 여부를 모름) — 다시 보낸다
+    try:
+        return fn(*args)
+    except ConnectionError:
+        return fn(*args)
+
+
+def test_worker_takes_over_when_hub_dies(tmp_path):
+    brains = str(tmp_path / "brains")
+    hub = subprocess.Popen(
+        [sys.executable, "-c", HUB.format(root=ROOT, brains=brains)],
+        stdout=subprocess.PIPE, text=True,
+    )
+    manager = None
+    try:
+        assert hub.stdout.readline().strip() == "ready"
+        manager = app.SharedBrainManager(brains, publish_interval=0.01)
+        assert manager.hub is None
+        with manager.lease("u1") as client:
+            client.observe_text_incremental("d1", "analysis analysis model zebraword zebraword")
+            client.accept_suggestion("d1", "zebraword")
+        manager.flush_all()
+
+        hub.send_signal(signal.SIGKILL)
+        hub.wait(10)
+
+        # 다음 요청에서 잠금이 풀린 것을 보고 이 워커가 허브를 이어받는다
+        with manager.lease("u1") as client:
+            _call(client.accept_suggestion, "d1", "analysis")
+            assert manager.hub is not None
+            deadline = time.time() + 5
+            while time.time() < deadline and not client.get_suggestions("zebra", "d1", 5):
+                time.sleep(0.02)
+            assert client.get_suggestions("zebra", "d1", 5) == ["zebraword"]
+        with manager.hub.manager.lease("u1") as brain:
+            assert brain.memory["accept_counts"].get("zebraword") == 1
+            assert brain.memory["accept_counts"].get("analysis") == 1
+    finally:
+        if hub.poll() is None:
+            hub.kill()
+        if manager is not None:
+            manager.close()
+            shutil.rmtree(manager.run_dir, ignore_errors=True)
+
+
+def test_refuses_run_dir_it_does_not_own_privately(tmp_path, monkeypatch):
+    monkeypatch.setenv("XDG_RUNTIME_DIR", str(tmp_path / "run"))
+    os.mkdir(tmp_path / "run", 0o700)
+    brains = str(tmp_path / "brains")
+    run_dir = app._private_run_dir(brains)
+    assert run_dir.startswith(str(tmp_path / "run"))
+
+    # 남이 미리 만든 것처럼 열린 권한의 디렉터리
+    os.mkdir(run_dir)
+    os.chmod(run_dir, 0o755)
+    with pytest.raises(RuntimeError):
+        app.SharedBrainManager(brains)
+    os.rmdir(run_dir)
+
+    # 심볼릭 링크
+    os.mkdir(tmp_path / "elsewhere", 0o700)
+    os.symlink(tmp_path / "elsewhere", run_dir)
+    with pytest.raises(RuntimeError):
+        app.SharedBrainManager(brains)
+    os.unlink(run_dir)
+
+    # 읽기 권한이 열린 키 파일
+    os.mkdir(run_dir, 0o700)
+    key = os.path.join(run_dir, "hub.key")
+    with open(key, "wb") as f:
+        f.write(b"x" * 32)
+    os.chmod(key, 0o644)
+    with pytest.raises(RuntimeError):
+        app.SharedBrainManager(brains)
+
+
+def test_restarted_hub_does_not_serve_images_from_before_an_outside_write(tmp_path):
+    brains = str(tmp_path / "brains")
+    manager = app.SharedBrainManager(brains, publish_interval=0.01)
+    run_dir = manager.run_dir
+    try:
+        with manager.lease("u1") as client:
+            client.observe_text_incremental("d1", "note note")
+            deadline = time.time() + 5
+            while time.time() < deadline and not client.get_suggestions("n", "d1", 5):
+                time.sleep(0.02)
+            assert client.get_suggestions("n", "d1", 5) == ["note"]
+        manager.close()
+
+        # 공유 모드 밖에서 같은 저장소에 쓴다
+        plain = app.BrainManager(brains)
+        with plain.lease("u1") as brain:
+            brain.observe_text_incremental("d1", "note note newword newword newword")
+        plain.close()
+
+        manager = app.SharedBrainManager(brains, publish_interval=0.01)
+        with manager.lease("u1") as client:
+            assert client.get_suggestions("n", "d1", 5) == ["newword", "note"]
+    finally:
+        manager.close()
+        shutil.rmtree(run_dir, ignore_errors=True)
@@ -0,0 +1,74 @@
+import os
+
+import pytest
+
+import app
+
+
+def _fill(brain):
+    brain.observe_text_incremental("d1", "analysis analysis model modal 자율주행 자율주행")
+    brain.observe_text_incremental("d2", "benchmark bench alpha alpha")
+    brain.accept_suggestion("d1", "analysis", prev="model")
+
+
+def test_flush_writes_json_only_and_close_writes_image(tmp_path):
+    path = str(tmp_path / "b.json")
+    brain = app.ThinkHelperBrain(path, write_behind=True, flush_interval=3600, mmap_snapshot=True)
+    _fill(brain)
+    brain.flush()
+    assert os.path.exists(path) and not os.path.exists(path + ".img")
+    brain.close()
+    assert os.path.exists(path + ".img")
+
+    brain = app.ThinkHelperBrain(path, write_behind=True, flush_interval=3600, mmap_snapshot=True)
+    assert brain._memory is None  # 이미지로 시작
+    img_stat = os.stat(path + ".img")
+    brain.accept_suggestion("d2", "alpha")
+    brain.flush()
+    assert os.stat(path + ".img").st_mtime_ns == img_stat.st_mtime_ns
+    brain.close()
+    # 닫을 때 다시 써서 짝이 맞는다
+    brain = app.ThinkHelperBrain(path, mmap_snapshot=True)
+    assert brain._memory is None
+    assert brain.memory["accept_counts"].get("alpha") == 1
+    brain.close()
+
+
+@pytest.mark.parametrize("wal", [False, True])
+def test_stale_image_falls_back_to_json(tmp_path, wal):
+    path = str(tmp_path / "b.json")
+    brain = app.ThinkHelperBrain(path, wal=wal, mmap_snapshot=True)
+    _fill(brain)
+    brain.close()
+    expected = brain.get_suggestions("an", "d1")
+
+    image = app.ThinkHelperBrain(path, wal=wal, mmap_snapshot=True)
+    assert image._memory is None and isinstance(image._view, app.ImageView)
+    assert image.get_suggestions("an", "d1") == expected
+    image.close()
+
+    # 이미지 없이 JSON 만 다시 쓰면 스탬프(크기, mtime)가 어긋나 이미지를 버린다
+    plain = app.ThinkHelperBrain(path, wal=wal)
+    plain.accept_suggestion("d1", "model")
+    plain.close()
+    reloaded = app.ThinkHelperBrain(path, wal=wal, mmap_snapshot=True)
+    assert reloaded._memory is not None
+    assert reloaded.memory["accept_counts"].get("model") == 1
+    reloaded.close()
+
+
+def test_wal_tail_invalidates_image(tmp_path):
+    path = str(tmp_path / "b.json")
+    brain = app.ThinkHelperBrain(path, wal=True, mmap_snapshot=True)
+    _fill(brain)
+    brain.close()
+    brain = app.ThinkHelperBrain(path, wal=True, mmap_snapshot=True)
+    brain.accept_suggestion("d1", "bench")
+    brain.flush()
+    # 압축 없이 죽은 것처럼: 로그 꼬리가 남는다
+    brain.storage.close()
+    brain._closed = True
+    reloaded = app.ThinkHelperBrain(path, wal=True, mmap_snapshot=True)
+    assert reloaded._memory is not None
+    assert reloaded.memory["accept_counts"].get("bench") == 1
+    reloaded.close()
@@ -0,0 +1,140 @@
+import itertools
+import json
+import random
+
+import pytest
+
+import app
+
+WORDS = ["alpha", "beta", "gamma", "delta", "자율주행", "센서", "데이터를", "분석"]
+DOCS = [f"d{i}" for i in range(12)]
+
+
+def _ops(brain, monkeypatch, seed=1):
+    # 두 브레인의 수락 시각이 같도록 같은 시계로
+    ticks = itertools.count(1_700_000_000_000, 1000)
+    monkeypatch.setattr(app, "now_ms", lambda: next(ticks))
+    rnd = random.Random(seed)
+    for i in range(200):
+        doc = DOCS[i % len(DOCS)]
+        r = rnd.random()
+        if r < 0.4:
+            brain.observe_text_incremental(doc, " ".join(rnd.choice(WORDS) for _ in range(rnd.randint(0, 30))))
+        elif r < 0.6:
+            if not brain.observe_text_delta(doc, 0, 0, rnd.choice(WORDS) + " "):
+                brain.observe_text_incremental(doc, "alpha alpha")
+        else:
+            brain.accept_suggestion(doc, rnd.choice(WORDS), prev=rnd.choice(WORDS))
+
+
+def _state(brain):
+    # lazy_docs 백엔드는 문서를 하나씩 올려 가며 읽는다 (올린 것은 도중에 내려갈 수 있다)
+    docs = {}
+    for doc_id in DOCS:
+        brain._ensure_doc(doc_id)
+        mem = brain.memory
+        tf = mem["doc_freq"].get(doc_id)
+        rec = mem["per_doc_accept"].get(doc_id)
+        docs[doc_id] = (
+            dict(tf.items()) if tf else {},
+            {k: dict(v.items()) for k, v in rec.items()} if rec else {},
+        )
+    mem = brain.memory
+    return (
+        docs,
+        dict(mem["accept_counts"].items()),
+        dict(mem["last_used_at"].items()),
+        {lang: sorted(words) for lang, words in mem["user_dict"].items()},
+        dict(mem["corpus"]["df"].items()),
+        mem["corpus"]["n_docs"],
+        mem["corpus"]["n_tokens"],
+        sorted(mem["ngrams"].items()),
+    )
+
+
+def test_sqlite_reload_matches_json(tmp_path, monkeypatch):
+    json_brain = app.ThinkHelperBrain(str(tmp_path / "brain.json"))
+    _ops(json_brain, monkeypatch)
+    json_brain.close()
+
+    sqlite_path = str(tmp_path / "brain.sqlite3")
+    sqlite_brain = app.ThinkHelperBrain(storage=app.SqliteStorage(sqlite_path))
+    # 문서가 쓰는 도중에도 내려갔다 다시 올라오게
+    sqlite_brain.max_loaded_docs = 3
+    _ops(sqlite_brain, monkeypatch)
+    live = _state(sqlite_brain)
+    sqlite_brain.close()
+
+    json_reloaded = app.ThinkHelperBrain(str(tmp_path / "brain.json"))
+    sqlite_reloaded = app.ThinkHelperBrain(storage=app.SqliteStorage(sqlite_path))
+    sqlite_reloaded.max_loaded_docs = 3
+    try:
+        # 시작 시에는 문서별 데이터를 올리지 않는다
+        assert not sqlite_reloaded.memory["doc_freq"]
+        expected = _state(json_reloaded)
+        assert live == expected
+        assert _state(sqlite_reloaded) == expected
+        # 다시 올린 문서로 추천도 같다
+        for doc_id in ("d0", "d5"):
+            for prefix in ("a", "자", "ㄷ"):
+                assert sqlite_reloaded.get_suggestions(prefix, doc_id, 5) == json_reloaded.get_suggestions(prefix, doc_id, 5)
+    finally:
+        json_reloaded.close()
+        sqlite_reloaded.close()
+
+
+@pytest.mark.parametrize("compression", [None, "gzip", "zstd"])
+@pytest.mark.parametrize("fast_json", [False, True])
+def test_snapshot_formats_round_trip(tmp_path, monkeypatch, fast_json, compression):
+    if fast_json and app.orjson is None:
+        pytest.skip("orjson not installed")
+    if compression == "zstd" and app.zstandard is None:
+        pytest.skip("zstandard not installed")
+    path = str(tmp_path / "brain.json")
+    brain = app.ThinkHelperBrain(storage=app.JsonStorage(path, compression=compression, fast_json=fast_json))
+    _ops(brain, monkeypatch)
+    expected = _state(brain)
+    brain.close()
+    with open(path, "rb") as f:
+        head = f.read(4)
+    magic = {None: b"{", "gzip": app._GZIP_MAGIC, "zstd": app._ZSTD_MAGIC}[compression]
+    assert head.startswith(magic)
+    # 읽는 쪽 설정과 무관하게 형식은 파일에서 알아낸다
+    for reader_fast in (False, True):
+        reloaded = app.ThinkHelperBrain(storage=app.JsonStorage(path, fast_json=reader_fast))
+        try:
+            assert _state(reloaded) == expected
+        finally:
+            reloaded.close()
+
+
+def test_old_pretty_snapshot_still_loads(tmp_path):
+    # 처음 버전이 쓰던 파일: indent=2 JSON, 문서 TF 는 평범한 dict, 코퍼스 통계/n-gram/wal_seq 없음
+    path = tmp_path / "brain_data.json"
+    old = {
+        "accept_counts": {"analysis": 3, "자율주행": 2},
+        "last_used_at": {"analysis": 1_700_000_000_000, "자율주행": 1_700_000_100_000},
+        "doc_freq": {"d1": {"analysis": 2, "자율주행": 4}, "d2": {"analysis": 1, "pipeline": 2}},
+        "user_dict": {"ko": ["자율주행"], "en": ["analysis", "pipeline"]},
+    }
+    path.write_text(json.dumps(old, ensure_ascii=False, indent=2), encoding="utf-8")
+    brain = app.ThinkHelperBrain(str(path))
+    try:
+        mem = brain.memory
+        assert dict(mem["doc_freq"]["d1"].items()) == old["doc_freq"]["d1"]
+        assert dict(mem["accept_counts"].items()) == old["accept_counts"]
+        # 코퍼스 통계는 문서 TF 에서 다시 만든다
+        assert dict(mem["corpus"]["df"].items()) == {"analysis": 2, "자율주행": 1, "pipeline": 1}
+        assert mem["corpus"]["n_docs"] == 2 and mem["corpus"]["n_tokens"] == 9
+        assert brain.get_suggestions("ㅈㅇ", "d1", 3) == ["자율주행"]
+        assert brain.get_suggestions("pip", "d2", 3) == ["pipeline"]
+        brain.accept_suggestion("d1", "analysis")
+    finally:
+        brain.close()
+    # 다시 쓰면 새 형식(compact)으로
+    assert not path.read_text(encoding="utf-8").startswith("{\n")
+    reloaded = app.ThinkHelperBrain(str(path))
+    try:
+        assert reloaded.memory["accept_counts"]["analysis"] == 4
+    finally:
+        reloaded.close()
@@ -0,0 +1,66 @@
+import random
+
+import pytest
+
+import app
+
+
+def _osa(a, b):
+    # 참고용 OSA 거리 (Levenshtein + 인접 전치) — 전체 DP
+    d = [[0] * (len(b) + 1) for _ in range(len(a) + 1)]
+    for i in range(len(a) + 1):
+        d[i][0] = i
+    for j in range(len(b) + 1):
+        d[0][j] = j
+    for i in range(1, len(a) + 1):
+        for j in range(1, len(b) + 1):
+            d[i][j] = min(d[i - 1][j] + 1, d[i][j - 1] + 1, d[i - 1][j - 1] + (a[i - 1] != b[j - 1]))
+            if i > 1 and j > 1 and a[i - 1] == b[j - 2] and a[i - 2] == b[j - 1]:
+                d[i][j] = min(d[i][j], d[i - 2][j - 2] + 1)
+    return d[len(a)][len(b)]
+
+
+@pytest.fixture
+def brain():
+    brain = app._scratch_brain()
+    yield brain
+    brain.close()
+
+
+def test_typo_prefix_completes_only_with_fuzzy(brain):
+    brain.observe_text_incremental("d1", "anlage anlage")
+    assert "analysis" not in brain.get_suggestions("anl", "d1", 5)
+    got = brain.get_suggestions("anl", "d1", 5, fuzzy=1)
+    # 정확히 맞는 접두사가 먼저, 오타 하나짜리가 그 뒤
+    assert got[0] == "anlage" and "analysis" in got
+    assert brain.get_suggestions("qzx", None, 5, fuzzy=1) == []
+
+
+@pytest.mark.parametrize("max_edits", [1, 2])
+def test_fuzzy_prefix_distance_matches_brute_force(max_edits):
+    rnd = random.Random(max_edits)
+    words = {"".join(rnd.choice("abcde") for _ in range(rnd.randint(1, 7))) for _ in range(400)}
+    trie = app.PrefixTrie()
+    for w in words:
+        trie.add(w)
+    for _ in range(40):
+        query = "".join(rnd.choice("abcde") for _ in range(rnd.randint(3, 5)))
+        dist, _ = app._fuzzy_prefix_nodes(trie, query, max_edits, budget=10**7)
+        for w in words:
+            best = min(_osa(query, w[:i]) for i in range(len(w) + 1))
+            expected = best if best <= max_edits else None
+            assert app._path_distance(trie, w, dist) == expected, (query, w)
+
+
+def test_choseong_query_matches(brain):
+    brain.observe_text_incremental("d1", "자율주행 자율주행 자유 자유")
+    assert "자율주행" in brain.get_suggestions("ㅈㅇ", "d1", 5)
+    assert brain.get_suggestions("ㅈㅇㅈㅎ", "d1", 5) == ["자율주행"]
+    assert "자율주행" not in brain.get_suggestions("ㅈㅎ", "d1", 5)
+
+
+@pytest.mark.parametrize("typed", ["ㅈ", "자", "장", "자유", "자율", "자율ㅈ", "자율주", "자율줗"])
+def test_mid_syllable_prefix_matches(brain, typed):
+    # 두벌식으로 자율주행을 치는 중간 상태들 (장 = ㅈㅏㅇ → 모음이 오면 자유, 줗 = ㅈㅜㅎ → 주행)
+    brain.observe_text_incremental("d1", "자율주행 자율주행")
+    assert "자율주행" in brain.get_suggestions(typed, "d1", 8)
@@ -0,0 +1,29 @@
+import app
+
+
+def test_user_dict_takes_frequent_words_up_to_the_cap(tmp_path):
+    path = str(tmp_path / "brain.json")
+    brain = app.ThinkHelperBrain(path, user_dict_cap=3)
+    brain.observe_text_incremental("d1", "alpha alpha alpha beta beta gamma")
+    assert sorted(brain.memory["user_dict"]["en"]) == ["alpha", "beta"]
+    # 자리는 하나 — 많이 나온 것이 들어간다
+    brain.observe_text_incremental("d2", "delta delta epsilon epsilon epsilon")
+    assert sorted(brain.memory["user_dict"]["en"]) == ["alpha", "beta", "epsilon"]
+    brain.observe_text_incremental("d3", "zeta zeta zeta zeta")
+    assert "zeta" not in brain.memory["user_dict"]["en"]
+    brain.close()
+
+    # 캡을 낮춰 다시 열면 오래된 것부터 빠지고, 빠진 단어는 자리가 나면 다시 들어올 수 있다
+    brain = app.ThinkHelperBrain(path, user_dict_cap=2)
+    brain.observe_text_incremental("d4", "zeta zeta")
+    assert brain.memory["user_dict"]["en"] == ["beta", "epsilon"]
+    assert "alpha" not in brain.get_suggestions("alp", "d4", 5)
+    brain.user_dict_caps["en"] = 3
+    brain.observe_text_incremental("d5", "alpha alpha")
+    assert brain.memory["user_dict"]["en"] == ["beta", "epsilon", "alpha"]
+    assert "alpha" in brain.get_suggestions("alp", "d5", 5)
+    brain.close()
+
+    reloaded = app.ThinkHelperBrain(path, user_dict_cap=3)
+    assert reloaded.memory["user_dict"]["en"] == ["beta", "epsilon", "alpha"]
+    reloaded.close()
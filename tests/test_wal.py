@@ -0,0 +1,110 @@
+import os
+import random
+import sqlite3
+import time
+
+import app
+
+WORDS = ["alpha", "beta", "gamma", "delta", "가나다", "라마바", "사아자"]
+
+
+def _ops(brain, seed=5):
+    rnd = random.Random(seed)
+    for i in range(300):
+        doc = f"d{i % 5}"
+        r = rnd.random()
+        if r < 0.4:
+            brain.observe_text_incremental(doc, " ".join(rnd.choice(WORDS) for _ in range(rnd.randint(0, 30))))
+        elif r < 0.7:
+            if not brain.observe_text_delta(doc, 0, 0, rnd.choice(WORDS) + " "):
+                brain.observe_text_incremental(doc, "x")
+        else:
+            brain.accept_suggestion(doc, rnd.choice(WORDS), prev=rnd.choice(WORDS))
+
+
+def _crash(brain):
+    # 압축(스냅샷 접기) 없이 프로세스가 죽은 것처럼
+    brain.flush()
+    brain.storage.close()
+    brain._closed = True
+
+
+def _assert_same(a, b):
+    ma, mb = a.memory, b.memory
+    assert ma["doc_freq"] == mb["doc_freq"]
+    assert dict(ma["accept_counts"].items()) == dict(mb["accept_counts"].items())
+    assert {l: sorted(x) for l, x in ma["user_dict"].items()} == {l: sorted(x) for l, x in mb["user_dict"].items()}
+    assert sorted(ma["ngrams"].items()) == sorted(mb["ngrams"].items())
+    assert ma["corpus"]["n_docs"] == mb["corpus"]["n_docs"]
+    assert ma["corpus"]["n_tokens"] == mb["corpus"]["n_tokens"]
+
+
+def test_torn_tail_is_dropped_and_trimmed(tmp_path):
+    ref = app.ThinkHelperBrain(str(tmp_path / "ref.json"))
+    _ops(ref)
+    path = str(tmp_path / "wal.json")
+    brain = app.ThinkHelperBrain(path, wal=True, wal_compact_bytes=3000, flush_interval=0.01)
+    _ops(brain)
+    _crash(brain)
+    with open(path + ".wal", "a", encoding="utf-8") as f:
+        f.write('{"seq":99999,"op":"acc')
+
+    reloaded = app.ThinkHelperBrain(path, wal=True)
+    _assert_same(reloaded, ref)
+    with open(path + ".wal", "rb") as f:
+        data = f.read()
+    assert not data or data.endswith(b"\n")
+    reloaded.accept_suggestion("d0", "alpha")
+    reloaded.close()
+    assert app.ThinkHelperBrain(path, wal=True).memory["accept_counts"]["alpha"] == (
+        ref.memory["accept_counts"]["alpha"] + 1)
+    ref.close()
+
+
+def test_rotated_segment_is_replayed_before_the_live_log(tmp_path):
+    ref = app.ThinkHelperBrain(str(tmp_path / "ref.json"))
+    _ops(ref)
+    _ops(ref, seed=6)
+    path = str(tmp_path / "wal.json")
+    brain = app.ThinkHelperBrain(path, wal=True, wal_compact_bytes=1 << 30)
+    _ops(brain)
+    # 로그를 조각으로 떼어낸 직후(스냅샷을 쓰기 전)에 죽고, 새 로그에도 레코드가 있다
+    with brain._lock:
+        segment = brain.storage.begin_save(brain.memory)[1]
+    assert segment and os.path.exists(segment)
+    _ops(brain, seed=6)
+    _crash(brain)
+
+    reloaded = app.ThinkHelperBrain(path, wal=True)
+    _assert_same(reloaded, ref)
+    reloaded.close()
+    # close 가 스냅샷으로 접었으므로 조각은 사라지고 다음 시작은 재생이 없다
+    assert not os.path.exists(segment)
+    again = app.ThinkHelperBrain(path, wal=True)
+    assert again.storage.log_bytes == 0
+    _assert_same(again, ref)
+    again.close()
+    ref.close()
+
+
+def test_flusher_survives_a_failed_compaction(tmp_path):
+    path = str(tmp_path / "wal.json")
+    brain = app.ThinkHelperBrain(path, wal=True, wal_compact_bytes=3000, flush_interval=0.01)
+    save_memory = brain.save_memory
+    failures = []
+
+    def flaky_save(*args, **kwargs):
+        if not failures:
+            failures.append(1)
+            raise sqlite3.OperationalError("database is locked")
+        return save_memory(*args, **kwargs)
+
+    brain.save_memory = flaky_save
+    _ops(brain)
+    deadline = time.time() + 5
+    while time.time() < deadline and brain.storage.needs_compaction():
+        time.sleep(0.02)
+    # 첫 압축은 실패했지만 flusher 는 살아 있고 다음 주기에 접었다
+    assert failures and brain._flusher.is_alive()
+    assert not brain.storage.needs_compaction()
+    brain.close()